@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+from pathlib import Path
+
+"""
+Takes care of the aggregate store, the answer counts of every survey that was generated.
+
+Each survey has its own aggregate in <data_root>/AppData/Aggregates/<survey_id>.json,
+written at the end of every run from the same answer counts the charts are drawn from:
+    
+    { "version" : AGGREGATE_VERSION,
+      "survey id" : "2020-01",
+      "survey file" : { "name" : "2020-01.parquet", "size" : 12345, "mtime" : 1600000000000000000 },
+      "columns" : [ "AREA", "AAA", "AAB", ... ],
+      "respondents" : 120,
+      "area respondents" : { "IT" : 20, "HR" : 15, ... },
+      "questions" : { "AAA" : { "global" : { "Molto" : 50, "Poco" : 70 },
+                                "areas" : { "IT" : { "Molto" : 12, "Poco" : 8 }, ... } },
+                      ... } }
+
+The counts leave out the answers nobody gave. "survey file" describes the processed survey
+in <data_root>/Surveys the counts were made from, an aggregate whose survey file changed
+since is out of date. "columns" are the columns of that file, a question that is among
+them but not in "questions" simply wasn't counted yet.
+
+The custom charts of the past surveys read the aggregates instead of the surveys, which
+takes a few small reads however many surveys are compared.
+
+The aggregates are indexed by question id in <data_root>/AppData/Aggregates/index.json,
+so the history of the answers to a question only reads the surveys it was asked in,
+see get_question_trend:
+    
+    { "version" : AGGREGATE_VERSION,
+      "surveys" : { "2020-01" : { "size" : 4567, "mtime" : 1600000000000000000 }, ... },
+      "questions" : { "AAA" : [ "2019-03", "2020-01" ], ... } }
+
+"surveys" describes the aggregate files the index was made from, the index is made
+again from the aggregates whenever they don't match.
+
+"""
+
+# The relative path to the aggregate store from the data root
+AGGREGATES_FROM_ROOT = Path('AppData/Aggregates')
+
+# The relative path to the index of the aggregate store from the data root
+AGGREGATE_INDEX_FROM_ROOT = AGGREGATES_FROM_ROOT / 'index.json'
+
+# The version of the aggregate format, aggregates of other versions are made again
+AGGREGATE_VERSION = 1
+
+def get_aggregate_path(data_root, survey_id):
+    
+    """
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    survey_id : String
+        The id of a survey
+    
+    Returns
+    -------
+    aggregate_path : pathlib.Path object
+        Where the aggregate of the survey is kept
+    """
+    
+    return Path(data_root) / AGGREGATES_FROM_ROOT / (survey_id + ".json")
+
+def get_survey_stamp(survey_path):
+    
+    """
+    Describes a processed survey file by its name, size and modification time,
+    any change to the file changes its stamp
+    
+    Parameters
+    ----------
+    survey_path : pathlib.Path object
+        The processed survey in <data_root>/Surveys
+    
+    Returns
+    -------
+    stamp : Dictionary
+        { "name", "size", "mtime" }
+    
+    """
+    
+    stat = survey_path.stat()
+    
+    return { "name" : survey_path.name, "size" : stat.st_size, "mtime" : stat.st_mtime_ns }
+
+def build_aggregate(survey_id, answer_counts, survey_path, columns, previous=None):
+    
+    """
+    Turns the answer counts of a survey into its aggregate. The questions of a previous
+    aggregate made from the same survey file are kept if they weren't counted again.
+    
+    Parameters
+    ----------
+    survey_id : String
+        The id of the survey
+    answer_counts : Dictionary
+        The answer counts of the survey, see generate.build_answer_counts
+    survey_path : pathlib.Path object
+        The processed survey in <data_root>/Surveys the answers were counted from
+    columns : List
+        The columns of the processed survey
+    previous : Dictionary, optional
+        The aggregate of the survey loaded by load_aggregate. The default is None.
+    
+    Returns
+    -------
+    aggregate : Dictionary
+        The aggregate of the survey, see above
+    
+    """
+    
+    stamp = get_survey_stamp(survey_path)
+    choices = answer_counts["choices"]
+    areas = list(answer_counts["areas"])
+    
+    def sparse(counts):
+        return { choices[k] : int(counts[k]) for k in counts.nonzero()[0] }
+    
+    questions = {}
+    if previous is not None and previous["survey file"] == stamp:
+        questions.update(previous["questions"])
+    
+    for question_id, j in answer_counts["questions"].items():
+        questions.update( { question_id : { "global" : sparse(answer_counts["global counts"][j]),
+                                            "areas" : { area : sparse(answer_counts["area counts"][i, j])
+                                                        for i, area in enumerate(areas) } } } )
+    
+    aggregate = { "version" : AGGREGATE_VERSION,
+                  "survey id" : survey_id,
+                  "survey file" : stamp,
+                  "columns" : [str(column) for column in columns],
+                  "respondents" : int(answer_counts["total"]),
+                  "area respondents" : { area : int(answer_counts["area totals"].get(area, 0)) for area in areas },
+                  "questions" : questions }
+    
+    return aggregate
+
+def save_aggregate(data_root, aggregate):
+    
+    """
+    Writes the aggregate of a survey into the aggregate store and updates the index.
+    The aggregate is first written into a temporary file which then replaces the old one,
+    so an interrupted write never leaves a truncated aggregate behind.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    aggregate : Dictionary
+        The aggregate, see build_aggregate
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    aggregate_path = get_aggregate_path(data_root, aggregate["survey id"])
+    aggregate_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = aggregate_path.with_name(aggregate_path.name + ".tmp")
+    
+    with open(temporary_path, "w", encoding="utf-8") as fd:
+        json.dump(aggregate, fd, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temporary_path, aggregate_path)
+    
+    index = read_aggregate_index(data_root)
+    if index is None:
+        load_aggregate_index(data_root)
+    else:
+        index_aggregate(index, aggregate["survey id"], get_file_stamp(aggregate_path), aggregate["questions"])
+        save_aggregate_index(data_root, index)
+    
+    return
+
+def load_aggregate(data_root, survey_id):
+    
+    """
+    Reads the aggregate of a survey from the aggregate store
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    survey_id : String
+        The id of the survey
+    
+    Returns
+    -------
+    aggregate : Dictionary or None
+        The aggregate, see build_aggregate, None if the survey has none
+        or it was written by another version of SurveyKN
+    
+    """
+    
+    try:
+        with open(get_aggregate_path(data_root, survey_id), "r", encoding="utf-8") as fd:
+            aggregate = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    
+    if not isinstance(aggregate, dict) or aggregate.get("version") != AGGREGATE_VERSION:
+        return None
+    
+    return aggregate
+
+def aggregate_to_answer_counts(aggregate, question_ids, config):
+    
+    """
+    Builds the answer counts of the given questions from the aggregate of a survey,
+    the same answer counts generate.build_answer_counts would make from the survey
+    itself. The aggregate must be up to date, see get_survey_stamp.
+    
+    Parameters
+    ----------
+    aggregate : Dictionary
+        The aggregate of the survey, see build_aggregate
+    question_ids : List
+        The question ids whose answers are needed, those that aren't
+        in the survey are ignored
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+    
+    Returns
+    -------
+    answer_counts : Dictionary or None
+        The answer counts of the survey, None if some of the questions weren't counted
+        yet or some of the answers aren't Available Choices anymore, the answers must
+        then be counted from the survey
+    
+    """
+    
+    import numpy as np
+    import pandas as pd
+    
+    columns = set(aggregate["columns"])
+    question_ids = [question_id for question_id in question_ids if question_id in columns]
+    if any(question_id not in aggregate["questions"] for question_id in question_ids):
+        return None
+    
+    choices = list(config['Available Choices'])
+    choice_codes = { choice : k for k, choice in enumerate(choices) }
+    areas = list(aggregate["area respondents"])
+    
+    area_counts = np.zeros((len(areas), len(question_ids), len(choices)), dtype=np.int64)
+    global_counts = np.zeros((len(question_ids), len(choices)), dtype=np.int64)
+    
+    def fill(counts, sparse_counts):
+        for choice, count in sparse_counts.items():
+            if choice not in choice_codes:
+                return False
+            counts[choice_codes[choice]] = count
+        return True
+    
+    for j, question_id in enumerate(question_ids):
+        question = aggregate["questions"][question_id]
+        if not fill(global_counts[j], question["global"]):
+            return None
+        for i, area in enumerate(areas):
+            if not fill(area_counts[i, j], question["areas"].get(area, {})):
+                return None
+    
+    answer_counts = { "choices" : choices,
+                      "areas" : { area : i for i, area in enumerate(areas) },
+                      "questions" : { question_id : j for j, question_id in enumerate(question_ids) },
+                      "area counts" : area_counts,
+                      "global counts" : global_counts,
+                      "area totals" : pd.Series(aggregate["area respondents"], dtype="int64"),
+                      "total" : aggregate["respondents"] }
+    
+    return answer_counts
+
+def get_file_stamp(path):
+    
+    """
+    Parameters
+    ----------
+    path : pathlib.Path object
+        A file
+    
+    Returns
+    -------
+    stamp : Dictionary
+        { "size", "mtime" } of the file
+    """
+    
+    stat = path.stat()
+    
+    return { "size" : stat.st_size, "mtime" : stat.st_mtime_ns }
+
+def index_aggregate(index, survey_id, stamp, question_ids):
+    
+    """
+    Puts the aggregate of a survey into the index, in place of the one it replaces
+    
+    Parameters
+    ----------
+    index : Dictionary
+        The index of the aggregate store, see above
+    survey_id : String
+        The id of the survey
+    stamp : Dictionary
+        The stamp of the aggregate file, see get_file_stamp
+    question_ids : Iterable
+        The questions counted in the aggregate
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    if survey_id in index["surveys"]:
+        for question_id in list(index["questions"]):
+            survey_ids = index["questions"][question_id]
+            if survey_id in survey_ids:
+                survey_ids.remove(survey_id)
+                if not survey_ids:
+                    del index["questions"][question_id]
+    
+    index["surveys"].update( { survey_id : stamp } )
+    for question_id in question_ids:
+        survey_ids = index["questions"].setdefault(question_id, [])
+        survey_ids.append(survey_id)
+        survey_ids.sort()
+    
+    return
+
+def read_aggregate_index(data_root):
+    
+    """
+    Reads the index of the aggregate store as it was written, see load_aggregate_index
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    
+    Returns
+    -------
+    index : Dictionary or None
+        The index, None if there's none or it was written by another version of SurveyKN
+    
+    """
+    
+    try:
+        with open(Path(data_root) / AGGREGATE_INDEX_FROM_ROOT, "r", encoding="utf-8") as fd:
+            index = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    
+    if not isinstance(index, dict) or index.get("version") != AGGREGATE_VERSION:
+        return None
+    
+    return index
+
+def save_aggregate_index(data_root, index):
+    
+    """
+    Writes the index of the aggregate store, through a temporary file like save_aggregate
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    index : Dictionary
+        The index, see above
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    index_path = Path(data_root) / AGGREGATE_INDEX_FROM_ROOT
+    temporary_path = index_path.with_name(index_path.name + ".tmp")
+    
+    with open(temporary_path, "w", encoding="utf-8") as fd:
+        json.dump(index, fd, ensure_ascii=False, separators=(",", ":"))
+    os.replace(temporary_path, index_path)
+    
+    return
+
+def load_aggregate_index(data_root):
+    
+    """
+    Reads the index of the aggregate store. If the aggregate files changed since the
+    index was written, i.e. they were copied, deleted or written by an interrupted run,
+    the index is made again from the aggregates and saved.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    
+    Returns
+    -------
+    index : Dictionary
+        The up to date index, see above
+    
+    """
+    
+    aggregates_path = Path(data_root) / AGGREGATES_FROM_ROOT
+    aggregate_files = {}
+    if aggregates_path.is_dir():
+        for aggregate_path in aggregates_path.glob("*.json"):
+            if aggregate_path.name != AGGREGATE_INDEX_FROM_ROOT.name:
+                aggregate_files.update( { aggregate_path.stem : get_file_stamp(aggregate_path) } )
+    
+    index = read_aggregate_index(data_root)
+    if index is not None and index["surveys"] == aggregate_files:
+        return index
+    
+    index = { "version" : AGGREGATE_VERSION, "surveys" : {}, "questions" : {} }
+    for survey_id in sorted(aggregate_files):
+        aggregate = load_aggregate(data_root, survey_id)
+        index_aggregate(index, survey_id, aggregate_files[survey_id], aggregate["questions"] if aggregate is not None else [])
+    
+    if aggregate_files:
+        save_aggregate_index(data_root, index)
+    
+    return index
+
+def get_question_trends(data_root, config, question_ids=None, area=None):
+    
+    """
+    Collects how the answers to the given questions evolved over the surveys, from
+    the aggregate store. Each aggregate is read once however many questions are asked
+    for, so the trends of every question in the store take a single call.
+    
+    Only the surveys whose aggregates are in the store are included, every survey
+    generated since the aggregate store exists has one, as do the past surveys
+    drawn in the custom charts since then.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    config : Dictionary
+        The config file, the answers are put in the order of its Available Choices
+    question_ids : List, optional
+        The question ids. The default is None, in which case every question
+        that was counted in some survey is included.
+    area : String, optional
+        The area whose answers are counted. The default is None, in which case
+        the answers of all of the respondents are counted.
+    
+    Returns
+    -------
+    trends : Dictionary
+        { question_id : Pandas.DataFrame }, one row per survey the question was asked in,
+        oldest first, one column per answer given in any of them, in the order of the
+        Available Choices followed by the answers that aren't among them anymore, and the
+        number of times the answer was given in the cells. Surveys that no member of the area took are
+        left out, a question that was never counted has an empty DataFrame.
+    
+    """
+    
+    import numpy as np
+    import pandas as pd
+    
+    choices = list(config['Available Choices'])
+    
+    index = load_aggregate_index(data_root)
+    if question_ids is None:
+        question_ids = list(index["questions"])
+    
+    survey_ids = sorted({ survey_id for question_id in question_ids for survey_id in index["questions"].get(question_id, []) })
+    aggregates = { survey_id : load_aggregate(data_root, survey_id) for survey_id in survey_ids }
+    
+    trends = {}
+    for question_id in question_ids:
+        rows = {}
+        for survey_id in index["questions"].get(question_id, []):
+            aggregate = aggregates[survey_id]
+            if aggregate is None or question_id not in aggregate["questions"]:
+                continue
+            if area is None:
+                rows.update( { survey_id : aggregate["questions"][question_id]["global"] } )
+            elif area in aggregate["area respondents"]:
+                rows.update( { survey_id : aggregate["questions"][question_id]["areas"].get(area, {}) } )
+        
+        # The answers follow the Available Choices, the answers of older surveys that
+        # were since dropped from the choices come last, in the order they first appear in
+        given_answers = list(dict.fromkeys(answer for counts in rows.values() for answer in counts))
+        answers = [answer for answer in choices if answer in given_answers]
+        answers.extend(answer for answer in given_answers if answer not in choices)
+        answer_codes = { answer : k for k, answer in enumerate(answers) }
+        matrix = np.zeros((len(rows), len(answers)), dtype=np.int64)
+        for i, counts in enumerate(rows.values()):
+            for answer, count in counts.items():
+                matrix[i, answer_codes[answer]] = count
+        
+        trend = pd.DataFrame(matrix, index=pd.Index(list(rows), name="survey"), columns=pd.Index(answers, name="answer"))
+        trends.update( { question_id : trend } )
+    
+    return trends
+
+def get_question_trend(data_root, question_id, config, area=None):
+    
+    """
+    Collects how the answers to a question evolved over the surveys, see get_question_trends
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    question_id : String
+        The question id
+    config : Dictionary
+        The config file, the answers are put in the order of its Available Choices
+    area : String, optional
+        The area whose answers are counted. The default is None, in which case
+        the answers of all of the respondents are counted.
+    
+    Returns
+    -------
+    trend : Pandas.DataFrame object
+        Surveys × answers, the number of times each answer was given in each survey
+    
+    """
+    
+    return get_question_trends(data_root, config, [question_id], area)[question_id]
@@ -0,0 +1,609 @@
+# -*- coding: utf-8 -*-
+
+import io
+import sys
+import copy
+import json
+import time
+import yaml
+import random
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+from pathlib import Path
+from contextlib import redirect_stdout
+from question import fresh_question_store
+from store import load_question_store, save_question_store, build_inverted_question_store
+from profiling import enable_profiling, profile_state
+from generate import CONFIG_REL, verify_and_register_csv, generate_survey
+
+"""
+Synthesizes data roots, question stores, doctrees and survey results of the given size,
+runs the whole pipeline of generate.py on them and times every stage of it, see main.
+"""
+
+# Comments are made of these words
+COMMENT_WORDS = ("riunioni", "eventi", "progetti", "area", "responsabile", "migliorare", "tempo",
+                 "comunicazione", "formazione", "soci", "attività", "proposta", "bene", "male", "più")
+# The number of questions in each section of the synthetic doctree
+QUESTIONS_PER_SECTION = 5
+# Timings shorter than this are too noisy to be compared with the baseline, in seconds
+MINIMUM_COMPARED_TIME = 0.01
+
+def read_yaml(path):
+    
+    """
+    Reads a yaml file, the configuration files are usually saved
+    with the Windows encoding but may be in UTF-8 as well
+    
+    Parameters
+    ----------
+    path : pathlib.Path object
+        The yaml file
+    
+    Returns
+    -------
+    contents : Object
+        The contents of the file
+    
+    """
+    
+    raw = path.read_bytes()
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        text = raw.decode("cp1252")
+    
+    return yaml.safe_load(text)
+
+def get_survey_ids(past_surveys):
+    
+    """
+    The ids of the synthetic surveys, one per year
+    
+    Parameters
+    ----------
+    past_surveys : int
+        The number of past surveys
+    
+    Returns
+    -------
+    past_survey_ids : List
+        The ids of the past surveys, oldest first
+    survey_id : String
+        The id of the survey that is benchmarked
+    
+    """
+    
+    survey_ids = [str(2000 + year) + "-01" for year in range(past_surveys + 1)]
+    
+    return survey_ids[:-1], survey_ids[-1]
+
+def build_config(base_config, arguments, past_survey_ids):
+    
+    """
+    Adapts the config file to the synthetic surveys: their areas, every custom chart
+    drawn from the past surveys, and the chart backend and parallelism to benchmark.
+    The caches are turned off so that every run does all of the work.
+    
+    Parameters
+    ----------
+    base_config : Dictionary
+        The contents of the config.yml file the synthetic one starts from
+    arguments : argparse.Namespace
+        The command line arguments
+    past_survey_ids : List
+        The ids of the past surveys
+    
+    Returns
+    -------
+    config : Dictionary
+        The synthetic config
+    
+    """
+    
+    config = copy.deepcopy(base_config)
+    
+    config["Areas"] = ["Area " + str(number) for number in range(1, arguments.areas + 1)]
+    config["Chart Backend"] = arguments.chart_backend
+    config["Render Cache"] = { "Enabled" : False, "Maximum Size" : 200 }
+    config["Incremental Generation"] = { "Enabled" : False }
+    config["Parallel Generation"] = { "Enabled" : arguments.workers != 1, "Workers" : arguments.workers or None }
+    config["Save Chart Images"] = False
+    config["Custom Charts Exceptions"] = []
+    
+    if past_survey_ids:
+        config["Custom Charts Draw"] = ["Global Pie", "Past Survey Pie", "Past Survey Bar"]
+        config["Custom Charts"]["Past Survey Pie"]["Parameters"] = past_survey_ids[-1]
+        config["Custom Charts"]["Past Survey Bar"]["Parameters"] = past_survey_ids
+    else:
+        config["Custom Charts Draw"] = ["Global Pie"]
+    
+    return config
+
+def build_doctree(questions, comments):
+    
+    """
+    Builds a doctree with the given number of questions and comment fields,
+    QUESTIONS_PER_SECTION questions per section, the comment fields go
+    in the sections in turn
+    
+    Parameters
+    ----------
+    questions : int
+        The number of questions
+    comments : int
+        The number of comment fields
+    
+    Returns
+    -------
+    doctree : Dictionary
+        The doctree
+    question_texts : List
+        The texts of the questions
+    comment_fields : List
+        The columns of the comments
+    
+    """
+    
+    question_texts = ["Quanto sei soddisfatto dell'attività numero " + str(number) + " dell'associazione?"
+                      for number in range(1, questions + 1)]
+    comment_fields = ["Come miglioreresti l'attività numero " + str(number) + "?" for number in range(1, comments + 1)]
+    
+    sections = max(1, (questions + QUESTIONS_PER_SECTION - 1) // QUESTIONS_PER_SECTION)
+    doctree = {}
+    for section in range(sections):
+        doctree.update( { "Section " + str(section + 1) :
+                          { "Questions" : question_texts[section * QUESTIONS_PER_SECTION:(section + 1) * QUESTIONS_PER_SECTION] } } )
+    
+    section_names = list(doctree)
+    for number, field in enumerate(comment_fields):
+        doctree[section_names[number % len(section_names)]].setdefault("Comments", []).append(field)
+    
+    return doctree, question_texts, comment_fields
+
+def write_survey_csv(path, config, question_texts, comment_fields, respondents, comment_length, rng):
+    
+    """
+    Writes the results of a synthetic survey as the survey platform exports them: a timestamp,
+    the area of the respondent, then one column per question, numbered, and one per comment field
+    
+    Parameters
+    ----------
+    path : pathlib.Path object
+        Where the .csv file goes
+    config : Dictionary
+        The synthetic config, the areas and the answers are taken from it
+    question_texts : List
+        The texts of the questions
+    comment_fields : List
+        The columns of the comments
+    respondents : int
+        The number of rows
+    comment_length : int
+        The number of words of each comment
+    rng : random.Random object
+        The source of the answers
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    import pandas as pd
+    
+    columns = { "Timestamp" : ["2000/01/01 12:00:00"] * respondents,
+                "AREA" : rng.choices(config["Areas"], k=respondents) }
+    
+    answers = list(config["Available Choices"])
+    for number, question in enumerate(question_texts, start=1):
+        columns.update( { str(number) + ") " + question : rng.choices(answers, k=respondents) } )
+    
+    for field in comment_fields:
+        columns.update( { field : [" ".join(rng.choices(COMMENT_WORDS, k=comment_length)) for respondent in range(respondents)] } )
+    
+    pd.DataFrame(columns).to_csv(path, index=False)
+    
+    return
+
+def run_quietly(function, *arguments):
+    
+    """
+    Calls function(*arguments) without letting it print, the output
+    is only shown if the function exits with an error
+    
+    Parameters
+    ----------
+    function : Function
+        The function to be called
+    
+    Returns
+    -------
+    result : Object
+        What the function returned
+    
+    """
+    
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            return function(*arguments)
+    except (SystemExit, Exception):
+        print(output.getvalue())
+        raise
+
+def prepare_data_root(data_root, config, doctree, question_texts, comment_fields, arguments, past_survey_ids, survey_id):
+    
+    """
+    Creates a data root with a fresh question store, generates the past surveys in it,
+    which registers the questions and stores the surveys the custom charts are drawn
+    from, and writes the results of the survey that is benchmarked.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        Where the data root goes
+    config : Dictionary
+        The synthetic config
+    doctree : Dictionary
+        The synthetic doctree
+    question_texts : List
+        The texts of the questions
+    comment_fields : List
+        The columns of the comments
+    arguments : argparse.Namespace
+        The command line arguments
+    past_survey_ids : List
+        The ids of the past surveys
+    survey_id : String
+        The id of the survey that is benchmarked
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    for directory in ["Surveys", "Visuals", "Templates", "AppData"]:
+        (data_root / directory).mkdir(parents=True)
+    fresh_question_store(data_root / "AppData")
+    
+    inputs = data_root.parent / "inputs"
+    inputs.mkdir(exist_ok=True)
+    with open(inputs / "config.yml", "w", encoding="utf-8") as fd:
+        yaml.safe_dump(config, fd, allow_unicode=True)
+    with open(inputs / "doctree.yml", "w", encoding="utf-8") as fd:
+        yaml.safe_dump(doctree, fd, allow_unicode=True, sort_keys=False)
+    
+    rng = random.Random(arguments.seed)
+    
+    for current_id in past_survey_ids + [survey_id]:
+        write_survey_csv(inputs / (current_id + ".csv"), config, question_texts, comment_fields,
+                         arguments.respondents, arguments.comment_length, rng)
+    
+    # The past surveys can't draw charts from each other, they only need to be stored
+    past_config = dict(config, **{ "Custom Charts Draw" : ["Global Pie"] })
+
+    question_store = load_question_store(data_root)
+    for past_survey_id in past_survey_ids:
+        print("Generating the past survey " + past_survey_id + "...")
+        past_survey_id, survey_csv = verify_and_register_csv(data_root, inputs / (past_survey_id + ".csv"), past_survey_id)
+        question_store = run_quietly(generate_survey, data_root, past_survey_id, survey_csv, past_config, doctree, question_store,
+                                     inputs / "config.yml", inputs / "doctree.yml", "register")
+    if hasattr(question_store, "close"):
+        question_store.close()
+    
+    return
+
+def time_pipeline(prepared_root, run_root, config, doctree, survey_id):
+    
+    """
+    Copies the prepared data root and generates the benchmarked survey in the copy,
+    from the .csv file of its results to the saved question store, with the profiler on
+    
+    Parameters
+    ----------
+    prepared_root : pathlib.Path object
+        The data root made by prepare_data_root
+    run_root : pathlib.Path object
+        Where the copy goes, it must not exist
+    config : Dictionary
+        The synthetic config
+    doctree : Dictionary
+        The synthetic doctree
+    survey_id : String
+        The id of the benchmarked survey
+    
+    Returns
+    -------
+    timings : Dictionary
+        { "pipeline" : the wall time of the whole run, "stage: <stage>" : the wall time of each stage }
+    
+    """
+    
+    shutil.copytree(prepared_root, run_root)
+    inputs = prepared_root.parent / "inputs"
+    
+    enable_profiling()
+    start = time.perf_counter()
+    
+    def pipeline():
+        question_store = load_question_store(run_root)
+        current_id, survey_csv = verify_and_register_csv(run_root, inputs / (survey_id + ".csv"), survey_id)
+        question_store = generate_survey(run_root, current_id, survey_csv, config, doctree, question_store,
+                                         inputs / "config.yml", inputs / "doctree.yml", "register")
+        if hasattr(question_store, "close"):
+            question_store.close()
+    
+    run_quietly(pipeline)
+    
+    timings = { "pipeline" : time.perf_counter() - start }
+    for name, record in profile_state["stages"].items():
+        timings.update( { "stage: " + name : record["wall"] } )
+    
+    profile_state["enabled"] = False
+    
+    return timings
+
+def time_question_store(data_root, question_texts):
+    
+    """
+    Times the question store operations the question.py commands and generate.py are made of:
+    loading and saving the store, and looking up the id of every question from its text
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        A data root whose question store has the questions registered
+    question_texts : List
+        The texts of the questions
+    
+    Returns
+    -------
+    timings : Dictionary
+        The wall time of each operation
+    
+    """
+    
+    timings = {}
+    
+    start = time.perf_counter()
+    question_store = load_question_store(data_root)
+    timings.update( { "question store: load" : time.perf_counter() - start } )
+    
+    start = time.perf_counter()
+    inverted_question_store = build_inverted_question_store(question_store)
+    for question in question_texts:
+        inverted_question_store.get(question)
+    timings.update( { "question store: lookup" : time.perf_counter() - start } )
+    
+    start = time.perf_counter()
+    save_question_store(data_root, question_store)
+    timings.update( { "question store: save" : time.perf_counter() - start } )
+    
+    if hasattr(question_store, "close"):
+        question_store.close()
+    
+    return timings
+
+def time_chart(config, chart_backend, repeat):
+    
+    """
+    Times drawing and placing a single pie chart with the given backend,
+    from the answer counts to the chart in a document
+    
+    Parameters
+    ----------
+    config : Dictionary
+        The synthetic config
+    chart_backend : String
+        The Chart Backend to be used
+    repeat : int
+        The number of charts drawn, the time of one is returned
+    
+    Returns
+    -------
+    timings : Dictionary
+        { "draw pie" : the wall time of a chart }
+    
+    """
+    
+    import pandas as pd
+    from docx import Document
+    from docx.shared import Cm
+    from visuals import NATIVE_CHART_BACKEND, CHART_RENDERERS, pie_chart_data
+    
+    answers = list(config["Available Choices"])[:5]
+    values = pd.Series(range(1, len(answers) + 1), index=answers)
+    scale = config["Document Data Visual Resolution Multiplier"]
+    doc = Document()
+    
+    start = time.perf_counter()
+    for number in range(repeat):
+        chart = pie_chart_data("Synthetic question " + str(number) + "?", values, config, "2000-01", "Area 1", "percent")
+        run = doc.add_paragraph().add_run()
+        if chart_backend == NATIVE_CHART_BACKEND:
+            from docxcharts import add_docx_chart
+            add_docx_chart(run, chart, Cm(15.0))
+        else:
+            image = CHART_RENDERERS[chart_backend][0]([chart], [scale])[0]
+            run.add_picture(io.BytesIO(image), width=Cm(15.0))
+    
+    return { "draw pie" : (time.perf_counter() - start) / repeat }
+
+def compare_to_baseline(timings, baseline, threshold):
+    
+    """
+    Compares the timings with the ones of a previous run, prints the comparison
+    and returns the timings that got slower by more than the threshold.
+    Timings shorter than MINIMUM_COMPARED_TIME in both runs are only printed.
+    
+    Parameters
+    ----------
+    timings : Dictionary
+        The timings of this run
+    baseline : Dictionary
+        The timings of the previous run
+    threshold : float
+        The allowed slowdown, 0.2 means 20% slower
+    
+    Returns
+    -------
+    regressions : List
+        The names of the timings that regressed
+    
+    """
+    
+    regressions = []
+    name_width = max([len("Timing")] + [len(name) for name in timings])
+    
+    print("\n" + "Timing".ljust(name_width) + "   Baseline (s)    Current (s)    Change")
+    for name in sorted(timings):
+        if name not in baseline:
+            print(name.ljust(name_width) + "new".rjust(15) + ("%.4f" % timings[name]).rjust(15))
+            continue
+        
+        change = (timings[name] - baseline[name]) / baseline[name] if baseline[name] else 0
+        flag = ""
+        if change > threshold and max(timings[name], baseline[name]) >= MINIMUM_COMPARED_TIME:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(name.ljust(name_width) + ("%.4f" % baseline[name]).rjust(15) + ("%.4f" % timings[name]).rjust(15)
+              + ("%+.1f%%" % (100 * change)).rjust(10) + flag)
+    
+    return regressions
+
+def get_arguments():
+    
+    """
+    Parses the command line arguments, see main
+    
+    Returns
+    -------
+    arguments : argparse.Namespace
+        The parsed arguments
+    
+    """
+    
+    parser = argparse.ArgumentParser(prog="benchmark.py",
+                                     description="Times generate.py and the question store on synthetic surveys. "
+                                                 "Nothing outside of a temporary directory is touched.")
+    parser.add_argument("--respondents", type=int, default=200, help="rows of each survey, default: %(default)s")
+    parser.add_argument("--questions", type=int, default=40, help="questions in the doctree, default: %(default)s")
+    parser.add_argument("--areas", type=int, default=6, help="areas, default: %(default)s")
+    parser.add_argument("--comments", type=int, default=4, help="comment fields in the doctree, default: %(default)s")
+    parser.add_argument("--comment-length", type=int, default=30, help="words per comment, default: %(default)s")
+    parser.add_argument("--past-surveys", type=int, default=2,
+                        help="past surveys the custom charts are drawn from, default: %(default)s")
+    parser.add_argument("--chart-backend", default="DOCX",
+                        help="the Chart Backend: DOCX, Pillow or Plotly, which needs Kaleido, default: %(default)s")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes of the parallel generation, 1 turns it off and 0 uses every core, default: %(default)s")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of the pipeline, the median is kept, default: %(default)s")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic answers, default: %(default)s")
+    parser.add_argument("--config", type=Path, default=CONFIG_REL,
+                        help="the config file the synthetic one starts from, default: %(default)s")
+    parser.add_argument("--output", type=Path, default=Path(tempfile.gettempdir()) / "benchmark-results.json",
+                        help="where the results are saved, default: %(default)s")
+    parser.add_argument("--baseline", type=Path, default=None,
+                        help="the results of a previous run to compare with, the exit code is 1 if anything regressed")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="the slowdown that counts as a regression, default: %(default)s (20%%)")
+    parser.add_argument("--keep", type=Path, default=None,
+                        help="build the data roots in this directory and keep them instead of using a temporary one")
+    
+    arguments = parser.parse_args()
+    
+    if arguments.repeat < 1 or arguments.areas < 1 or arguments.questions < 1 or arguments.respondents < 1:
+        parser.error("--repeat, --areas, --questions and --respondents must be at least 1")
+    if arguments.baseline is not None and not arguments.baseline.is_file():
+        parser.error(str(arguments.baseline) + " doesn't point to a file")
+    
+    return arguments
+
+def main():
+    
+    """
+    Benchmarks SurveyKN on synthetic data.
+    
+    - benchmark.py [options] (run "benchmark.py --help" for the options)
+    
+    A data root is synthesized with a fresh question store and the given number of past
+    surveys, then the next survey is generated --repeat times, each time in a new copy of
+    the data root, and every stage of the run is timed along with the whole pipeline,
+    a single chart and the question store operations. The median timings are saved as
+    JSON to --output, and compared with --baseline if one is given.
+    
+    With the default DOCX chart backend nothing needs a display, a browser or the network.
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    arguments = get_arguments()
+    
+    past_survey_ids, survey_id = get_survey_ids(arguments.past_surveys)
+    config = build_config(read_yaml(arguments.config), arguments, past_survey_ids)
+    doctree, question_texts, comment_fields = build_doctree(arguments.questions, arguments.comments)
+    
+    if arguments.keep is not None:
+        arguments.keep.mkdir(parents=True, exist_ok=True)
+        work_directory = Path(tempfile.mkdtemp(dir=arguments.keep))
+    else:
+        temporary_directory = tempfile.TemporaryDirectory()
+        work_directory = Path(temporary_directory.name)
+    
+    prepared_root = work_directory / "prepared" / "SurveyKN-dataroot"
+    prepare_data_root(prepared_root, config, doctree, question_texts, comment_fields, arguments, past_survey_ids, survey_id)
+    
+    runs = []
+    for number in range(1, arguments.repeat + 1):
+        print("Run " + str(number) + "/" + str(arguments.repeat) + "...")
+        runs.append(time_pipeline(prepared_root, work_directory / ("run-" + str(number)) / "SurveyKN-dataroot",
+                                  config, doctree, survey_id))
+        runs[-1].update(time_question_store(work_directory / ("run-" + str(number)) / "SurveyKN-dataroot", question_texts))
+        runs[-1].update(time_chart(config, arguments.chart_backend, 10))
+    
+    timings = {}
+    for name in runs[0]:
+        timings.update( { name : statistics.median(run.get(name, 0.0) for run in runs) } )
+    
+    parameters = { name : value for name, value in vars(arguments).items()
+                   if name not in ("output", "baseline", "keep", "config", "threshold") }
+    results = { "parameters" : parameters,
+                "environment" : { "python" : platform.python_version(), "platform" : platform.platform() },
+                "timings" : timings }
+    
+    with open(arguments.output, "w") as fd:
+        json.dump(results, fd, indent=4)
+    
+    regressions = []
+    if arguments.baseline is not None:
+        with open(arguments.baseline, "r") as fd:
+            baseline = json.load(fd)
+        if baseline["parameters"] != parameters:
+            print("\nWarning: The baseline was run with different parameters, the timings may not be comparable")
+        regressions = compare_to_baseline(timings, baseline["timings"], arguments.threshold)
+    else:
+        name_width = max(len(name) for name in timings)
+        print()
+        for name in sorted(timings, key=lambda name: -timings[name]):
+            print(name.ljust(name_width) + ("%.4f s" % timings[name]).rjust(14))
+    
+    print("\nResults saved to " + str(arguments.output))
+    if arguments.keep is None:
+        temporary_directory.cleanup()
+    
+    if regressions:
+        print("\n" + str(len(regressions)) + " timings regressed by more than " + str(int(100 * arguments.threshold)) + "%")
+        sys.exit(1)
+    
+    return
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+
+import io
+import weakref
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+from docx.oxml import parse_xml
+from docx.opc.part import Part
+from docx.opc.packuri import PackURI
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+
+CHART_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.drawingml.chart+xml"
+WORKBOOK_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+CHART_PARTNAME_TEMPLATE = "/word/charts/chart%d.xml"
+WORKBOOK_PARTNAME_TEMPLATE = "/word/embeddings/Microsoft_Excel_Sheet%d.xlsx"
+
+CHART_NAMESPACES = ('xmlns:c="http://schemas.openxmlformats.org/drawingml/2006/chart" '
+                    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+                    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"')
+DRAWING_NAMESPACES = ('xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+                      'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+                      + CHART_NAMESPACES)
+SPREADSHEET_NAMESPACE = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+PACKAGE_RELATIONSHIPS_NAMESPACE = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# The charts keep the 7:5 aspect ratio of the images rendered by plotly
+CHART_ASPECT_RATIO = 5 / 7
+
+# Sizes in the chart description are given in pixels like in plotly
+EMU_PER_PIXEL = 9525
+HUNDREDTHS_OF_POINT_PER_PIXEL = 75
+
+# The next free index of each partname template in each document being written, see next_partname
+partname_counters = weakref.WeakKeyDictionary()
+
+class ChartPart(Part):
+    
+    """
+    The part holding the DrawingML description of a chart. The XML is set once the
+    relationship to the embedded workbook is known, since the XML refers to it.
+    """
+    
+    def __init__(self, partname, package):
+        super().__init__(partname, CHART_CONTENT_TYPE, package=package)
+        self.chart_xml = b""
+    
+    @property
+    def blob(self):
+        return self.chart_xml
+
+def column_letter(index):
+    
+    """
+    Converts the 0 based index of a spreadsheet column into its letters (A, B, ..., Z, AA, ...)
+    
+    Parameters
+    ----------
+    index : int
+        The index of the column
+    
+    Returns
+    -------
+    letters : String
+        The name of the column
+    
+    """
+    
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    
+    return letters
+
+def build_workbook(rows):
+    
+    """
+    Builds a minimal .xlsx workbook with a single sheet holding the given rows.
+    The workbook is embedded next to the chart so that its data can be edited in Word.
+    
+    Parameters
+    ----------
+    rows : List
+        The rows of the sheet, each row being a list of strings and numbers.
+        None leaves the cell empty
+    
+    Returns
+    -------
+    workbook : bytes
+        The contents of the .xlsx file
+    
+    """
+    
+    sheet_rows = []
+    for row_number, row in enumerate(rows, start=1):
+        cells = []
+        for column, value in enumerate(row):
+            reference = column_letter(column) + str(row_number)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                cells.append('<c r="%s" t="inlineStr"><is><t>%s</t></is></c>' % (reference, escape(value)))
+            else:
+                cells.append('<c r="%s"><v>%s</v></c>' % (reference, value))
+        sheet_rows.append('<row r="%d">%s</row>' % (row_number, "".join(cells)))
+    
+    files = {
+        "[Content_Types].xml" :
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>',
+        "_rels/.rels" :
+            '<Relationships xmlns="%s">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>' % PACKAGE_RELATIONSHIPS_NAMESPACE,
+        "xl/workbook.xml" :
+            '<workbook xmlns="%s" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>' % SPREADSHEET_NAMESPACE,
+        "xl/_rels/workbook.xml.rels" :
+            '<Relationships xmlns="%s">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+            '</Relationships>' % PACKAGE_RELATIONSHIPS_NAMESPACE,
+        "xl/worksheets/sheet1.xml" :
+            '<worksheet xmlns="%s"><sheetData>%s</sheetData></worksheet>' % (SPREADSHEET_NAMESPACE, "".join(sheet_rows)),
+    }
+    
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as workbook:
+        for name, contents in files.items():
+            workbook.writestr(name, '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + contents)
+    
+    return buffer.getvalue()
+
+def string_reference(formula, texts):
+    
+    """
+    The reference to a range of text cells of the embedded workbook, with the texts
+    cached in the chart so that Word can show the chart without opening the workbook
+    """
+    
+    points = "".join('<c:pt idx="%d"><c:v>%s</c:v></c:pt>' % (index, escape(str(text))) for index, text in enumerate(texts))
+    
+    return ('<c:strRef><c:f>%s</c:f><c:strCache><c:ptCount val="%d"/>%s</c:strCache></c:strRef>'
+            % (formula, len(texts), points))
+
+def number_reference(formula, numbers):
+    
+    """
+    The reference to a range of number cells of the embedded workbook, with the
+    numbers cached in the chart, see string_reference
+    """
+    
+    points = "".join('<c:pt idx="%d"><c:v>%s</c:v></c:pt>' % (index, number) for index, number in enumerate(numbers))
+    
+    return ('<c:numRef><c:f>%s</c:f><c:numCache><c:formatCode>General</c:formatCode><c:ptCount val="%d"/>%s</c:numCache></c:numRef>'
+            % (formula, len(numbers), points))
+
+def solid_fill(color):
+    
+    """
+    The DrawingML fill of the given #RRGGBB color, colors that aren't in this
+    form are left to the default style of Word
+    """
+    
+    color = str(color).strip().lstrip("#")
+    if len(color) == 3:
+        color = "".join(digit * 2 for digit in color)
+    if len(color) != 6:
+        return ""
+    
+    return '<a:solidFill><a:srgbClr val="%s"/></a:solidFill>' % color.upper()
+
+def shape_properties(color, line_color=None, line_width=None):
+    
+    """
+    The DrawingML shape properties of a slice or a bar
+    """
+    
+    line = ""
+    if line_color is not None:
+        line = '<a:ln w="%d">%s</a:ln>' % (int(line_width * EMU_PER_PIXEL), solid_fill(line_color))
+    
+    return "<c:spPr>%s%s</c:spPr>" % (solid_fill(color), line)
+
+def chart_title(title, subtitle=None):
+    
+    """
+    The title of the chart, the subtitle goes on a second, smaller line
+    """
+    
+    paragraphs = '<a:p><a:r><a:t>%s</a:t></a:r></a:p>' % escape(title)
+    if subtitle:
+        paragraphs += ('<a:p><a:pPr><a:defRPr sz="1200" b="0"/></a:pPr><a:r><a:rPr lang="en-US" sz="1200" b="0"/><a:t>%s</a:t></a:r></a:p>'
+                       % escape(subtitle))
+    
+    return ('<c:title><c:tx><c:rich><a:bodyPr/><a:lstStyle/>%s</c:rich></c:tx><c:overlay val="0"/></c:title>'
+            '<c:autoTitleDeleted val="0"/>' % paragraphs)
+
+def pie_series_name(chart):
+    
+    """
+    The name of the only series of a pie chart, made of its annotations
+    """
+    
+    area, date = chart["annotations"]
+    
+    return str(area) + " " + str(date)
+
+def chart_rows(chart):
+    
+    """
+    The rows of the workbook embedded next to a chart. For a pie chart the answers go
+    in the first column and their counts in the second one, for a stacked bar graph the
+    surveys go in the first column and the counts of each answer in its own column.
+    
+    Parameters
+    ----------
+    chart : Dictionary
+        The chart, see visuals.pie_chart_data and visuals.stacked_bar_data
+    
+    Returns
+    -------
+    rows : List
+        The rows of the sheet, see build_workbook
+    
+    """
+    
+    if chart["type"] == "pie":
+        rows = [[None, pie_series_name(chart)]]
+        for label, value in zip(chart["labels"], chart["values"]):
+            rows.append([str(label), int(value)])
+    else:
+        rows = [[None] + [str(series["name"]) for series in chart["series"]]]
+        for row_index, category in enumerate(chart["categories"]):
+            rows.append([str(category)] + [int(series["values"][row_index]) for series in chart["series"]])
+    
+    return rows
+
+def pie_chart_xml(chart, workbook_rId):
+    
+    """
+    Describes a pie chart made by visuals.pie_chart_data as a DrawingML chart,
+    the data sits in the first two columns of the embedded workbook, see chart_rows
+    
+    Parameters
+    ----------
+    chart : Dictionary
+        The description of the chart
+    workbook_rId : String
+        The id of the relationship between the chart and the embedded workbook
+    
+    Returns
+    -------
+    xml : String
+        The XML of the chart part
+    
+    """
+    
+    labels = [str(label) for label in chart["labels"]]
+    values = [int(value) for value in chart["values"]]
+    series_name = pie_series_name(chart)
+    last_row = len(labels) + 1
+    
+    data_points = ""
+    for index, color in enumerate(chart["colors"]):
+        data_points += ('<c:dPt><c:idx val="%d"/><c:bubble3D val="0"/>%s</c:dPt>'
+                        % (index, shape_properties(color, chart["line color"], chart["line width"])))
+    
+    textinfo = chart["textinfo"].split("+")
+    data_labels = ('<c:dLbls><c:txPr><a:bodyPr/><a:lstStyle/><a:p><a:pPr><a:defRPr sz="%d"/></a:pPr><a:endParaRPr lang="en-US"/></a:p></c:txPr>'
+                   '<c:showLegendKey val="0"/><c:showVal val="%d"/><c:showCatName val="%d"/><c:showSerName val="0"/>'
+                   '<c:showPercent val="%d"/><c:showBubbleSize val="0"/><c:showLeaderLines val="1"/></c:dLbls>'
+                   % (int(chart["font size"] * HUNDREDTHS_OF_POINT_PER_PIXEL),
+                      "value" in textinfo, "label" in textinfo, "percent" in textinfo))
+    
+    series = ('<c:ser><c:idx val="0"/><c:order val="0"/><c:tx>%s</c:tx>%s%s<c:cat>%s</c:cat><c:val>%s</c:val></c:ser>'
+              % (string_reference("Sheet1!$B$1", [series_name]),
+                 data_points,
+                 data_labels,
+                 string_reference("Sheet1!$A$2:$A$%d" % last_row, labels),
+                 number_reference("Sheet1!$B$2:$B$%d" % last_row, values)))
+    
+    plot_area = ('<c:plotArea><c:layout/><c:pieChart><c:varyColors val="1"/>%s<c:firstSliceAng val="0"/></c:pieChart></c:plotArea>'
+                 % series)
+    
+    return chart_space(chart_title(chart["title"], series_name), plot_area, workbook_rId)
+
+def stacked_bar_xml(chart, workbook_rId):
+    
+    """
+    Describes a stacked bar graph made by visuals.stacked_bar_data as a DrawingML chart,
+    the surveys go in the first column of the embedded workbook and each answer in
+    one of the following columns, see pie_chart_xml and chart_rows
+    
+    """
+    
+    categories = [str(category) for category in chart["categories"]]
+    last_row = len(categories) + 1
+    
+    series_xml = ""
+    for index, series in enumerate(chart["series"]):
+        column = column_letter(index + 1)
+        series_xml += ('<c:ser><c:idx val="%d"/><c:order val="%d"/><c:tx>%s</c:tx>%s<c:invertIfNegative val="0"/>'
+                       '<c:cat>%s</c:cat><c:val>%s</c:val></c:ser>'
+                       % (index, index,
+                          string_reference("Sheet1!$%s$1" % column, [str(series["name"])]),
+                          shape_properties(series["color"]),
+                          string_reference("Sheet1!$A$2:$A$%d" % last_row, categories),
+                          number_reference("Sheet1!$%s$2:$%s$%d" % (column, column, last_row),
+                                           [int(value) for value in series["values"]])))
+    
+    plot_area = ('<c:plotArea><c:layout/>'
+                 '<c:barChart><c:barDir val="col"/><c:grouping val="stacked"/><c:varyColors val="0"/>%s'
+                 '<c:gapWidth val="150"/><c:overlap val="100"/><c:axId val="1"/><c:axId val="2"/></c:barChart>'
+                 '<c:catAx><c:axId val="1"/><c:scaling><c:orientation val="minMax"/></c:scaling><c:delete val="0"/>'
+                 '<c:axPos val="b"/><c:majorTickMark val="out"/><c:minorTickMark val="none"/><c:tickLblPos val="nextTo"/>'
+                 '<c:crossAx val="2"/><c:crosses val="autoZero"/><c:auto val="1"/><c:lblAlgn val="ctr"/>'
+                 '<c:lblOffset val="100"/><c:noMultiLvlLbl val="0"/></c:catAx>'
+                 '<c:valAx><c:axId val="2"/><c:scaling><c:orientation val="minMax"/></c:scaling><c:delete val="0"/>'
+                 '<c:axPos val="l"/><c:majorGridlines/><c:numFmt formatCode="General" sourceLinked="1"/>'
+                 '<c:majorTickMark val="out"/><c:minorTickMark val="none"/><c:tickLblPos val="nextTo"/>'
+                 '<c:crossAx val="1"/><c:crosses val="autoZero"/><c:crossBetween val="between"/></c:valAx>'
+                 '</c:plotArea>' % series_xml)
+    
+    return chart_space(chart_title(chart["title"]), plot_area, workbook_rId)
+
+def chart_space(title, plot_area, workbook_rId):
+    
+    """
+    Wraps the title and the plot area of a chart into a complete chart part
+    """
+    
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<c:chartSpace %s><c:roundedCorners val="0"/><c:chart>%s%s'
+            '<c:legend><c:legendPos val="r"/><c:overlay val="0"/></c:legend><c:plotVisOnly val="1"/></c:chart>'
+            '<c:externalData r:id=%s><c:autoUpdate val="0"/></c:externalData></c:chartSpace>'
+            % (CHART_NAMESPACES, title, plot_area, quoteattr(workbook_rId)))
+
+def next_partname(package, template):
+    
+    """
+    A partname built from template that isn't used in the package yet. The parts of the
+    package are only walked the first time, the charts and their workbooks are only added
+    through here so the following partnames are counted from the highest one in use.
+    """
+    
+    counters = partname_counters.setdefault(package, {})
+    if template not in counters:
+        partnames = set(part.partname for part in package.iter_parts())
+        used = [index for index in range(1, len(partnames) + 1) if PackURI(template % index) in partnames]
+        counters.update( { template : max(used, default=0) + 1 } )
+    
+    index = counters[template]
+    counters[template] += 1
+    
+    return PackURI(template % index)
+
+def add_docx_chart(run, chart, width):
+    
+    """
+    Puts a chart into the given run of the document as a native Word chart instead of
+    an image. The values are kept in the chart itself and in a workbook embedded next
+    to it, so the chart can be restyled and its data edited from Word.
+    
+    Parameters
+    ----------
+    run : docx.text.run.Run object
+        The run that will hold the chart
+    chart : Dictionary
+        The chart, see visuals.pie_chart_data and visuals.stacked_bar_data
+    width : docx.shared.Length
+        The width of the chart in the document, the height follows the
+        aspect ratio of the charts rendered by plotly
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    document_part = run.part
+    package = document_part.package
+    
+    workbook_part = Part(next_partname(package, WORKBOOK_PARTNAME_TEMPLATE), WORKBOOK_CONTENT_TYPE,
+                         build_workbook(chart_rows(chart)), package)
+    chart_part = ChartPart(next_partname(package, CHART_PARTNAME_TEMPLATE), package)
+    workbook_rId = chart_part.relate_to(workbook_part, RT.PACKAGE)
+    
+    if chart["type"] == "pie":
+        chart_part.chart_xml = pie_chart_xml(chart, workbook_rId).encode("utf-8")
+    else:
+        chart_part.chart_xml = stacked_bar_xml(chart, workbook_rId).encode("utf-8")
+    
+    chart_rId = document_part.relate_to(chart_part, RT.CHART)
+    shape_id = document_part.next_id
+    
+    drawing = ('<w:drawing %s><wp:inline distT="0" distB="0" distL="0" distR="0">'
+               '<wp:extent cx="%d" cy="%d"/><wp:effectExtent l="0" t="0" r="0" b="0"/>'
+               '<wp:docPr id="%d" name="Chart %d"/><wp:cNvGraphicFramePr/>'
+               '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/chart">'
+               '<c:chart r:id=%s/></a:graphicData></a:graphic></wp:inline></w:drawing>'
+               % (DRAWING_NAMESPACES, int(width), int(width * CHART_ASPECT_RATIO),
+                  shape_id, shape_id, quoteattr(chart_rId)))
+    
+    run._r.append(parse_xml(drawing))
+    
+    return
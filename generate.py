@@ -1,20 +1,28 @@
 # -*- coding: utf-8 -*-
 
+import os
 import re
 import sys
-import yaml
-import pandas as pd
-from shutil import copy
+import json
+import time
+import threading
 from pathlib import Path
 from os.path import realpath
-from datetime import date
-from visuals import draw_pie, draw_stacked_bar
 from question import add_question_to_store
-from docx import Document
+from aggregates import load_aggregate, save_aggregate, build_aggregate, get_survey_stamp, aggregate_to_answer_counts
+from profiling import stage, is_profiling, enable_profiling, get_cprofile_path, merge_profile_stats, profiled_call, run_with_cprofile, write_profile_report
+from store import load_question_store, save_question_store, build_inverted_question_store, TextIndex
 
-from docx.shared import Pt, RGBColor, Cm
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.style import WD_STYLE_TYPE
+# PyYAML, pandas, numpy, python-docx, plotly (through visuals.py) and multiprocessing take a while
+# to load, they are imported by the functions that use them, as are the standard modules only
+# a few functions need (argparse, datetime, hashlib, shutil) so that "generate.py help" and the
+# checks of the command line arguments answer right away. The import is repeated in each of
+# those functions on purpose rather than going through a shared accessor: once a module is
+# loaded, importing it again is a lookup in sys.modules, and each function keeps working on
+# its own, including in the worker processes of the parallel generation.
+# tests/test_startup.py checks that the light commands don't load them and answer within
+# 100 ms. "generate.py help" was measured at about 85 ms, of which about 20 ms is the
+# interpreter starting and about 15 ms compiling this script
 
 
 """
@@ -41,10 +49,423 @@ DATA_ROOT_CONFIG_REL = Path(realpath(__file__)).parent / "data-root-config.yml"
 DOCTREE_REL = Path('Current Configuration/doctree.yml')
 # The relative path to config.yml from this script
 CONFIG_REL = Path('Current Configuration/config.yml')
-# The relative path to question-store.yml from the data root
-QS_FROM_ROOT = Path('AppData/question-store.yml')
+# The ways of dealing with the doctree questions that aren't in the question store,
+# "ask" prompts the user for each of them, the others are used by the batch mode
+UNKNOWN_QUESTION_POLICIES = ("ask", "register", "skip", "fail")
+# The relative path to the chart render cache from the data root
+RENDER_CACHE_FROM_ROOT = Path('AppData/render-cache')
+# The relative path to the manifests of the incremental generation from the data root
+MANIFESTS_FROM_ROOT = Path('AppData/Manifests')
+# The relative path to the reports of the --profile option from the data root
+PROFILES_FROM_ROOT = Path('AppData/Profiles')
+# Changing this makes every report out of date, it must be increased whenever
+# the way the reports are generated from their inputs changes
+MANIFEST_VERSION = 2
+# The number of rows of the survey csv file read at a time
+CSV_CHUNK_SIZE = 50000
+# The sections of the config file that change how the reports are generated but not
+# what's in them, they are left out of the inputs of the incremental generation.
+# Save Chart Images stays in: a report that is skipped saves no images, so turning
+# it on has to generate the reports again
+EXECUTION_CONFIG_SECTIONS = ("Render Cache", "Parallel Generation", "Survey Storage", "Incremental Generation")
+# The paragraph styles of the documents as (style name, config section, base style)
+DOCUMENT_STYLES = (("title style", "Document Title", "Heading 1"),
+                   ("date style", "Document Date", None),
+                   ("metadata style", "Document Metadata", None),
+                   ("disclaimer style", "Document Disclaimer", None),
+                   ("heading1 style", "Document Section Heading", "Heading 1"),
+                   ("heading2 style", "Document Subsection Heading", "Heading 2"),
+                   ("heading3 style", "Document Subsubsection Heading", "Heading 3"),
+                   ("paragraph style", "Document Paragraph", None))
 
-def recursive_doctree_generate(dictionary, doc, working_survey, survey_id, area, config, question_store, styles_dictionary, data_root, level):
+# The file formats the processed surveys can be stored in, with their extensions
+# When a past survey is loaded the formats are tried in this order
+SURVEY_FORMATS = { "parquet" : ".parquet",
+                   "feather" : ".feather",
+                   "csv" : ".csv" }
+
+# The past surveys that were loaded during this run, { survey_id : (path, mtime, columns, survey) }
+past_surveys = {}
+past_surveys_lock = threading.Lock()
+
+@stage("save survey")
+def save_survey(data_root, survey_id, survey_csv, original_columns, working_columns, question_ids, config):
+    
+    """
+    Saves the processed survey into <data_root>/Surveys in the format chosen in
+    the config file. Every column of the survey csv file is saved, renamed by
+    process_survey, not only the ones the current doctree needs, so that the custom
+    charts of future surveys can use any of them. The csv file is read again
+    CSV_CHUNK_SIZE rows at a time and each chunk is written before the next one is
+    read, so the whole survey is never held in memory.
+    
+    Parquet and Feather keep the column types and can be read back one column at a
+    time, they need the pyarrow package. If pyarrow isn't installed the survey is
+    saved as csv.
+
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    survey_id : String
+        A unique identifier of the survey, generated as 'year-month'
+    survey_csv : pathlib.Path object
+        The survey csv file
+    original_columns : List
+        The column names in the header of the csv file
+    working_columns : List
+        The same columns renamed by process_survey, in the same order
+    question_ids : List
+        The question ids of the doctree, their answers are saved as categoricals
+        of the Available Choices
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    from importlib.util import find_spec
+    
+    survey_storage = config.get("Survey Storage") or { "Format" : "CSV", "Export CSV" : False }
+    storage_format = survey_storage["Format"].strip().lower()
+    
+    if storage_format not in SURVEY_FORMATS:
+        print("\nError: " + survey_storage["Format"] + " is not a valid survey storage format, please check config.yml")
+        sys.exit(1)
+    
+    if storage_format != "csv" and find_spec("pyarrow") is None:
+        print("\nWarning: " + survey_storage["Format"] + " needs the pyarrow package, saving the survey as csv instead...")
+        storage_format = "csv"
+    
+    written_formats = [storage_format]
+    if storage_format == "csv" or survey_storage["Export CSV"]:
+        written_formats.append("csv")
+    
+    paths = { written_format : data_root / "Surveys" / (survey_id + SURVEY_FORMATS[written_format]) for written_format in written_formats }
+    temporary_paths = { written_format : path.with_name(path.name + ".tmp") for written_format, path in paths.items() }
+    
+    # The columns that aren't answers to the questions of the doctree are kept as text,
+    # so that every chunk has the same column types
+    chunks = iter_survey_chunks(survey_csv, original_columns, working_columns, working_columns, question_ids, config, text=True)
+    
+    writer = None
+    for number, chunk in enumerate(chunks):
+        if "csv" in written_formats:
+            chunk.to_csv(temporary_paths["csv"], mode="w" if number == 0 else "a", header=number == 0, index=False)
+        
+        if storage_format == "csv":
+            continue
+        
+        import pyarrow as pa
+        
+        if writer is None:
+            # Columns that are empty in the first chunk would have no type
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            for i, field in enumerate(schema):
+                if pa.types.is_null(field.type):
+                    schema = schema.set(i, field.with_type(pa.string()))
+            
+            if storage_format == "parquet":
+                import pyarrow.parquet
+                writer = pyarrow.parquet.ParquetWriter(temporary_paths[storage_format], schema)
+            else:
+                import pyarrow.ipc
+                writer = pyarrow.ipc.new_file(str(temporary_paths[storage_format]), schema,
+                                              options=pyarrow.ipc.IpcWriteOptions(compression="lz4"))
+        
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    
+    if writer is not None:
+        writer.close()
+    
+    for written_format, path in paths.items():
+        os.replace(temporary_paths[written_format], path)
+    
+    # A survey saved in a different format by a previous run would shadow this one
+    for other_format, extension in SURVEY_FORMATS.items():
+        other_path = data_root / "Surveys" / (survey_id + extension)
+        if other_format not in written_formats and other_path.is_file():
+            other_path.unlink()
+    
+    return
+
+def find_survey_file(data_root, survey_id):
+    
+    """
+    Looks for a processed survey in <data_root>/Surveys, in whichever of the
+    SURVEY_FORMATS it was saved
+
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    survey_id : String
+        The id of the survey
+
+    Returns
+    -------
+    survey_path : pathlib.Path object or None
+        The processed survey, None if the survey isn't there
+
+    """
+    
+    for extension in SURVEY_FORMATS.values():
+        survey_path = data_root / "Surveys" / (survey_id + extension)
+        if survey_path.is_file():
+            return survey_path
+    
+    return None
+
+def get_survey_column_names(survey_path):
+    
+    """
+    Reads the names of the columns of a processed survey without reading the survey,
+    the columnar formats are read through pyarrow, which only needs their schema
+
+    Parameters
+    ----------
+    survey_path : pathlib.Path object
+        The path to a .parquet, .feather or .csv file in <data_root>/Surveys
+
+    Returns
+    -------
+    columns : List
+        The names of the columns
+
+    """
+    
+    if survey_path.suffix == ".csv":
+        import pandas as pd
+        return list(pd.read_csv(survey_path, nrows=0).columns)
+    
+    import pyarrow.ipc
+    import pyarrow.parquet
+    
+    if survey_path.suffix == ".parquet":
+        return pyarrow.parquet.read_schema(survey_path).names
+    
+    return pyarrow.ipc.open_file(survey_path).schema.names
+
+def read_survey_columns(survey_path, columns=None):
+    
+    """
+    Reads a processed survey from the given file, loading only the given
+    columns. The format is determined by the extension of the file.
+
+    Parameters
+    ----------
+    survey_path : pathlib.Path object
+        The path to a .parquet, .feather or .csv file in <data_root>/Surveys
+    columns : List, optional
+        The columns to be read, those that aren't in the survey are ignored.
+        The default is None, in which case every column is read.
+
+    Returns
+    -------
+    survey : Pandas.DataFrame object
+        The requested columns of the survey
+
+    """
+    
+    import pandas as pd
+    
+    if survey_path.suffix == ".csv":
+        if columns is None:
+            return pd.read_csv(survey_path)
+        wanted = set(columns)
+        return pd.read_csv(survey_path, usecols=lambda column: column in wanted)
+    
+    if columns is not None:
+        available = get_survey_column_names(survey_path)
+        columns = [column for column in columns if column in available]
+    
+    if survey_path.suffix == ".parquet":
+        return pd.read_parquet(survey_path, columns=columns)
+    
+    return pd.read_feather(survey_path, columns=columns)
+
+@stage("load past survey")
+def load_past_survey(data_root, survey_id, columns=None):
+    
+    """
+    Loads a past survey from <data_root>/Surveys, in whichever of the
+    SURVEY_FORMATS it was saved. Only the requested columns are read.
+    
+    Every past survey is parsed only once per run, later calls return the same
+    DataFrame as long as the file wasn't modified in the meantime and the same
+    columns are requested. The returned DataFrame is shared, it must not be
+    modified by the caller.
+
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    survey_id : String
+        The id of the past survey, as it appears in the Custom Charts parameters
+    columns : List, optional
+        The columns to be read, i.e. AREA and the question ids in the doctree.
+        The default is None, in which case every column is read.
+
+    Returns
+    -------
+    past_survey : Pandas.DataFrame object
+        The requested columns of the past survey
+
+    """
+    
+    survey_path = find_survey_file(data_root, survey_id)
+    if survey_path is None:
+        print("\nError: The past survey " + survey_id + " is not in " + str(data_root / "Surveys"))
+        print("Please check the parameters of the Custom Charts in config.yml")
+        sys.exit(1)
+    
+    mtime = survey_path.stat().st_mtime_ns
+    key = (survey_path, mtime, None if columns is None else tuple(columns))
+    
+    with past_surveys_lock:
+        if survey_id not in past_surveys or past_surveys[survey_id][:3] != key:
+            past_surveys.update( { survey_id : key + (read_survey_columns(survey_path, columns),) } )
+        past_survey = past_surveys[survey_id][3]
+    
+    return past_survey
+
+def get_past_survey_ids(config):
+    
+    """
+    Collects the ids of the past surveys needed by the custom charts that are to be drawn
+
+    Parameters
+    ----------
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+
+    Returns
+    -------
+    survey_ids : List
+        The ids of the past surveys, without repetitions
+
+    """
+    
+    survey_ids = []
+    charts_draw = config["Custom Charts Draw"] or []
+    
+    if "Past Survey Pie" in charts_draw:
+        survey_ids.append(config["Custom Charts"]["Past Survey Pie"]["Parameters"])
+    
+    if "Past Survey Bar" in charts_draw:
+        survey_ids.extend(config["Custom Charts"]["Past Survey Bar"]["Parameters"])
+    
+    return list(dict.fromkeys(survey_ids))
+
+def prefetch_past_surveys(data_root, config, columns=None, skipped_survey_ids=()):
+    
+    """
+    Starts loading the past surveys needed by the custom charts in a background
+    thread, so that they are ready by the time the reports are generated.
+    The thread fills the same cache load_past_survey uses, errors are ignored
+    here and reported by load_past_survey when the survey is actually needed.
+
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+    columns : List, optional
+        The columns to be read, see load_past_survey. The default is None.
+    skipped_survey_ids : List, optional
+        The surveys that aren't loaded, i.e. the survey being processed, which isn't
+        saved yet, and those whose answer counts are read from the aggregate store.
+        The default is ().
+
+    Returns
+    -------
+    thread : threading.Thread object
+        The prefetching thread, it must be joined before generating the reports
+
+    """
+    
+    def prefetch():
+        for survey_id in get_past_survey_ids(config):
+            if survey_id in skipped_survey_ids:
+                continue
+            try:
+                load_past_survey(data_root, survey_id, columns)
+            except (SystemExit, Exception):
+                pass
+    
+    thread = threading.Thread(target=prefetch, daemon=True)
+    thread.start()
+    
+    return thread
+
+def export_queued_charts(export_queue, config, data_root, image_writer=None):
+    
+    """
+    Renders the charts queued while building a document as .png images in memory and
+    puts each image into the run that was reserved for it in the document.
+    If the render cache is enabled in the config file, identical charts are
+    rendered only once and the cached images are reused, see visuals.export_charts.
+    The images are rendered by the Chart Backend in the config file, see visuals.CHART_RENDERERS.
+    
+    If the Chart Backend is DOCX nothing is rendered, each chart is put
+    in its run as a native Word chart, see docxcharts.add_docx_chart.
+
+    Parameters
+    ----------
+    export_queue : List
+        The charts queued by recursive_doctree_generate through visuals.queue_chart,
+        the target of each entry is the docx run that will hold the picture
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    image_writer : Dictionary, optional
+        The writer that saves the images to <data_root>/Visuals in the background,
+        see visuals.start_image_writer. The default is None, in which case the
+        images are only put in the document.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    from io import BytesIO
+    from docx.shared import Cm
+    from visuals import NATIVE_CHART_BACKEND, export_charts
+    
+    chart_backend = config.get("Chart Backend", "Plotly")
+    
+    if chart_backend == NATIVE_CHART_BACKEND:
+        from docxcharts import add_docx_chart
+        for entry in export_queue:
+            with stage("add docx chart"):
+                add_docx_chart(entry["target"], entry["chart"], Cm(15.0))
+        export_queue.clear()
+        return
+    
+    render_cache = config.get("Render Cache")
+    
+    with stage("export charts"):
+        if render_cache and render_cache["Enabled"]:
+            # Maximum Size is given in MB in the config file
+            maximum_size = int(render_cache["Maximum Size"] * 1024 * 1024)
+            exported = export_charts(export_queue, data_root / RENDER_CACHE_FROM_ROOT, maximum_size,
+                                     chart_backend=chart_backend, image_writer=image_writer)
+        else:
+            exported = export_charts(export_queue, chart_backend=chart_backend, image_writer=image_writer)
+    
+    for entry in exported:
+        with stage("add picture"):
+            entry["target"].add_picture(BytesIO(entry["image"]), width = Cm(15.0))
+    
+    return
+
+def recursive_doctree_generate(dictionary, doc, working_survey, answer_counts, survey_id, area, config, question_store, styles_dictionary, data_root, export_queue, level):
     
     """
     Gets called from generate_docs for each area in the config file. Takes the document draft and puts in
@@ -61,6 +482,9 @@ def recursive_doctree_generate(dictionary, doc, working_survey, survey_id, area,
     working_survey : Pandas.DataFrame object
         A modified survey that has the question ids instead of the question texts
         for those questions that are in the working question store
+    answer_counts : Dictionary
+        The answer counts of the current survey and of the past surveys used by the
+        custom charts as { survey_id : answer counts }, see build_answer_counts
     survey_id : String
         A unique identifier of the survey, generated as 'year-month'
     area : String
@@ -80,6 +504,10 @@ def recursive_doctree_generate(dictionary, doc, working_survey, survey_id, area,
         and the paragraphs
     data_root : pathlib.Path object
         The OS agnostic path to the data root
+    export_queue : List
+        The charts are not rendered right away, a run is reserved for each chart
+        in the document and the chart is put in this queue together with its run,
+        the caller exports the whole queue at once, see export_queued_charts
     level : int
         Recursion level
 
@@ -90,6 +518,8 @@ def recursive_doctree_generate(dictionary, doc, working_survey, survey_id, area,
 
     """
     
+    from visuals import pie_chart_data, stacked_bar_data, queue_chart
+    
     if level > 3:
         print("Warning: The doctree is too deep, the style of the document may be inconsistent...")
         heading_style = "Heading " + level
@@ -129,18 +559,18 @@ def recursive_doctree_generate(dictionary, doc, working_survey, survey_id, area,
                     textinfo = textinfo_value + textinfo_percent + textinfo_label
                     
                     # DEFAULT PIE CHART
-                    default_pie_values = working_survey[working_survey.AREA == area][question_id].value_counts()
+                    default_pie_values = get_answer_counts(answer_counts[survey_id], question_id, area)
                     
-                    default_pie_figure = draw_pie(question=question,
-                                                  values=default_pie_values,
-                                                  config=config,
-                                                  date=survey_id,
-                                                  area=area,
-                                                  textinfo=textinfo)
+                    default_pie_chart = pie_chart_data(question=question,
+                                                       values=default_pie_values,
+                                                       config=config,
+                                                       date=survey_id,
+                                                       area=area,
+                                                       textinfo=textinfo)
                     
                     default_pie_path = data_root / "Visuals" / survey_id / area / (question_id + "-D.png")
-                    default_pie_figure.write_image(default_pie_path.absolute().resolve().__str__(), scale=config["Document Data Visual Resolution Multiplier"])
-                    doc.add_picture(default_pie_path.absolute().resolve().__str__(), width = Cm(15.0))
+                    queue_chart(export_queue, default_pie_chart, default_pie_path,
+                                config["Document Data Visual Resolution Multiplier"], doc.add_paragraph().add_run())
                     
                     
                     # CUSTOM CHARTS
@@ -149,7 +579,7 @@ def recursive_doctree_generate(dictionary, doc, working_survey, survey_id, area,
                         
                         if "Global Pie" in config["Custom Charts Draw"]:
                             # Global Pie Chart Variables
-                            global_pie_values = working_survey[question_id].value_counts()
+                            global_pie_values = get_answer_counts(answer_counts[survey_id], question_id)
                             custom_pie_charts.update( { "Global Pie" : { "values" : global_pie_values,
                                                                          "date" : survey_id,
                                                                          "area" : "Associtazione" } } )
@@ -157,9 +587,7 @@ def recursive_doctree_generate(dictionary, doc, working_survey, survey_id, area,
                         if "Past Survey Pie" in config["Custom Charts Draw"]:
                             # Past Survey Pie Chart Variables
                             past_survey_id = config["Custom Charts"]["Past Survey Pie"]["Parameters"]
-                            source_csv = data_root / "Surveys" / (past_survey_id + ".csv")
-                            past_survey = pd.read_csv(source_csv)
-                            past_pie_values = past_survey[past_survey.AREA == area][question_id].value_counts()
+                            past_pie_values = get_answer_counts(answer_counts[past_survey_id], question_id, area)
                             custom_pie_charts.update( { "Past Survey Pie" : { "values" : past_pie_values,
                                                                               "date" : past_survey_id,
                                                                               "area" : area } } )
@@ -169,34 +597,32 @@ def recursive_doctree_generate(dictionary, doc, working_survey, survey_id, area,
                             past_survey_id_list = config["Custom Charts"]["Past Survey Bar"]["Parameters"]
                             past_bar_values = []
                             for id_code in past_survey_id_list:
-                                source_csv = data_root / "Surveys" / (id_code + ".csv")
-                                df = pd.read_csv(source_csv)
-                                past_bar_values.append(df[df.AREA == area][question_id].value_counts())
+                                past_bar_values.append(get_answer_counts(answer_counts[id_code], question_id, area))
                         
                         for chart in config["Custom Charts Draw"]:
                             if chart.strip().lower().endswith("pie"):
-                                figure = draw_pie(question=question,
-                                                  values=custom_pie_charts[chart]["values"],
-                                                  config=config,
-                                                  date=custom_pie_charts[chart]["date"],
-                                                  area=custom_pie_charts[chart]["area"],
-                                                  textinfo=textinfo)
+                                chart_data = pie_chart_data(question=question,
+                                                            values=custom_pie_charts[chart]["values"],
+                                                            config=config,
+                                                            date=custom_pie_charts[chart]["date"],
+                                                            area=custom_pie_charts[chart]["area"],
+                                                            textinfo=textinfo)
                 
                                 chart_id = config["Custom Charts"][chart]["ID"].strip()
                                 path = data_root / "Visuals" / survey_id / area / (question_id + "-" + chart_id + ".png")
-                                figure.write_image(path.absolute().resolve().__str__(), scale=config["Document Data Visual Resolution Multiplier"])
-                                doc.add_picture(path.absolute().resolve().__str__(), width = Cm(15.0))
+                                queue_chart(export_queue, chart_data, path,
+                                            config["Document Data Visual Resolution Multiplier"], doc.add_paragraph().add_run())
                             
                             elif chart.strip().lower().endswith("bar"):
-                                figure = draw_stacked_bar(question=question,
-                                                          values=past_bar_values,
-                                                          config=config,
-                                                          dates=past_survey_id_list)
+                                chart_data = stacked_bar_data(question=question,
+                                                              values=past_bar_values,
+                                                              config=config,
+                                                              dates=past_survey_id_list)
                                 
                                 chart_id = config["Custom Charts"][chart]["ID"].strip()
                                 path = data_root / "Visuals" / survey_id / area / (question_id + "-" + chart_id + ".png")
-                                figure.write_image(path.absolute().resolve().__str__(), scale=config["Document Data Visual Resolution Multiplier"])
-                                doc.add_picture(path.absolute().resolve().__str__(), width = Cm(15.0))
+                                queue_chart(export_queue, chart_data, path,
+                                            config["Document Data Visual Resolution Multiplier"], doc.add_paragraph().add_run())
                         
             if "Comments" in value:
                 heading_level = "heading" + str(level+1)
@@ -228,20 +654,110 @@ def recursive_doctree_generate(dictionary, doc, working_survey, survey_id, area,
                     if isinstance(comment, str) and len(comment) > 2:
                         doc.add_paragraph(comment, style="ListBullet")
             else:
-                doc = recursive_doctree_generate(dictionary[key], doc, working_survey, survey_id, area, config, question_store, styles_dictionary, data_root, level+1)
+                doc = recursive_doctree_generate(dictionary[key], doc, working_survey, answer_counts, survey_id, area, config, question_store, styles_dictionary, data_root, export_queue, level+1)
             
 
     return doc
 
-def generate_docs(data_root, survey_id, working_survey, config, working_doctree, question_store):
+def add_document_style(styles, name, style_config, base_style=None):
     
     """
-    Goes through the config file and implements the preferences of the user.
-    Creates the documents for the areas, takes care of the styles.
-    Calls recursive_doctree_generate to parse the doctree and generate the visuals.
+    Adds a paragraph style to the styles of a document, with the font, size,
+    boldness and color given in its section of the config file
+
+    Parameters
+    ----------
+    styles : docx.styles.styles.Styles object
+        The styles of the document
+    name : String
+        The name of the new style
+    style_config : Dictionary
+        The section of the config file that describes the style
+    base_style : String, optional
+        The name of the style the new one is based on. The default is None.
+
+    Returns
+    -------
+    style : docx.styles.style.ParagraphStyle object
+        The new style
+
+    """
+    
+    from docx.shared import Pt, RGBColor
+    from docx.enum.style import WD_STYLE_TYPE
+    
+    style = styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+    if base_style is not None:
+        style.base_style = styles[base_style]
+    style.font.name = style_config["Font"]
+    style.font.size = Pt(style_config["Font Size"])
+    style.font.bold = style_config["Bold"]
+    color_hex = style_config["Font Color"].strip("#")
+    rgb_tuple = tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
+    style.font.color.rgb = RGBColor(*rgb_tuple)
+    
+    return style
+
+def build_base_document(config, date_string):
+    
+    """
+    Builds the part of the documents that is the same for every area: the styles
+    listed in DOCUMENT_STYLES, the title and the date. It is built once per survey
+    and every area starts from a copy of it, see generate_area_doc.
+
+    Parameters
+    ----------
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+    date_string : String
+        The date that will appear under the title of the documents
+
+    Returns
+    -------
+    base_document : bytes
+        The saved .docx file
+
+    """
+    
+    from io import BytesIO
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    
+    doc = Document()
+    
+    for name, config_section, base_style in DOCUMENT_STYLES:
+        add_document_style(doc.styles, name, config[config_section], base_style)
+    
+    config_document_title = config["Document Title"]
+    document_title = doc.add_heading(config_document_title["Text"], level=1)
+    document_title.style = doc.styles["title style"]
+    if config_document_title["Middle Aligned"]:
+        document_title.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    
+    document_date = doc.add_paragraph(date_string)
+    document_date.style = doc.styles["date style"]
+    
+    buffer = BytesIO()
+    doc.save(buffer)
+    
+    return buffer.getvalue()
+
+def generate_area_doc(area, data_root, survey_id, working_survey, answer_counts, config, working_doctree, question_store, base_document):
+    
+    """
+    Creates the document of a single area starting from a copy of the base document,
+    which already has the styles, the title and the date, and calls
+    recursive_doctree_generate to parse the doctree and generate the visuals.
+    The document is saved to <data_root>/Templates/<survey_id>/<area>.docx
+    
+    Gets called by generate_docs, either directly or in a worker process when
+    parallel generation is enabled in the config file. It only reads its
+    inputs, so the areas can be generated independently of each other.
 
     Parameters
     ----------
+    area : String
+        The area of HKN whose report is to be generated
     data_root : pathlib.Path object
         The OS agnostic path to the data root
     survey_id : String
@@ -249,232 +765,822 @@ def generate_docs(data_root, survey_id, working_survey, config, working_doctree,
     working_survey : Pandas.DataFrame object
         A modified survey that has the question ids instead of the question texts
         for those questions that are in the working question store
+    answer_counts : Dictionary
+        The answer counts of the current survey and of the past surveys used by the
+        custom charts as { survey_id : answer counts }, see build_answer_counts
     config : Dictionary
         The contents of the config.yml file as a Python dictionary
     working_doctree : Dictionary
-        This variable holds the updated and modified doctree. The questions appearing in the original
-        doctree that were chosen not to be registered into the store will NOT be in the working_doctree.
-        The question texts of those questions that were in the question store or were registered by the program
-        in real time are replaced with their corresponding question ids
+        The doctree with the question ids instead of the question texts, see generate_docs
     question_store : Dictionary
         The question store is a dictionary whose primary purpose is to store the
         mapping { question_id : question_text } along with data relating to the
         questions' history and other internal data
+    base_document : bytes
+        The .docx file the documents of all of the areas start from, see build_base_document
+
+    Returns
+    -------
+    area : String
+        The area whose report was generated
+
+    """
+    
+    from io import BytesIO
+    from docx import Document
+    from visuals import NATIVE_CHART_BACKEND, start_image_writer, stop_image_writer
+    
+    doc = Document(BytesIO(base_document))
+    styles = doc.styles
+    
+    metadata_style = styles["metadata style"]
+    disclaimer_style = styles["disclaimer style"]
+    heading1_style = styles["heading1 style"]
+    heading2_style = styles["heading2 style"]
+    heading3_style = styles["heading3 style"]
+    paragraph_style = styles["paragraph style"]
+    
+    respondents = answer_counts[survey_id]["area totals"].get(area, 0)
+    metadata_string = "Relatore: \n" "Area: " + area + "\nCompilazioni ottenute: " + str(respondents)
+    document_metadata = doc.add_paragraph(metadata_string)
+    document_metadata.style = metadata_style
+    
+    document_disclaimer = doc.add_paragraph(config["Document Disclaimer"]["Text"])
+    document_disclaimer.style = disclaimer_style
+    
+    styles_dictionary = { "heading1" : heading1_style,
+                          "heading2" : heading2_style,
+                          "heading3" : heading3_style,
+                          "paragraph" : paragraph_style }
+    export_queue = []
+    doc = recursive_doctree_generate(working_doctree, doc, working_survey, answer_counts, survey_id, area, config, question_store, styles_dictionary, data_root, export_queue, 1)
+    
+    # The images go straight from the renderer into the document, saving
+    # them to the Visuals folder happens in the background
+    image_writer = None
+    if config.get("Save Chart Images", True) and config.get("Chart Backend", "Plotly") != NATIVE_CHART_BACKEND:
+        image_writer = start_image_writer()
+    
+    # Renders all of the charts of the area in batches
+    export_queued_charts(export_queue, config, data_root, image_writer)
+    
+    if config["Document Conclusion Tree"]:
+        document_conclusion = doc.add_heading("Conclusion", level=1)
+        document_conclusion.style = heading1_style
+        conclusion_headings = []
+        conclusion_paragraphs = []
+        for section in working_doctree:
+            conclusion_headings.append(doc.add_heading(section, level=2))
+            conclusion_paragraphs.append(doc.add_paragraph(section + " summary"))
         
-        The question store is initially read from <data_root>/AppData/question_store.yml
+        for heading in conclusion_headings:
+            heading.style = heading2_style
+        
+        
+    with stage("save document"):
+        doc.save(data_root / "Templates" / survey_id / (area + ".docx"))
+    
+    if image_writer is not None:
+        with stage("wait for image writer"):
+            stop_image_writer(image_writer)
+    
+    return area
+
+def get_doctree_comment_fields(dictionary):
+    
+    """
+    Recursively collects the survey columns used as comments in the working doctree
+
+    Parameters
+    ----------
+    dictionary : Dictionary
+        The working doctree, or one of its subtrees
+
+    Returns
+    -------
+    fields : List
+        The column names, without repetitions
+
+    """
+    
+    fields = []
+    for key,value in dictionary.items():
+        if key == "Comments" and isinstance(value, list):
+            fields.extend(field.strip() for field in value)
+        elif isinstance(value, dict):
+            fields.extend(get_doctree_comment_fields(value))
+    
+    return list(dict.fromkeys(fields))
+
+def get_area_input_hash(area, survey_id, working_survey, answer_counts, config, working_doctree, question_store, date_string):
+    
+    """
+    Computes the hash of everything the document of an area is generated from:
+    the answer counts of the area and the global ones, for the current survey and
+    the past surveys, the comments of the area, the config file apart from the
+    EXECUTION_CONFIG_SECTIONS, the working doctree, the current texts of its
+    questions and the date of the document. Two runs with the same hash produce
+    the same document.
+
+    Parameters
+    ----------
+    area : String
+        The area of HKN whose report is to be generated
+    survey_id : String
+        A unique identifier of the survey, generated as 'year-month'
+    working_survey : Pandas.DataFrame object
+        The survey with the question ids instead of the question texts
+    answer_counts : Dictionary
+        { survey_id : answer counts }, see build_answer_counts
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+    working_doctree : Dictionary
+        The doctree with the question ids instead of the question texts
+    question_store : Dictionary
+        The question store
+    date_string : String
+        The date that will appear under the title of the document
+
+    Returns
+    -------
+    input_hash : String
+        Hexadecimal SHA-256 digest of the inputs
+
+    """
+    
+    import hashlib
+    
+    digest = hashlib.sha256()
+    
+    def update(value):
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    
+    update([MANIFEST_VERSION, area, survey_id, date_string])
+    update({ key : value for key, value in config.items() if key not in EXECUTION_CONFIG_SECTIONS })
+    update(working_doctree)
+    
+    question_ids = get_doctree_question_ids(working_doctree)
+    update({ question_id : question_store[question_id]["current"] for question_id in question_ids })
+    update([question_id for question_id in question_ids if question_id in working_survey.columns])
+    
+    for counts_survey_id in sorted(answer_counts):
+        counts = answer_counts[counts_survey_id]
+        update([counts_survey_id, counts["choices"], counts["questions"], counts["total"]])
+        digest.update(counts["global counts"].tobytes())
+        if area in counts["areas"]:
+            update(int(counts["area totals"].get(area, 0)))
+            digest.update(counts["area counts"][counts["areas"][area]].tobytes())
+    
+    comment_fields = [field for field in get_doctree_comment_fields(working_doctree) if field in working_survey.columns]
+    comments = working_survey.loc[working_survey.AREA == area, comment_fields]
+    update([comments[field].tolist() for field in comment_fields])
+    
+    return digest.hexdigest()
+
+def load_manifest(data_root, survey_id):
+    
+    """
+    Reads the manifest of the survey written by the last run of the incremental
+    generation, { area : input hash } for every area whose document was generated
+
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    survey_id : String
+        A unique identifier of the survey, generated as 'year-month'
+
+    Returns
+    -------
+    manifest : Dictionary
+        { area : input hash }, empty if the survey was never generated
+
+    """
+    
+    try:
+        with open(data_root / MANIFESTS_FROM_ROOT / (survey_id + ".json"), "r", encoding="utf-8") as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(data_root, survey_id, manifest):
+    
+    """
+    Writes the manifest of the survey, see load_manifest. It is written into a
+    temporary file first, so an interrupted write can't leave a broken manifest.
+
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    survey_id : String
+        A unique identifier of the survey, generated as 'year-month'
+    manifest : Dictionary
+        { area : input hash }
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    manifest_path = data_root / MANIFESTS_FROM_ROOT / (survey_id + ".json")
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    
+    with open(temporary_path, "w", encoding="utf-8") as fd:
+        json.dump(manifest, fd, indent=4, sort_keys=True)
+    os.replace(temporary_path, manifest_path)
+    
+    return
+
+def generate_docs(data_root, survey_id, working_survey, answer_counts, config, working_doctree, question_store, executor=None):
+    
+    """
+    Goes through the config file and implements the preferences of the user.
+    Creates the documents for the areas by calling generate_area_doc for each area.
+    
+    If incremental generation is enabled in the config file, the areas whose inputs
+    didn't change since the last run, see get_area_input_hash, are skipped.
+    
+    If parallel generation is enabled in the config file, every area is generated
+    in a separate worker process. The documents are identical to the ones of the
+    serial path, if any of the areas fails the program stops with an error.
+    The worker processes are started here unless an executor is passed,
+    the batch mode passes one so that they are shared by all of its surveys.
+
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    survey_id : String
+        A unique identifier of the survey, generated as 'year-month'
+    working_survey : Pandas.DataFrame object
+        A modified survey that has the question ids instead of the question texts
+        for those questions that are in the working question store
+    answer_counts : Dictionary
+        The answer counts of the current survey and of the past surveys used by the
+        custom charts as { survey_id : answer counts }, see build_answer_counts
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+    working_doctree : Dictionary
+        This variable holds the updated and modified doctree. The questions appearing in the original
+        doctree that were chosen not to be registered into the store will NOT be in the working_doctree.
+        The question texts of those questions that were in the question store or were registered by the program
+        in real time are replaced with their corresponding question ids
+    question_store : Dictionary
+        The question store is a dictionary whose primary purpose is to store the
+        mapping { question_id : question_text } along with data relating to the
+        questions' history and other internal data
+        
+        The question store is initially read from <data_root>/AppData/question_store.yml
+    executor : concurrent.futures.ProcessPoolExecutor, optional
+        The worker processes used when parallel generation is enabled.
+        The default is None, in which case they are started for this survey only.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    from datetime import date
+    from concurrent.futures import ProcessPoolExecutor
+    from visuals import start_chart_renderer
+    areas_list = config["Areas"]
+    
+    if config["Document Date"]["Today"]:
+        date_string = date.today().strftime("%B %Y")
+    else:
+        months = { "01" : "January", "02" : "February", "03" : "March", "04" : "April",
+                  "05" : "May", "06" : "June", "07" : "July", "08" : "August", "09" : "September",
+                  "10" : "October", "11" : "November", "12" : "December" }
+        date_string = months[survey_id.split("-")[1]] + " " + survey_id.split("-")[0]
+        
+    print("\nThis may take a minute, sit back and relax...\n")
+    
+    # Only the areas whose inputs changed since the last run are generated again
+    incremental_generation = config.get("Incremental Generation")
+    if incremental_generation and incremental_generation["Enabled"]:
+        manifest = load_manifest(data_root, survey_id)
+        input_hashes = {}
+        for area in areas_list:
+            input_hashes.update( { area : get_area_input_hash(area, survey_id, working_survey, answer_counts, config,
+                                                              working_doctree, question_store, date_string) } )
+        
+        changed_areas = []
+        for area in areas_list:
+            document_path = data_root / "Templates" / survey_id / (area + ".docx")
+            if manifest.get(area) == input_hashes[area] and document_path.is_file():
+                print("Report for Area " + area + " is up to date...")
+            else:
+                changed_areas.append(area)
+        areas_list = changed_areas
+    
+    # The styles, the title and the date are the same for every area, they are
+    # put in the base document once and every area starts from a copy of it
+    with stage("build base document"):
+        base_document = build_base_document(config, date_string)
+    
+    parallel_generation = config.get("Parallel Generation")
+    
+    if parallel_generation and parallel_generation["Enabled"]:
+        workers = parallel_generation["Workers"] or os.cpu_count()
+        
+        # The workers only need the current texts of the questions in the doctree,
+        # the question store itself may be an open database that can't be shared
+        worker_question_store = {}
+        for question_id in get_doctree_question_ids(working_doctree):
+            worker_question_store.update( { question_id : { "current" : question_store[question_id]["current"] } } )
+        
+        # Every worker keeps its own renderer running for all of the areas it generates
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=start_chart_renderer,
+                                           initargs=(config.get("Chart Backend", "Plotly"),))
+        
+        futures = []
+        for area in areas_list:
+            if is_profiling():
+                # The worker records its own timings and hands them back with the result
+                futures.append(executor.submit(profiled_call, "generate area", area, get_cprofile_path(area),
+                                               generate_area_doc, area, data_root, survey_id, working_survey, answer_counts,
+                                               config, working_doctree, worker_question_store, base_document))
+            else:
+                futures.append(executor.submit(generate_area_doc, area, data_root, survey_id, working_survey, answer_counts,
+                                               config, working_doctree, worker_question_store, base_document))
+        
+        # The results are collected in the order of the areas so that the
+        # output doesn't depend on which worker finishes first
+        for area, future in zip(areas_list, futures):
+            try:
+                result = future.result()
+                if is_profiling():
+                    merge_profile_stats(result[1])
+            except Exception as e:
+                print("\nError: Failed to generate the report for Area " + area + ": " + repr(e))
+                executor.shutdown(wait=True, cancel_futures=True)
+                sys.exit(1)
+            print("Generated report for Area " + area + "...")
+        
+        if own_executor:
+            executor.shutdown()
+    else:
+        start_chart_renderer(config.get("Chart Backend", "Plotly"))
+        for area in areas_list:
+            print("Generating report for Area " + area + "...")
+            with stage("generate area"):
+                run_with_cprofile(area, generate_area_doc, area, data_root, survey_id, working_survey, answer_counts,
+                                  config, working_doctree, question_store, base_document)
+    
+    # Every area was generated successfully if we got here
+    if incremental_generation and incremental_generation["Enabled"]:
+        for area in areas_list:
+            manifest.update( { area : input_hashes[area] } )
+        save_manifest(data_root, survey_id, manifest)
+        
+    return
+
+def iter_survey_chunks(survey_csv, original_columns, working_columns, columns, question_ids, config, text=False):
+    
+    """
+    Reads the given columns of the survey csv file, CSV_CHUNK_SIZE rows at a time.
+    The other columns are skipped by the parser and never loaded, and the answers of
+    each chunk are encoded as categoricals of the Available Choices by encode_answers
+    before the chunk is handed over.
+
+    Parameters
+    ----------
+    survey_csv : pathlib.Path object
+        The survey csv file
+    original_columns : List
+        The column names in the header of the csv file
+    working_columns : List
+        The same columns renamed by process_survey, in the same order
+    columns : List
+        The names of the working columns to be read, those that aren't in the
+        survey are ignored
+    question_ids : List
+        The question ids whose answers are to be encoded
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+    text : bool, optional
+        Whether the columns that aren't encoded are read as text instead of
+        letting pandas guess their types. The default is False.
+
+    Yields
+    ------
+    chunk : Pandas.DataFrame object
+        The next rows of the survey with the working column names, holding only
+        the requested columns. A survey without answers yields its empty header.
+
+    """
+    
+    import pandas as pd
+    
+    renamed = dict(zip(original_columns, working_columns))
+    wanted = set(columns)
+    usecols = [original for original, working in renamed.items() if working in wanted]
+    # The answers are read as categories straight away instead of as strings
+    dtype = { original : "category" if renamed[original] in question_ids else str
+              for original in usecols if text or renamed[original] in question_ids }
+    
+    empty = True
+    for chunk in pd.read_csv(survey_csv, usecols=usecols, dtype=dtype, chunksize=CSV_CHUNK_SIZE):
+        chunk.columns = [renamed[original] for original in chunk.columns]
+        empty = False
+        yield encode_answers(chunk, question_ids, config)
+    
+    if empty:
+        # The survey has no answers
+        header = pd.read_csv(survey_csv, usecols=usecols, dtype=dtype, nrows=0)
+        header.columns = [renamed[original] for original in header.columns]
+        yield encode_answers(header, question_ids, config)
+
+@stage("read survey")
+def read_survey_csv(survey_csv, original_columns, working_columns, columns, question_ids, config):
+    
+    """
+    Reads the given columns of the survey csv file, see iter_survey_chunks. Only the
+    small integer codes of the answers are kept in memory, however long the survey is.
+
+    Parameters
+    ----------
+    survey_csv : pathlib.Path object
+        The survey csv file
+    original_columns : List
+        The column names in the header of the csv file
+    working_columns : List
+        The same columns renamed by process_survey, in the same order
+    columns : List
+        The names of the working columns to be read, those that aren't in the
+        survey are ignored
+    question_ids : List
+        The question ids whose answers are to be encoded
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+
+    Returns
+    -------
+    working_survey : Pandas.DataFrame object
+        The survey with the working column names, holding only the requested columns
+
+    """
+    
+    import pandas as pd
+    
+    chunks = list(iter_survey_chunks(survey_csv, original_columns, working_columns, columns, question_ids, config))
+    if len(chunks) == 1:
+        return chunks[0]
+    
+    return pd.concat(chunks, ignore_index=True)
+
+@stage("process survey")
+def process_survey(survey_id, question_store, working_inverted_question_store, survey):
+    
+    """
+    First strips the questions in the survey from leading, trailing white space and
+    any question numbers that may be present (i.e '2) ' ).
+    Then, for every column name in the DataFrame, it checks to see if the question
+    is in the working_inverted_question_store, if the question is there, the question
+    text is replaced by the question id to facilitate further processing and future
+    reference.
+
+    Parameters
+    ----------
+    survey_id : String
+        A unique identifier of the survey, generated as 'year-month'
+    question_store : Dictionary
+        The question store is a dictionary whose primary purpose is to store the
+        mapping { question_id : question_text } along with data relating to the
+        questions' history and other internal data
+        
+        The question store is initially read from <data_root>/AppData/question_store.yml
+    working_inverted_question_store : store.TextIndex
+        The working_inverted_question_store contains the same type of mapping that
+        inverted_question_store has, however the working_inverted_question_store may also contain
+        newly registered questions that were taken from the doctree. Also any question not found
+        in the doctree will NOT be in the working_inverted_question_store even if it is in
+        the inverted_question_store.
+    survey : Pandas.DataFrame object
+        The contents of the csv file as a Pandas Data Frame object, only its columns
+        are used so the header alone will do
+
+    Returns
+    -------
+    question_store : Dictionary
+        The question store is a dictionary whose primary purpose is to store the
+        mapping { question_id : question_text } along with data relating to the
+        questions' history and other internal data
+        
+        The question store is initially read from <data_root>/AppData/question_store.yml
+    working_survey : Pandas.DataFrame object
+        A modified survey that has the question ids instead of the question texts
+        for those questions that are in the working question store
+
+    """
+    
+    new_column_names = []
+    for column in survey.columns:
+        # Remove the leading 'n) ' for the questions that have it
+        question = column.strip('1234567890) ')
+        
+        # If this is a question that's in the working question store updates
+        # the question's history in the store and replaces the question
+        # text in the csv file with its question id
+        question_id = working_inverted_question_store.find(question)
+        if question_id is not None:
+            question_store[question_id].update( { survey_id : question } )
+            question = question_id
+        
+        new_column_names.append(question)
+   
+    survey.columns = new_column_names
+    working_survey = survey
+    
+    return question_store, working_survey
+
+
+def get_doctree_question_ids(dictionary):
+    
+    """
+    Recursively collects the question ids in the working doctree
+
+    Parameters
+    ----------
+    dictionary : Dictionary
+        The working doctree, or one of its subtrees
+
+    Returns
+    -------
+    question_ids : List
+        The question ids in the order they appear in the doctree, without repetitions
+
+    """
+    
+    question_ids = []
+    for key,value in dictionary.items():
+        if not isinstance(value, dict):
+            pass
+        elif "Questions" in value:
+            question_ids.extend(value["Questions"])
+        else:
+            question_ids.extend(get_doctree_question_ids(value))
+    
+    return list(dict.fromkeys(question_ids))
+
+def encode_answers(survey, question_ids, config):
+    
+    """
+    Converts the answers to the given questions into Pandas Categoricals whose categories
+    are the Available Choices in the config file, in the same order. Each answer is then
+    stored as a small integer code instead of a string and counting the answers becomes
+    counting the codes.
+    
+    Every answer must be one of the Available Choices, if it isn't the program exits.
+    
+    The given survey isn't modified, the encoded columns are put into a shallow copy.
+
+    Parameters
+    ----------
+    survey : Pandas.DataFrame object
+        A survey that has the question ids instead of the question texts,
+        either the working survey or a past survey
+    question_ids : List
+        The question ids whose answers are to be encoded, those that aren't
+        in the survey are ignored
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+
+    Returns
+    -------
+    encoded_survey : Pandas.DataFrame object
+        The survey with the encoded answers
+
+    """
+    
+    import pandas as pd
+    
+    options = config['Available Choices']
+    choices = list(options)
+    
+    encoded_survey = survey.copy(deep=False)
+    for question_id in question_ids:
+        if question_id not in survey.columns:
+            continue
+        
+        column = survey[question_id]
+        if isinstance(column.dtype, pd.CategoricalDtype) and list(column.cat.categories) == choices:
+            continue
+        
+        for answer in column.dropna().unique():
+            if answer not in options:
+                print(str(answer) + " given to the question " + question_id + " is not "
+                      "a valid answer, check the spelling, exiting...")
+                sys.exit(1)
+        
+        encoded_survey[question_id] = pd.Categorical(column, categories=choices)
+    
+    return encoded_survey
+
+@stage("count answers")
+def build_answer_counts(survey, question_ids, config):
+    
+    """
+    Counts the answers given to the questions of the survey in a single pass,
+    so that the charts don't have to slice the survey area by area and question
+    by question. The answers are encoded first, see encode_answers.
+    
+    The answer counts are a dictionary with the following keys:
+        
+        - "choices" : List, the Available Choices in the order of the config file
+        - "areas" : Dictionary { area : position of the area in "area counts" }
+        - "questions" : Dictionary { question id : position of the question in the counts }
+        - "area counts" : numpy array of shape (areas, questions, choices)
+        - "global counts" : numpy array of shape (questions, choices), the answers
+          of every respondent, including those that have no area
+        - "area totals" : Pandas.Series indexed by area, the number of respondents
+        - "total" : int, the number of respondents
+    
+    Use get_answer_counts to read the counts of a single question.
+
+    Parameters
+    ----------
+    survey : Pandas.DataFrame object
+        A survey that has the question ids instead of the question texts,
+        either the working survey or a past survey
+    question_ids : List
+        The question ids whose answers are to be counted, those that aren't
+        in the survey are ignored
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+
+    Returns
+    -------
+    answer_counts : Dictionary
+        The answer counts of the survey, see above
+
+    """
+    
+    import numpy as np
+    import pandas as pd
+    
+    question_ids = [question_id for question_id in question_ids if question_id in survey.columns]
+    survey = encode_answers(survey, question_ids, config)
+    choices = list(config['Available Choices'])
+    
+    # area_codes is -1 for the respondents that have no area
+    area_codes, areas = pd.factorize(survey.AREA)
+    
+    n_areas = len(areas)
+    n_questions = len(question_ids)
+    n_choices = len(choices)
+    
+    # One row per respondent, one column per question, -1 where there is no answer
+    answer_codes = np.empty((len(survey.index), n_questions), dtype=np.int64)
+    for j, question_id in enumerate(question_ids):
+        answer_codes[:, j] = survey[question_id].cat.codes.to_numpy()
+    question_codes = np.broadcast_to(np.arange(n_questions), answer_codes.shape)
+    area_codes = np.broadcast_to(area_codes[:, None], answer_codes.shape)
+    
+    # Every (area, question, answer) triple is flattened into a single bin
+    answered = answer_codes >= 0
+    global_bins = question_codes[answered] * n_choices + answer_codes[answered]
+    global_counts = np.bincount(global_bins, minlength=n_questions * n_choices).reshape(n_questions, n_choices)
+    
+    in_area = answered & (area_codes >= 0)
+    area_bins = (area_codes[in_area] * n_questions + question_codes[in_area]) * n_choices + answer_codes[in_area]
+    area_counts = np.bincount(area_bins, minlength=n_areas * n_questions * n_choices).reshape(n_areas, n_questions, n_choices)
+    
+    answer_counts = { "choices" : choices,
+                      "areas" : { area : i for i, area in enumerate(areas) },
+                      "questions" : { question_id : j for j, question_id in enumerate(question_ids) },
+                      "area counts" : area_counts,
+                      "global counts" : global_counts,
+                      "area totals" : survey.AREA.value_counts(),
+                      "total" : len(survey.index) }
+    
+    return answer_counts
+
+@stage("area aggregation")
+def get_answer_counts(answer_counts, question_id, area=None):
+    
+    """
+    Reads the counts of the answers given to a question from the answer counts
+    built by build_answer_counts
+
+    Parameters
+    ----------
+    answer_counts : Dictionary
+        The answer counts of a survey, see build_answer_counts
+    question_id : String
+        The question whose answers are needed
+    area : String, optional
+        The area whose answers are needed. The default is None, in which case
+        the answers of all of the respondents are counted.
+
+    Returns
+    -------
+    values : Pandas.Series
+        The number of times each answer was given, indexed by the answers in the
+        order of the Available Choices, answers nobody gave are left out
+
+    """
+    
+    import pandas as pd
+    
+    if question_id not in answer_counts["questions"]:
+        # The question isn't in the survey
+        return pd.Series(dtype="int64")
+    
+    j = answer_counts["questions"][question_id]
+    if area is None:
+        counts = answer_counts["global counts"][j]
+    elif area in answer_counts["areas"]:
+        counts = answer_counts["area counts"][answer_counts["areas"][area], j]
+    else:
+        # Nobody from the area took the survey
+        return pd.Series(dtype="int64")
+    
+    given = counts.nonzero()[0]
+    values = pd.Series(counts[given], index=[answer_counts["choices"][k] for k in given])
+    
+    return values
+
+@stage("read aggregate")
+def read_aggregated_answer_counts(data_root, survey_id, question_ids, config):
+    
+    """
+    Reads the answer counts of a past survey from the aggregate store instead of
+    counting them from the survey, see aggregates.py
+
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    survey_id : String
+        The id of the past survey
+    question_ids : List
+        The question ids whose answers are needed
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
 
     Returns
     -------
-    None.
+    answer_counts : Dictionary or None
+        The answer counts of the survey, see build_answer_counts. None if the survey has no
+        aggregate, its aggregate is out of date or doesn't have all of the questions, the
+        answers must then be counted from the survey.
 
     """
-    areas_list = config["Areas"]
     
-    if config["Document Date"]["Today"]:
-        date_string = date.today().strftime("%B %Y")
-    else:
-        months = { "01" : "January", "02" : "February", "03" : "March", "04" : "April",
-                  "05" : "May", "06" : "June", "07" : "July", "08" : "August", "09" : "September",
-                  "10" : "October", "11" : "November", "12" : "December" }
-        date_string = months[survey_id.split("-")[1]] + " " + survey_id.split("-")[0]
-        
-    print("\nThis may take a minute, sit back and relax...\n")
-
+    survey_path = find_survey_file(data_root, survey_id)
+    aggregate = load_aggregate(data_root, survey_id)
     
-    for area in areas_list:
-        print("Generating report for Area " + area + "...")
-        doc = Document()
-        styles = doc.styles
-        
-        # Title Style
-        config_document_title = config["Document Title"]
-        title_style = styles.add_style("title style", WD_STYLE_TYPE.PARAGRAPH)
-        title_style.base_style = styles["Heading 1"]
-        title_style.font.name = config_document_title["Font"]
-        title_style.font.size = Pt(config_document_title["Font Size"])
-        title_style.font.bold = config_document_title["Bold"]
-        color_hex = config_document_title["Font Color"].strip("#")
-        rgb_tuple = tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
-        title_style.font.color.rgb = RGBColor(*rgb_tuple)
-        
-        # Date Style
-        config_document_date = config["Document Date"]
-        date_style = styles.add_style("date style", WD_STYLE_TYPE.PARAGRAPH)
-        date_style.font.name = config_document_date["Font"]
-        date_style.font.size = Pt(config_document_date["Font Size"])
-        date_style.font.bold = config_document_date["Bold"]
-        color_hex = config_document_date["Font Color"].strip("#")
-        rgb_tuple = tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
-        date_style.font.color.rgb = RGBColor(*rgb_tuple)
-        
-        # Metadata Style
-        config_document_metadata = config["Document Metadata"]
-        metadata_style = styles.add_style("metadata style", WD_STYLE_TYPE.PARAGRAPH)
-        metadata_style.font.name = config_document_metadata["Font"]
-        metadata_style.font.size = Pt(config_document_metadata["Font Size"])
-        metadata_style.font.bold = config_document_metadata["Bold"]
-        color_hex = config_document_metadata["Font Color"].strip("#")
-        rgb_tuple = tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
-        metadata_style.font.color.rgb = RGBColor(*rgb_tuple)
-        
-        # Disclaimer Style
-        config_document_disclaimer = config["Document Disclaimer"]
-        disclaimer_style = styles.add_style("disclaimer style", WD_STYLE_TYPE.PARAGRAPH)
-        disclaimer_style.font.name = config_document_disclaimer["Font"]
-        disclaimer_style.font.size = Pt(config_document_disclaimer["Font Size"])
-        disclaimer_style.font.bold = config_document_disclaimer["Bold"]
-        color_hex = config_document_disclaimer["Font Color"].strip("#")
-        rgb_tuple = tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
-        disclaimer_style.font.color.rgb = RGBColor(*rgb_tuple)
-        
-        # Heading1 Style
-        config_document_heading1 = config["Document Section Heading"]
-        heading1_style = styles.add_style("heading1 style", WD_STYLE_TYPE.PARAGRAPH)
-        heading1_style.base_style = styles["Heading 1"]
-        heading1_style.font.name = config_document_heading1["Font"]
-        heading1_style.font.size = Pt(config_document_heading1["Font Size"])
-        heading1_style.font.bold = config_document_heading1["Bold"]
-        color_hex = config_document_heading1["Font Color"].strip("#")
-        rgb_tuple = tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
-        heading1_style.font.color.rgb = RGBColor(*rgb_tuple)
-        
-        # Heading2 Style
-        config_document_heading2 = config["Document Subsection Heading"]
-        heading2_style = styles.add_style("heading2 style", WD_STYLE_TYPE.PARAGRAPH)
-        heading2_style.base_style = styles["Heading 2"]
-        heading2_style.font.name = config_document_heading2["Font"]
-        heading2_style.font.size = Pt(config_document_heading2["Font Size"])
-        heading2_style.font.bold = config_document_heading2["Bold"]
-        color_hex = config_document_heading2["Font Color"].strip("#")
-        rgb_tuple = tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
-        heading2_style.font.color.rgb = RGBColor(*rgb_tuple)
-        
-        # Heading3 Style
-        config_document_heading3 = config["Document Subsection Heading"]
-        heading3_style = styles.add_style("heading3 style", WD_STYLE_TYPE.PARAGRAPH)
-        heading3_style.base_style = styles["Heading 3"]
-        heading3_style.font.name = config_document_heading3["Font"]
-        heading3_style.font.size = Pt(config_document_heading3["Font Size"])
-        heading3_style.font.bold = config_document_heading3["Bold"]
-        color_hex = config_document_heading3["Font Color"].strip("#")
-        rgb_tuple = tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
-        heading3_style.font.color.rgb = RGBColor(*rgb_tuple)
-        
-        # Paragraph Style
-        config_document_paragraph = config["Document Paragraph"]
-        paragraph_style = styles.add_style("paragraph style", WD_STYLE_TYPE.PARAGRAPH)
-        paragraph_style.font.name = config_document_paragraph["Font"]
-        paragraph_style.font.size = Pt(config_document_paragraph["Font Size"])
-        paragraph_style.font.bold = config_document_paragraph["Bold"]
-        color_hex = config_document_paragraph["Font Color"].strip("#")
-        rgb_tuple = tuple(int(color_hex[i:i+2], 16) for i in (0, 2, 4))
-        paragraph_style.font.color.rgb = RGBColor(*rgb_tuple)
-        
-        
-        document_title = doc.add_heading(config_document_title["Text"], level=1)
-        document_title.style = title_style
-        if config_document_title["Middle Aligned"]:
-            document_title.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        
-        document_date = doc.add_paragraph(date_string)
-        document_date.style = date_style
-        
-        survey_area = working_survey[working_survey.AREA == area]
-        metadata_string = "Relatore: \n" "Area: " + area + "\nCompilazioni ottenute: " + str(len(survey_area.index))
-        document_metadata = doc.add_paragraph(metadata_string)
-        document_metadata.style = metadata_style
-        
-        document_disclaimer = doc.add_paragraph(config["Document Disclaimer"]["Text"])
-        document_disclaimer.style = disclaimer_style
-        
-        styles_dictionary = { "heading1" : heading1_style,
-                              "heading2" : heading2_style,
-                              "heading3" : heading3_style,
-                              "paragraph" : paragraph_style }
-        doc = recursive_doctree_generate(working_doctree, doc, working_survey, survey_id, area, config, question_store, styles_dictionary, data_root, 1)
-        
-        if config["Document Conclusion Tree"]:
-            document_conclusion = doc.add_heading("Conclusion", level=1)
-            document_conclusion.style = heading1_style
-            conclusion_headings = []
-            conclusion_paragraphs = []
-            for section in working_doctree:
-                conclusion_headings.append(doc.add_heading(section, level=2))
-                conclusion_paragraphs.append(doc.add_paragraph(section + " summary"))
-            
-            for heading in conclusion_headings:
-                heading.style = heading2_style
-            
-            
-        doc.save(data_root / "Templates" / survey_id / (area + ".docx"))
-        
-    return
+    if survey_path is None or aggregate is None or aggregate["survey file"] != get_survey_stamp(survey_path):
+        return None
+    
+    return aggregate_to_answer_counts(aggregate, question_ids, config)
 
-def process_survey(survey_id, question_store, working_inverted_question_store, survey):
+@stage("save aggregate")
+def save_survey_aggregate(data_root, survey_id, answer_counts, columns=None):
     
     """
-    First strips the questions in the survey from leading, trailing white space and
-    any question numbers that may be present (i.e '2) ' ).
-    Then, for every column name in the DataFrame, it checks to see if the question
-    is in the working_inverted_question_store, if the question is there, the question
-    text is replaced by the question id to facilitate further processing and future
-    reference.
+    Writes the answer counts of a survey saved in <data_root>/Surveys into the aggregate
+    store, together with the questions that were counted by previous runs
 
     Parameters
     ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
     survey_id : String
-        A unique identifier of the survey, generated as 'year-month'
-    question_store : Dictionary
-        The question store is a dictionary whose primary purpose is to store the
-        mapping { question_id : question_text } along with data relating to the
-        questions' history and other internal data
-        
-        The question store is initially read from <data_root>/AppData/question_store.yml
-    working_inverted_question_store : Dictionary
-        The working_inverted_question_store contains the same type of mapping that
-        inverted_question_store has, however the working_inverted_question_store may also contain
-        newly registered questions that were taken from the doctree. Also any question not found
-        in the doctree will NOT be in the working_inverted_question_store even if it is in
-        the inverted_question_store.
-    survey : Pandas.DataFrame object
-        The contents of the csv file as a Pandas Data Frame object
+        The id of the survey
+    answer_counts : Dictionary
+        The answer counts of the survey, see build_answer_counts
+    columns : List, optional
+        The columns of the saved survey. The default is None, in which case they are
+        read from the survey file.
 
     Returns
     -------
-    question_store : Dictionary
-        The question store is a dictionary whose primary purpose is to store the
-        mapping { question_id : question_text } along with data relating to the
-        questions' history and other internal data
-        
-        The question store is initially read from <data_root>/AppData/question_store.yml
-    working_survey : Pandas.DataFrame object
-        A modified survey that has the question ids instead of the question texts
-        for those questions that are in the working question store
+    None.
 
     """
     
-    new_column_names = []
-    for column in survey.columns:
-        # Remove the leading 'n) ' for the questions that have it
-        question = column.strip('1234567890) ')
-        
-        # If this is a question that's in the working question store updates
-        # the question's history in the store and replaces the question
-        # text in the csv file with its question id
-        if question in working_inverted_question_store:
-            question_id = working_inverted_question_store[question]
-            question_store[question_id].update( { survey_id : question } )
-            question = question_id
-        
-        new_column_names.append(question)
-   
-    survey.columns = new_column_names
-    working_survey = survey
+    survey_path = find_survey_file(data_root, survey_id)
+    if survey_path is None:
+        return
     
-    return question_store, working_survey
-
+    if columns is None:
+        columns = get_survey_column_names(survey_path)
+    
+    aggregate = build_aggregate(survey_id, answer_counts, survey_path, columns, load_aggregate(data_root, survey_id))
+    save_aggregate(data_root, aggregate)
+    
+    return
 
-def recursive_doctree_question_store(dictionary, question_store, inverted_question_store, working_inverted_question_store, survey_id):
+def recursive_doctree_question_store(dictionary, question_store, inverted_question_store, working_inverted_question_store, survey_id, unknown_questions="ask"):
     
     """
     Recursively visits the doctree, checks if the questions are in the question store, if a question is not in the question store
@@ -482,6 +1588,9 @@ def recursive_doctree_question_store(dictionary, question_store, inverted_questi
     question is ignored. For those questions that were in the question store or that were registered by the function, the question
     texts are replaced by the corresponding question ids to create the working_doctree. During this process the function also builds
     the working_inverted_question_store.
+    
+    Instead of prompting the user, unknown_questions can tell the function to register every
+    question that isn't in the question store, to ignore them, or to stop the program.
 
     Parameters
     ----------
@@ -496,8 +1605,9 @@ def recursive_doctree_question_store(dictionary, question_store, inverted_questi
         The question store is initially read from <data_root>/AppData/question_store.yml
     inverted_question_store : Dictionary
         The inverted question store holds the inverted mapping { question_text : question_id }
-        to facilitate processing
-    working_inverted_question_store : Dictionary
+        over every wording of the questions to facilitate processing, the texts are
+        looked up as they are, see store.build_inverted_question_store
+    working_inverted_question_store : store.TextIndex
         The working_inverted_question_store contains the same type of mapping that
         inverted_question_store has, however the working_inverted_question_store may also contain
         newly registered questions that were taken from the doctree. Also any question not found
@@ -505,6 +1615,9 @@ def recursive_doctree_question_store(dictionary, question_store, inverted_questi
         the inverted_question_store. Originally passed as an empty dictionary from the wrapper.
     survey_id : String
         A unique identifier of the survey, generated as 'year-month'
+    unknown_questions : String, optional
+        One of UNKNOWN_QUESTION_POLICIES, what to do with the questions that aren't in
+        the question store. The default is "ask".
 
     Returns
     -------
@@ -514,7 +1627,7 @@ def recursive_doctree_question_store(dictionary, question_store, inverted_questi
         questions' history and other internal data
         
         The question store is initially read from <data_root>/AppData/question_store.yml
-    working_inverted_question_store : Dictionary
+    working_inverted_question_store : store.TextIndex
         The working_inverted_question_store contains the same type of mapping that
         inverted_question_store has, however the working_inverted_question_store may also contain
         newly registered questions that were taken from the doctree. Also any question not found
@@ -540,22 +1653,31 @@ def recursive_doctree_question_store(dictionary, question_store, inverted_questi
             
             for question_raw in question_list:
                 question = question_raw.strip()
-                if question in inverted_question_store:
-                    question_id_list.append(inverted_question_store[question])
+                # Any wording the question had in the past is matched
+                question_id = inverted_question_store.get(question)
+                if question_id is not None:
+                    question_id_list.append(question_id)
                     # See docstring for the purpose of the working_inverted_question_store
-                    working_inverted_question_store.update( { question : inverted_question_store[question] } )
+                    working_inverted_question_store.add(question, question_id)
                     
                 else:
                     print("\n\n\"" + question + "\"\n Is not in the question store.\n")
-                    print("\nIf this question isn't registered into the store, it will be ignored while generating the reports.\n")
-                    print("Would you like to create a new entry for this question now?")
-                    answer = input("[yes/no] > ")
+                    
+                    if unknown_questions == "fail":
+                        print("Error: Every question in the doctree must be registered into the question store, exiting...")
+                        sys.exit(1)
+                    elif unknown_questions == "ask":
+                        print("\nIf this question isn't registered into the store, it will be ignored while generating the reports.\n")
+                        print("Would you like to create a new entry for this question now?")
+                        answer = input("[yes/no] > ")
+                    else:
+                        answer = "yes" if unknown_questions == "register" else "no"
     
                     if answer.lower() == "yes":
                         # Function call to question.add_question_to_store from question.py
                         question_store, question_id = add_question_to_store(question_store, question)
                         question_id_list.append(question_id)
-                        working_inverted_question_store.update( { question : question_id } )
+                        working_inverted_question_store.add(question, question_id)
                     else:
                         print("\nThis question will not appear in the generated reports.\n\n\n")
                 
@@ -573,13 +1695,15 @@ def recursive_doctree_question_store(dictionary, question_store, inverted_questi
                                                                                                       question_store,
                                                                                                       inverted_question_store,
                                                                                                       working_inverted_question_store,
-                                                                                                      survey_id)
+                                                                                                      survey_id,
+                                                                                                      unknown_questions)
             # Appends the question ids that were returned from the lower levels
             new_dictionary.update({ key : new_value })
 
     return question_store, working_inverted_question_store, new_dictionary
 
-def process_doctree(survey_id, question_store, inverted_question_store, doctree):
+@stage("process doctree")
+def process_doctree(survey_id, question_store, inverted_question_store, doctree, unknown_questions="ask"):
     
     """
     This is nothing but a wrapper function for recursive_doctree_question_store
@@ -596,10 +1720,14 @@ def process_doctree(survey_id, question_store, inverted_question_store, doctree)
         The question store is initially read from <data_root>/AppData/question_store.yml
     inverted_question_store : Dictionary
         The inverted question store holds the inverted mapping { question_text : question_id }
-        to facilitate processing
+        over every wording of the questions to facilitate processing, the texts are
+        looked up as they are, see store.build_inverted_question_store
     doctree : Dictionary
         The doctree holds a tree structure that represents the titles, subtitles,
         subsubtitles,... and questions of the documents that are to be generated
+    unknown_questions : String, optional
+        One of UNKNOWN_QUESTION_POLICIES, see recursive_doctree_question_store.
+        The default is "ask".
 
     Returns
     -------
@@ -609,7 +1737,7 @@ def process_doctree(survey_id, question_store, inverted_question_store, doctree)
         questions' history and other internal data
         
         The question store is initially read from <data_root>/AppData/question_store.yml
-    working_inverted_question_store : Dictionary
+    working_inverted_question_store : store.TextIndex
         The working_inverted_question_store contains the same type of mapping that
         inverted_question_store has, however the working_inverted_question_store may also contain
         newly registered questions that were taken from the doctree. Also any question not found
@@ -623,15 +1751,43 @@ def process_doctree(survey_id, question_store, inverted_question_store, doctree)
 
     """
     
-    working_inverted_question_store = {}
+    working_inverted_question_store = TextIndex()
     question_store, working_inverted_question_store, working_doctree = recursive_doctree_question_store(doctree,
                                                                                                         question_store,
                                                                                                         inverted_question_store,
                                                                                                         working_inverted_question_store,
-                                                                                                        survey_id)
+                                                                                                        survey_id,
+                                                                                                        unknown_questions)
     
     return question_store, working_inverted_question_store, working_doctree
 
+def get_unknown_doctree_questions(doctree, question_store):
+    
+    """
+    Collects the questions of the doctree that aren't in the question store, so that
+    the batch mode can stop before any survey is generated when it can't go on
+
+    Parameters
+    ----------
+    doctree : Dictionary
+        The doctree as read from doctree.yml, with the question texts
+    question_store : Dictionary
+        The question store, see recursive_doctree_question_store
+
+    Returns
+    -------
+    unknown_questions : List
+        The texts of the questions that aren't in the question store, in the order
+        they appear in the doctree, without repetitions
+
+    """
+    
+    inverted_question_store = build_inverted_question_store(question_store)
+    
+    # The doctree has the same structure as the working doctree, only with the question texts
+    return [question.strip() for question in get_doctree_question_ids(doctree)
+            if question.strip() not in inverted_question_store]
+
 def create_directories(data_root, survey_id, config):
     
     """
@@ -665,13 +1821,13 @@ def create_directories(data_root, survey_id, config):
     templates_path.mkdir(exist_ok=True) 
     return
 
-def verify_and_register_csv(data_root):
+def verify_and_register_csv(data_root, source_csv, survey_id=None):
     
     """
     Checks the validity of the given path that should lead to a .csv file
     
-    If the path checks out, the user is asked to provide the survey year and month
-    These values are used to assign the survey ID as 'year-month'
+    If the path checks out and no survey ID was given, the user is asked to provide
+    the survey year and month. These values are used to assign the survey ID as 'year-month'
     
     After determining the survey ID, the program creates an exact copy of the csv file
     using shutils.copy in <data_root>/Surveys named <survey_id>-original.csv
@@ -683,17 +1839,25 @@ def verify_and_register_csv(data_root):
     ----------
     data_root : pathlib.Path object
         The OS agnostic path to the data root
+    source_csv : pathlib.Path object
+        The path to the .csv file of the survey results
+    survey_id : String, optional
+        A unique identifier of the survey as 'year-month'. The default is None,
+        in which case the user is prompted for the year and the month.
 
     Returns
     -------
     survey_id : String
         A unique identifier of the survey, generated as 'year-month'
-    survey : Pandas.DataFrame object
-        The contents of the csv file as a Pandas Data Frame object
+    target_csv : pathlib.Path object
+        The copy of the csv file in <data_root>/Surveys, the survey is read from
+        there by read_survey_csv once the columns it needs are known
 
     """
     
-    source_csv = Path(sys.argv[1])
+    from shutil import copy
+    
+    source_csv = Path(source_csv)
     
     if not source_csv.is_file():
         print("The given path doesn't point to a file.")
@@ -705,27 +1869,28 @@ def verify_and_register_csv(data_root):
         print("Please run as generate.py <path/to/survey/results.csv>")
         sys.exit(1)
     
-    # Regular expression for checking the general formatting of the year
-    rex = re.compile("^[0-9]{4}$")
-    
-    # Makeshift 'do while' loop
-    while True:
-        year = input("\nYear of survey: ")
-        if rex.match(year):
-            break
-        print("\nNot a valid year, please enter the year represented as 4 digits\n\n")
-    
-    # Regular expression for checking the general formatting of the month
-    rex = re.compile("^[0-9]{2}$")
-    
-    # Makeshift 'do while' loop
-    while True:
-        month = input("Month of survey [0-12]: ")
-        if rex.match(month):
-            break
-        print("\nNot a valid month, please enter the month represented as 2 digits ( ie. for August enter 08 )\n\n")
-    
-    survey_id = year + "-" + month
+    if survey_id is None:
+        # Regular expression for checking the general formatting of the year
+        rex = re.compile("^[0-9]{4}$")
+        
+        # Makeshift 'do while' loop
+        while True:
+            year = input("\nYear of survey: ")
+            if rex.match(year):
+                break
+            print("\nNot a valid year, please enter the year represented as 4 digits\n\n")
+        
+        # Regular expression for checking the general formatting of the month
+        rex = re.compile("^[0-9]{2}$")
+        
+        # Makeshift 'do while' loop
+        while True:
+            month = input("Month of survey [0-12]: ")
+            if rex.match(month):
+                break
+            print("\nNot a valid month, please enter the month represented as 2 digits ( ie. for August enter 08 )\n\n")
+        
+        survey_id = year + "-" + month
     
     # We add 'original' to the end because we will save another version
     # of the survey with its plain name, it will have the question ids
@@ -735,10 +1900,7 @@ def verify_and_register_csv(data_root):
     target_csv = data_root /  "Surveys" / csv_filename
     copy(source_csv, target_csv)
     
-    # Load the survey as a Pandas DataFrame
-    survey = pd.read_csv(source_csv)
-    
-    return survey_id, survey
+    return survey_id, target_csv
 
 def prompt_user_for_prerequisites():
     
@@ -767,64 +1929,407 @@ def prompt_user_for_prerequisites():
     sys.exit(0)
     
 
-def main():
-    
-    if len(sys.argv) != 2 or sys.argv[1] == "help":
-        print(main.__doc__)
-        return
-    
-    prompt_user_for_prerequisites()
-    
-    with open(DATA_ROOT_CONFIG_REL, "r") as fd:
-         data_root = Path(yaml.safe_load(fd)['root'])
+def generate_survey(data_root, survey_id, survey_csv, config, doctree, question_store, config_path=CONFIG_REL,
+                    doctree_path=DOCTREE_REL, unknown_questions="ask", executor=None):
     
-    survey_id, survey = verify_and_register_csv(data_root)
+    """
+    Generates the report templates of a single survey whose csv file was already registered
+    by verify_and_register_csv, then saves the processed survey, its answer counts into
+    the aggregate store (see aggregates.py) and the question store.
+    The config, the doctree and the question store are only read by the caller, so the
+    batch mode reads them once for all of its surveys.
+
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    survey_id : String
+        A unique identifier of the survey, generated as 'year-month'
+    survey_csv : pathlib.Path object
+        The csv file of the survey returned by verify_and_register_csv
+    config : Dictionary
+        The contents of the config.yml file as a Python dictionary
+    doctree : Dictionary
+        The contents of the doctree.yml file as a Python dictionary
+    question_store : Dictionary
+        The question store returned by store.load_question_store
+    config_path : pathlib.Path object, optional
+        The config file, copied into the templates for future reference. The default is CONFIG_REL.
+    doctree_path : pathlib.Path object, optional
+        The doctree file, copied into the templates for future reference. The default is DOCTREE_REL.
+    unknown_questions : String, optional
+        One of UNKNOWN_QUESTION_POLICIES, see recursive_doctree_question_store. The default is "ask".
+    executor : concurrent.futures.ProcessPoolExecutor, optional
+        The worker processes for the parallel generation, see generate_docs. The default is None.
+
+    Returns
+    -------
+    question_store : Dictionary
+        The question store, with the questions registered and the history added for this survey
+
+    """
     
-    with open(CONFIG_REL, "r") as fd:
-         config = yaml.safe_load(fd)
+    from shutil import copy
+    import pandas as pd
+    from visuals import check_chart_backend
     
-    with open(DOCTREE_REL, "r") as fd:
-         doctree = yaml.safe_load(fd)
+    check_chart_backend(config.get("Chart Backend", "Plotly"))
     
-    with open(data_root / QS_FROM_ROOT, "r") as fd:
-         question_store = yaml.safe_load(fd)
-         
     create_directories(data_root, survey_id, config)
     
-    # Copy the config file and the doctree into the data root for future reference
-    copy(DOCTREE_REL, data_root / "Templates" / survey_id / "doctree.yml")
-    copy(CONFIG_REL, data_root / "Templates" / survey_id / "config.yml")
+    # Only the header of the survey is read for now, the columns that
+    # are actually needed are read once they are known
+    survey = pd.read_csv(survey_csv, nrows=0)
+    original_columns = list(survey.columns)
     
-    inverted_question_store = {}
+    # Copy the config file and the doctree into the data root for future reference
+    copy(doctree_path, data_root / "Templates" / survey_id / "doctree.yml")
+    copy(config_path, data_root / "Templates" / survey_id / "config.yml")
     
-    # Creates a dictionary with the mapping (question_text : question_id)
-    for k,v in question_store.items():
-        if not k == "NEXTINLINE" and not k == "COUNT":
-            inverted_question_store.update({ v["current"] : k })
+    # Creates the mapping (question_text : question_id)
+    inverted_question_store = build_inverted_question_store(question_store)
     
     # Goes through the doctree and replaces the questions' text with their question ids
-    question_store, working_inverted_question_store, working_doctree = process_doctree(survey_id, question_store, inverted_question_store, doctree)
+    question_store, working_inverted_question_store, working_doctree = process_doctree(survey_id, question_store, inverted_question_store,
+                                                                                       doctree, unknown_questions)
+    
+    # The answer counts of the past surveys are read from the aggregate store, the past
+    # surveys that have no aggregate yet are loaded while the survey is processed,
+    # only the columns the charts need are read
+    question_ids = get_doctree_question_ids(working_doctree)
+    aggregated_answer_counts = {}
+    for past_survey_id in get_past_survey_ids(config):
+        if past_survey_id != survey_id:
+            past_answer_counts = read_aggregated_answer_counts(data_root, past_survey_id, question_ids, config)
+            if past_answer_counts is not None:
+                aggregated_answer_counts.update( { past_survey_id : past_answer_counts } )
+    prefetch_thread = prefetch_past_surveys(data_root, config, ["AREA"] + question_ids, [survey_id] + list(aggregated_answer_counts))
     
     # Goes through the survey data and replaces those questions that show up in
     # the doctree with their corresponding question ids
-    question_store, working_survey = process_survey(survey_id, question_store, working_inverted_question_store, survey)
+    question_store, survey = process_survey(survey_id, question_store, working_inverted_question_store, survey)
+    
+    # Reads the areas, the answers to the questions of the doctree and the comments, the
+    # answers are stored as categories of the Available Choices from here on
+    needed_columns = ["AREA"] + question_ids + get_doctree_comment_fields(working_doctree)
+    working_survey = read_survey_csv(survey_csv, original_columns, list(survey.columns), needed_columns, question_ids, config)
     
     print("\n")
     
+    # The worker processes of the parallel generation must not be started while
+    # the prefetching thread is still running
+    with stage("wait for past surveys"):
+        prefetch_thread.join()
+    
+    # Counts the answers of the current survey and of the past surveys that have no
+    # aggregate once, the charts of every area are drawn from these counts
+    answer_counts = { survey_id : build_answer_counts(working_survey, question_ids, config) }
+    for past_survey_id in get_past_survey_ids(config):
+        if past_survey_id in aggregated_answer_counts:
+            answer_counts.update( { past_survey_id : aggregated_answer_counts[past_survey_id] } )
+        elif past_survey_id not in answer_counts:
+            past_survey = load_past_survey(data_root, past_survey_id, ["AREA"] + question_ids)
+            answer_counts.update( { past_survey_id : build_answer_counts(past_survey, question_ids, config) } )
+            save_survey_aggregate(data_root, past_survey_id, answer_counts[past_survey_id])
+    
     # Generates the visuals and the templates
-    generate_docs(data_root, survey_id, working_survey, config, working_doctree, question_store)
+    with stage("generate documents"):
+        generate_docs(data_root, survey_id, working_survey, answer_counts, config, working_doctree, question_store, executor)
     
     print("\nCleaning up...")
     
-    csv_filename = survey_id + ".csv"
-    working_survey.to_csv(data_root /  "Surveys" / csv_filename)
+    save_survey(data_root, survey_id, survey_csv, original_columns, list(survey.columns), question_ids, config)
+    save_survey_aggregate(data_root, survey_id, answer_counts[survey_id], list(survey.columns))
+    
+    with stage("write back question store"):
+        save_question_store(data_root, question_store)
+    
+    return question_store
+
+def get_batch_arguments(arguments):
+    
+    """
+    Parses the command line arguments of the batch mode, see main
+
+    Parameters
+    ----------
+    arguments : List
+        The command line arguments following "batch"
+
+    Returns
+    -------
+    arguments : argparse.Namespace
+        The parsed arguments, the survey ids are filled in from
+        the file names of the csv files where they weren't given
+
+    """
+    
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog="generate.py batch",
+                                     description="Generates the report templates of one or more surveys without any prompts.")
+    parser.add_argument("surveys", nargs="+", type=Path, metavar="path/to/survey.csv",
+                        help="the csv files of the surveys, processed in the given order")
+    parser.add_argument("--survey-id", action="append", dest="survey_ids", default=None, metavar="YYYY-MM",
+                        help="the id of each survey, in the same order as the csv files. "
+                             "If omitted, the id is taken from the file name, i.e. results-2021-03.csv")
+    parser.add_argument("--config", type=Path, default=CONFIG_REL, help="the config file, default: %(default)s")
+    parser.add_argument("--doctree", type=Path, default=DOCTREE_REL, help="the doctree file, default: %(default)s")
+    parser.add_argument("--unknown-questions", choices=UNKNOWN_QUESTION_POLICIES[1:], default="fail",
+                        help="what to do with the doctree questions that aren't in the question store, default: %(default)s")
+    arguments = parser.parse_args(arguments)
+    
+    if arguments.survey_ids is None:
+        arguments.survey_ids = []
+        for survey_path in arguments.surveys:
+            match = re.search("[0-9]{4}-[0-9]{2}", survey_path.stem)
+            if match is None:
+                parser.error("can't tell the survey id of " + str(survey_path) + " from its file name, use --survey-id")
+            arguments.survey_ids.append(match.group(0))
+    elif len(arguments.survey_ids) != len(arguments.surveys):
+        parser.error("--survey-id must be given once for every csv file")
+    
+    rex = re.compile("^[0-9]{4}-[0-9]{2}$")
+    for survey_id in arguments.survey_ids:
+        if not rex.match(survey_id):
+            parser.error(survey_id + " is not a valid survey id, it must be 'year-month' as YYYY-MM")
+    
+    if len(set(arguments.survey_ids)) != len(arguments.survey_ids):
+        parser.error("every survey must have a different id")
+    
+    for path in [arguments.config, arguments.doctree] + arguments.surveys:
+        if not path.is_file():
+            parser.error(str(path) + " doesn't point to a file")
+    
+    return arguments
+
+def generate_batch(arguments):
+    
+    """
+    The batch mode, generates the report templates of every survey given on the
+    command line without any prompts. The config, the doctree and the question store
+    are read once, and the chart renderer and the worker processes of the parallel
+    generation are shared by all of the surveys.
+
+    Parameters
+    ----------
+    arguments : List
+        The command line arguments following "batch", see get_batch_arguments
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    arguments = get_batch_arguments(arguments)
+    
+    import yaml
+    from concurrent.futures import ProcessPoolExecutor
+    from visuals import start_chart_renderer
+    
+    with open(DATA_ROOT_CONFIG_REL, "r") as fd:
+         data_root = Path(yaml.safe_load(fd)['root'])
+    
+    with stage("load config"), open(arguments.config, "r") as fd:
+         config = yaml.safe_load(fd)
+    
+    with stage("load doctree"), open(arguments.doctree, "r") as fd:
+         doctree = yaml.safe_load(fd)
+    
+    with stage("load question store"):
+        question_store = load_question_store(data_root)
+    
+    # Every survey is generated with the same doctree, the questions are checked once before any
+    # survey is registered so that a failing batch leaves the data root as it was
+    if arguments.unknown_questions == "fail":
+        unknown_questions = get_unknown_doctree_questions(doctree, question_store)
+        if unknown_questions:
+            for question in unknown_questions:
+                print("\n\"" + question + "\"\n Is not in the question store.")
+            print("\nError: Every question in the doctree must be registered into the question store, exiting...")
+            sys.exit(1)
+    
+    executor = None
+    parallel_generation = config.get("Parallel Generation")
+    if parallel_generation and parallel_generation["Enabled"]:
+        executor = ProcessPoolExecutor(max_workers=parallel_generation["Workers"] or os.cpu_count(), initializer=start_chart_renderer,
+                                       initargs=(config.get("Chart Backend", "Plotly"),))
+    
+    for number, (survey_path, survey_id) in enumerate(zip(arguments.surveys, arguments.survey_ids), start=1):
+        print("\n[" + str(number) + "/" + str(len(arguments.surveys)) + "] Survey " + survey_id + " from " + str(survey_path))
+        
+        survey_id, survey_csv = verify_and_register_csv(data_root, survey_path, survey_id)
+        question_store = generate_survey(data_root, survey_id, survey_csv, config, doctree, question_store,
+                                         arguments.config, arguments.doctree, arguments.unknown_questions, executor)
+    
+    if executor is not None:
+        executor.shutdown()
+    
+    print("\nSuccessfully generated the report templates of " + str(len(arguments.surveys)) + " surveys!\n")
+    
+    return
+
+def generate_interactive(survey_path):
+    
+    """
+    Generates the report templates of a survey, asking the user for what's missing, see main
+
+    Parameters
+    ----------
+    survey_path : String
+        The path to the .csv file of the survey given on the command line
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    import yaml
+    
+    prompt_user_for_prerequisites()
+    
+    with open(DATA_ROOT_CONFIG_REL, "r") as fd:
+         data_root = Path(yaml.safe_load(fd)['root'])
+    
+    survey_id, survey_csv = verify_and_register_csv(data_root, survey_path)
+    
+    with stage("load config"), open(CONFIG_REL, "r") as fd:
+         config = yaml.safe_load(fd)
+    
+    with stage("load doctree"), open(DOCTREE_REL, "r") as fd:
+         doctree = yaml.safe_load(fd)
+    
+    with stage("load question store"):
+        question_store = load_question_store(data_root)
     
-    with open(data_root / QS_FROM_ROOT, "w") as fd:
-            yaml.dump(question_store, fd)
+    generate_survey(data_root, survey_id, survey_csv, config, doctree, question_store)
     
     print("\nSuccessfully generated the report templates!\n")
     
     return
 
+def get_profile_arguments(arguments):
+    
+    """
+    Takes the profiling options out of the command line arguments, see main
+
+    Parameters
+    ----------
+    arguments : List
+        The command line arguments
+
+    Returns
+    -------
+    arguments : List
+        The arguments without the profiling options
+    profile : bool
+        Whether --profile was given
+    profile_area : String
+        The area given with --profile-area, None if it wasn't given
+
+    """
+    
+    remaining = []
+    profile = False
+    profile_area = None
+    
+    position = 0
+    while position < len(arguments):
+        if arguments[position] == "--profile":
+            profile = True
+        elif arguments[position] == "--profile-area":
+            if position + 1 == len(arguments):
+                print("\nError: --profile-area needs the name of an area, exiting...")
+                sys.exit(1)
+            profile = True
+            profile_area = arguments[position + 1]
+            position += 1
+        else:
+            remaining.append(arguments[position])
+        position += 1
+    
+    return remaining, profile, profile_area
+
+def start_profiling(profile_area):
+    
+    """
+    Turns the profiler on for the run, the report goes to
+    <data root>/AppData/Profiles/profile-<date>-<time>.json
+
+    Parameters
+    ----------
+    profile_area : String
+        The area whose generation is also profiled with cProfile, None for no area
+
+    Returns
+    -------
+    report_path : pathlib.Path object
+        Where the report of the run goes
+
+    """
+    
+    import yaml
+    from datetime import datetime
+    
+    with open(DATA_ROOT_CONFIG_REL, "r") as fd:
+         data_root = Path(yaml.safe_load(fd)['root'])
+    
+    profiles_path = data_root / PROFILES_FROM_ROOT
+    profiles_path.mkdir(parents=True, exist_ok=True)
+    report_name = "profile-" + datetime.now().strftime("%Y%m%d-%H%M%S")
+    
+    cprofile_path = None
+    if profile_area is not None:
+        cprofile_path = profiles_path / (report_name + "-" + profile_area + ".prof")
+    enable_profiling(profile_area, cprofile_path)
+    
+    return profiles_path / (report_name + ".json")
+
+def main():
+    
+    """
+    Generates the report templates of a survey from the .csv file of its results.
+    
+    - generate.py <path/to/survey/results.csv> (asks for the year and month of the survey, and
+      for each question of the doctree that isn't in the question store whether to register it)
+    - generate.py batch [options] <path/to/survey.csv> ... (generates the templates of every given
+      survey without any prompts, run "generate.py batch --help" for the options)
+    - generate.py help (prints the docstring)
+    
+    Both ways of generating the templates take the profiling options:
+    
+    - --profile (times each stage of the run, prints the stages sorted by cost and
+      saves them as a JSON report to <data root>/AppData/Profiles)
+    - --profile-area <area> (same as --profile, and also runs the generation of the
+      report of the area through cProfile)
+    
+    Returns
+    -------
+    None.
+
+    """
+    
+    arguments, profile, profile_area = get_profile_arguments(sys.argv[1:])
+    
+    if profile:
+        report_path = start_profiling(profile_area)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+    
+    if len(arguments) > 0 and arguments[0] == "batch":
+        generate_batch(arguments[1:])
+    elif len(arguments) != 1 or arguments[0] == "help":
+        print(main.__doc__)
+        return
+    else:
+        generate_interactive(arguments[0])
+    
+    if profile:
+        write_profile_report(report_path, time.perf_counter() - wall_start, time.process_time() - cpu_start, sys.argv)
+    
+    return
+
 if __name__ == "__main__":
     main()
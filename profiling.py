@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+import sys
+import time
+import json
+from contextlib import contextmanager
+
+# The number of functions printed from the cProfile output of the profiled area
+CPROFILE_PRINTED_FUNCTIONS = 25
+
+# The state of the profiler of this process. The stages are { stage : { "calls", "wall", "cpu" } },
+# the area is the one whose generation goes through cProfile, and its output goes to cprofile_path
+profile_state = { "enabled" : False, "stages" : {}, "area" : None, "cprofile_path" : None }
+
+def enable_profiling(area=None, cprofile_path=None):
+    
+    """
+    Turns the profiler on for this process, from here on every stage records its timings
+    
+    Parameters
+    ----------
+    area : String, optional
+        The area whose generation is also profiled with cProfile. The default is None.
+    cprofile_path : pathlib.Path object, optional
+        Where the cProfile output of the area is saved. The default is None.
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    profile_state.update( { "enabled" : True, "stages" : {}, "area" : area, "cprofile_path" : cprofile_path } )
+    
+    return
+
+def is_profiling():
+    
+    """
+    Returns
+    -------
+    enabled : bool
+        Whether the profiler of this process is on
+    """
+    
+    return profile_state["enabled"]
+
+@contextmanager
+def stage(name):
+    
+    """
+    Records the wall time, the CPU time and the number of calls of the code run
+    in the with block under the given stage, does nothing if the profiler is off.
+    The stages can be nested, the time of a stage includes the time of the stages in it.
+    
+    Parameters
+    ----------
+    name : String
+        The name of the stage
+    
+    """
+    
+    if not profile_state["enabled"]:
+        yield
+        return
+    
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        record = profile_state["stages"].setdefault(name, { "calls" : 0, "wall" : 0.0, "cpu" : 0.0 })
+        record["calls"] += 1
+        record["wall"] += time.perf_counter() - wall_start
+        record["cpu"] += time.process_time() - cpu_start
+
+def merge_profile_stats(stages):
+    
+    """
+    Adds the timings recorded by another process, i.e. a worker of the parallel
+    generation, to the ones of this process
+    
+    Parameters
+    ----------
+    stages : Dictionary
+        The stages recorded by the other process, see profiled_call
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    for name, other in stages.items():
+        record = profile_state["stages"].setdefault(name, { "calls" : 0, "wall" : 0.0, "cpu" : 0.0 })
+        record["calls"] += other["calls"]
+        record["wall"] += other["wall"]
+        record["cpu"] += other["cpu"]
+    
+    return
+
+def get_cprofile_path(area):
+    
+    """
+    Parameters
+    ----------
+    area : String
+        An area
+    
+    Returns
+    -------
+    cprofile_path : pathlib.Path object
+        Where the cProfile output of the area goes, None if the area isn't profiled with cProfile
+    """
+    
+    if profile_state["enabled"] and area == profile_state["area"]:
+        return profile_state["cprofile_path"]
+    
+    return None
+
+def run_with_cprofile(area, function, *arguments):
+    
+    """
+    Calls function(*arguments), through cProfile if area is the one chosen
+    with enable_profiling. The cProfile output is saved and its most expensive
+    functions are printed.
+    
+    Parameters
+    ----------
+    area : String
+        The area generated by the call
+    function : Function
+        The function to be called
+    
+    Returns
+    -------
+    result : Object
+        What the function returned
+    
+    """
+    
+    if not profile_state["enabled"] or area != profile_state["area"]:
+        return function(*arguments)
+    
+    import pstats
+    import cProfile
+    
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *arguments)
+    
+    profiler.dump_stats(str(profile_state["cprofile_path"]))
+    print("\ncProfile output of Area " + area + " saved to " + str(profile_state["cprofile_path"]) + ", most expensive functions:")
+    pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(CPROFILE_PRINTED_FUNCTIONS)
+    
+    return result
+
+def profiled_call(stage_name, area, cprofile_path, function, *arguments):
+    
+    """
+    Calls function(*arguments) in a worker process with the profiler on, and hands the
+    timings back to the main process, which merges them with merge_profile_stats
+    
+    Parameters
+    ----------
+    stage_name : String
+        The stage the whole call is recorded under
+    area : String
+        The area generated by the call
+    cprofile_path : pathlib.Path object
+        Where the cProfile output goes if area is the profiled one, None otherwise
+    function : Function
+        The function to be called
+    
+    Returns
+    -------
+    result : Object
+        What the function returned
+    stages : Dictionary
+        The timings recorded during the call
+    
+    """
+    
+    enable_profiling(area if cprofile_path is not None else None, cprofile_path)
+    with stage(stage_name):
+        result = run_with_cprofile(area, function, *arguments)
+    
+    return result, profile_state["stages"]
+
+def write_profile_report(report_path, total_wall, total_cpu, command):
+    
+    """
+    Saves the timings of the stages as a JSON report and prints them as a table,
+    the most expensive stages first
+    
+    Parameters
+    ----------
+    report_path : pathlib.Path object
+        Where the JSON report goes
+    total_wall : float
+        The wall time of the whole run in seconds
+    total_cpu : float
+        The CPU time of the main process in seconds
+    command : List
+        The command line of the run
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    stages = sorted(profile_state["stages"].items(), key=lambda item: -item[1]["wall"])
+    
+    report = { "command" : command,
+               "wall" : round(total_wall, 6),
+               "cpu" : round(total_cpu, 6),
+               "stages" : [ { "stage" : name,
+                              "calls" : record["calls"],
+                              "wall" : round(record["wall"], 6),
+                              "cpu" : round(record["cpu"], 6) } for name, record in stages ] }
+    
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(report_path, "w") as fd:
+        json.dump(report, fd, indent=4)
+    
+    name_width = max([len("Stage")] + [len(name) for name, record in stages])
+    print("\nProfile of the run, the time of a stage includes the stages run inside it and the")
+    print("stages of the parallel workers are summed over the workers:\n")
+    print("Stage".ljust(name_width) + "     Calls      Wall (s)       CPU (s)   Wall %")
+    for name, record in stages:
+        share = 100 * record["wall"] / total_wall if total_wall else 0
+        print(name.ljust(name_width) + str(record["calls"]).rjust(10) + ("%.3f" % record["wall"]).rjust(14)
+              + ("%.3f" % record["cpu"]).rjust(14) + ("%.1f" % share).rjust(9))
+    print("Total".ljust(name_width) + "".rjust(10) + ("%.3f" % total_wall).rjust(14) + ("%.3f" % total_cpu).rjust(14))
+    print("\nReport saved to " + str(report_path))
+    
+    return
@@ -1,45 +1,129 @@
 # -*- coding: utf-8 -*-
 
 import sys
-import yaml
 from pathlib import Path
 from os.path import realpath
-from shutil import copy
+from aggregates import get_question_trend
+from store import load_question_store, save_question_store, compact_question_store, migrate_question_store, QS_FROM_ROOT, QS_DB_FROM_ROOT
+
+# PyYAML is imported by the functions that read or write the files, so that "question.py help"
+# and the unrecognized commands answer right away, see generate.py
 
 # The relative path to data-root-config.yml from this script
 DATA_ROOT_CONFIG_REL = Path(realpath(__file__)).parent / "data-root-config.yml"
-# The relative path to question-store.yml from the data root
-QS_FROM_ROOT = Path('AppData/question-store.yml')
+# The relative path to config.yml from this script
+CONFIG_REL = Path('Current Configuration/config.yml')
 
 
 
-def increment_QID(question_id):
+# Question identifiers are base-26 numbers written with capital letters. The three letter
+# ids "AAA" to "ZZZ" come first, positions 0 to 17575, followed by the four letter ids
+# "AAAA" to "ZZZZ", then the five letter ones and so on, so the store never runs out of ids
+QID_MINIMUM_LENGTH = 3
+QID_BASE = 26
+# The maximum of the stores created before ids could grow past three letters,
+# it was the size of the three letter id space and no longer applies
+LEGACY_QID_MAXIMUM = QID_BASE ** QID_MINIMUM_LENGTH
+# The number of questions shown on each page by "question.py page"
+QUESTIONS_PER_PAGE = 20
+
+def is_valid_QID(question_id):
     
     """
-    Implements the logic for incrementing question identifiers
+    Checks whether the string is a well formed question identifier
 
     Parameters
     ----------
     question_id : String
-        3 character question identifier used in the question store
+        The string to be checked
 
     Returns
     -------
+    bool
+        True if question_id is made of at least QID_MINIMUM_LENGTH capital letters
+
+    """
+    
+    return len(question_id) >= QID_MINIMUM_LENGTH and all("A" <= letter <= "Z" for letter in question_id)
+
+def QID_to_int(question_id):
+    
+    """
+    Converts a question identifier into its position in the store,
+    "AAA" is 0, "AAB" is 1, "ABA" is 26, "ZZZ" is 17575, "AAAA" is 17576 and so on.
+
+    Parameters
+    ----------
     question_id : String
-        3 character question identifier used in the question store, incremented
+        Question identifier used in the question store
+
+    Returns
+    -------
+    index : int
+        The position of the question in the store, counting from 0
 
     """
     
-    if question_id[2] != "Z":
-        question_id = question_id[0] + question_id[1] + chr(ord(question_id[2])+1)
-    elif question_id[1] != "Z":
-        question_id = question_id[0] + chr(ord(question_id[1])+1) + "A"
-    else:
-        question_id = chr(ord(question_id[0])+1) + "A" + "A"
+    # The ids shorter than question_id come before it
+    index = 0
+    for length in range(QID_MINIMUM_LENGTH, len(question_id)):
+        index += QID_BASE ** length
+    
+    value = 0
+    for letter in question_id:
+        value = value * QID_BASE + ord(letter) - ord("A")
+    
+    return index + value
+
+def int_to_QID(index):
+    
+    """
+    Converts a position in the store into the corresponding question identifier,
+    the inverse of QID_to_int.
+
+    Parameters
+    ----------
+    index : int
+        The position of the question in the store, counting from 0
+
+    Returns
+    -------
+    question_id : String
+        Question identifier used in the question store
+
+    """
     
-    return question_id
+    # Skip the blocks of shorter ids
+    length = QID_MINIMUM_LENGTH
+    while index >= QID_BASE ** length:
+        index -= QID_BASE ** length
+        length += 1
+    
+    letters = []
+    for i in range(length):
+        index, remainder = divmod(index, QID_BASE)
+        letters.append(chr(ord("A") + remainder))
+    
+    return "".join(reversed(letters))
 
+def increment_QID(question_id):
+    
+    """
+    Implements the logic for incrementing question identifiers
 
+    Parameters
+    ----------
+    question_id : String
+        Question identifier used in the question store
+
+    Returns
+    -------
+    question_id : String
+        Question identifier used in the question store, incremented
+
+    """
+    
+    return int_to_QID(QID_to_int(question_id) + 1)
 
 def decrement_QID(question_id):
     
@@ -49,24 +133,42 @@ def decrement_QID(question_id):
     Parameters
     ----------
     question_id : String
-        3 character question identifier used in the question store
+        Question identifier used in the question store
 
     Returns
     -------
     question_id : String
-        3 character question identifier used in the question store, decremented
+        Question identifier used in the question store, decremented
 
     """
     
-    if question_id[2] != "A":
-        question_id = question_id[0] + question_id[1] + chr(ord(question_id[2])-1)
-    elif question_id[1] != "A":
-        question_id = question_id[0] + chr(ord(question_id[1])-1) + "Z"
-    else:
-        question_id = chr(ord(question_id[0])-1) + "Z" + "Z"
+    return int_to_QID(QID_to_int(question_id) - 1)
+
+def print_questions(question_store, indices):
     
-    return question_id
+    """
+    Prints the questions at the given positions of the store. The question identifiers
+    are computed from the positions, so no other question of the store is visited.
+
+    Parameters
+    ----------
+    question_store : Dictionary
+        Contains the question store which was read
+        from 'data-root/AppData/question-store.yml'.
+    indices : range
+        The positions of the questions to be printed, in the order they are printed
 
+    Returns
+    -------
+    None.
+
+    """
+    
+    for index in indices:
+        question_id = int_to_QID(index)
+        print("\n" + question_id + " : " + question_store[question_id]["current"])
+    
+    return
 
 def add_question_to_store(question_store, question):
     
@@ -101,12 +203,16 @@ def add_question_to_store(question_store, question):
         as well as the usage history of the questions in surveys.
     
     question_id : String
-        3 character question identifier of the added question
+        Question identifier of the added question
     """
     
     current_question_count = question_store['COUNT']['current']
-    if  current_question_count >= question_store['COUNT']['maximum']:
-        print("\nError: Question store at full capacity, ID scheme needs to be extended!")
+    maximum_question_count = question_store['COUNT']['maximum']
+    if maximum_question_count == LEGACY_QID_MAXIMUM:
+        maximum_question_count = None
+    
+    if maximum_question_count is not None and current_question_count >= maximum_question_count:
+        print("\nError: Question store at full capacity, raise the maximum of COUNT in the question store!")
         sys.exit(1)
     
     # Next question ID in line
@@ -388,14 +494,9 @@ def print_first_n(question_store):
         sys.exit(1)
         
     N = int(sys.argv[2])
-    question_id = "AAA"
+    question_count = QID_to_int(question_store["NEXTINLINE"])
     
-    while N>0:
-        if question_id == question_store["NEXTINLINE"]:
-            return
-        print("\n" + question_id + " : " + question_store[question_id]["current"])
-        question_id = increment_QID(question_id)
-        N = N - 1
+    print_questions(question_store, range(min(N, question_count)))
     
     return
 
@@ -429,14 +530,131 @@ def print_last_n(question_store):
         sys.exit(1)
         
     N = int(sys.argv[2])
-    question_id = decrement_QID(question_store["NEXTINLINE"])
+    question_count = QID_to_int(question_store["NEXTINLINE"])
     
-    while N>0:
-        print("\n" + question_id + " : " + question_store[question_id]["current"])
-        question_id = decrement_QID(question_id)
-        N = N - 1
-        if question_id == "AAA":
-            return
+    print_questions(question_store, range(question_count - 1, max(question_count - N, 0) - 1, -1))
+    
+    return
+
+def print_range(question_store):
+    
+    """
+    Prints the questions between two question identifiers, both included,
+    takes the range from among the command line arguments as <first>..<last>.
+    The part of the range past the last question in store is ignored.
+
+    Parameters
+    ----------
+    question_store : Dictionary
+        Contains the question store which was read
+        from 'data-root/AppData/question-store.yml'.
+        
+        The question store holds the mapping between the
+        registered questions and their unique identifiers
+        as well as the usage history of the questions in surveys.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    if len(sys.argv) != 3 or sys.argv[2].count("..") != 1:
+        print("\nError: Invalid arguments for printing a range of questions.")
+        print("Please run as \"question.py listrange <first_id>..<last_id>\" or consult the documentation.")
+        sys.exit(1)
+    
+    first_id, last_id = sys.argv[2].split("..")
+    if not is_valid_QID(first_id) or not is_valid_QID(last_id):
+        print("\nError: " + sys.argv[2] + " is not a valid range of question identifiers.")
+        sys.exit(1)
+    
+    question_count = QID_to_int(question_store["NEXTINLINE"])
+    
+    print_questions(question_store, range(QID_to_int(first_id), min(QID_to_int(last_id) + 1, question_count)))
+    
+    return
+
+def print_page(question_store):
+    
+    """
+    Prints the Pth page of the store, oldest to newest, each page holding
+    QUESTIONS_PER_PAGE questions unless a different page size is given.
+    Takes P, and optionally the page size, from among the command line arguments.
+
+    Parameters
+    ----------
+    question_store : Dictionary
+        Contains the question store which was read
+        from 'data-root/AppData/question-store.yml'.
+        
+        The question store holds the mapping between the
+        registered questions and their unique identifiers
+        as well as the usage history of the questions in surveys.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    arguments = sys.argv[2:]
+    if len(arguments) not in (1, 2) or not all(argument.isdigit() for argument in arguments) \
+            or (len(arguments) == 2 and int(arguments[1]) < 1):
+        print("\nError: Invalid arguments for printing a page of questions.")
+        print("Please run as \"question.py page <P> [page_size]\" or consult the documentation.")
+        sys.exit(1)
+    
+    page = int(sys.argv[2])
+    page_size = int(sys.argv[3]) if len(sys.argv) == 4 else QUESTIONS_PER_PAGE
+    
+    question_count = QID_to_int(question_store["NEXTINLINE"])
+    page_count = -(-question_count // page_size)
+    
+    if page < 1 or page > page_count:
+        print("\nError: There are " + str(page_count) + " pages of questions in store.")
+        sys.exit(1)
+    
+    print("\nPage " + str(page) + " of " + str(page_count))
+    print_questions(question_store, range((page - 1) * page_size, min(page * page_size, question_count)))
+    
+    return
+
+def print_nth(question_store):
+    
+    """
+    Prints the Nth question of the store, counting from 1 in the order
+    the questions were added. Takes N from among the command line arguments.
+
+    Parameters
+    ----------
+    question_store : Dictionary
+        Contains the question store which was read
+        from 'data-root/AppData/question-store.yml'.
+        
+        The question store holds the mapping between the
+        registered questions and their unique identifiers
+        as well as the usage history of the questions in surveys.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    if len(sys.argv) != 3:
+        print("\nError: Invalid arguments for printing the Nth question.")
+        print("Please run as \"question.py nth <N>\" or consult the documentation.")
+        sys.exit(1)
+    
+    N = int(sys.argv[2])
+    question_count = QID_to_int(question_store["NEXTINLINE"])
+    
+    if N < 1 or N > question_count:
+        print("\nError: There are " + str(question_count) + " questions in store.")
+        sys.exit(1)
+    
+    print_questions(question_store, range(N - 1, N))
     
     return
 
@@ -466,11 +684,7 @@ def print_all(question_store):
         print("Please run as \"question.py listall\" or consult the documentation.")
         sys.exit(1)
     
-    question_id = "AAA"
-    
-    while question_id != question_store["NEXTINLINE"]:
-        print("\n" + question_id + " : " + question_store[question_id]["current"])
-        question_id = increment_QID(question_id)
+    print_questions(question_store, range(QID_to_int(question_store["NEXTINLINE"])))
 
     return
 
@@ -503,12 +717,73 @@ def print_history(question_store):
     
     return
 
+def print_trend(question_store):
+    
+    """
+    Takes the question ID, and optionally an area as "--area <area>", from among the
+    commandline arguments, prints how many times each answer was given to the question
+    in every survey it was asked in, overall or in the area, from the aggregate store.
+
+    Parameters
+    ----------
+    question_store : Dictionary
+        Contains the question store which was read
+        from 'data-root/AppData/question-store.yml'.
+        
+        The question store holds the mapping between the
+        registered questions and their unique identifiers
+        as well as the usage history of the questions in surveys.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    import yaml
+    
+    if len(sys.argv) not in (3, 5) or (len(sys.argv) == 5 and sys.argv[3] != "--area"):
+        print("\nError: Invalid arguments for printing the trend of a question.")
+        print("Please run as \"question.py trend <question_id> [--area <area>]\" or consult the documentation.")
+        sys.exit(1)
+    
+    question_id = sys.argv[2]
+    area = sys.argv[4] if len(sys.argv) == 5 else None
+    
+    if question_id not in question_store:
+        print("\nError: " + question_id + " is not in the question store.")
+        sys.exit(1)
+    
+    with open(DATA_ROOT_CONFIG_REL, "r") as fd:
+        data_root = Path(yaml.safe_load(fd)['root'])
+    
+    with open(CONFIG_REL, "r") as fd:
+        config = yaml.safe_load(fd)
+    
+    trend = get_question_trend(data_root, question_id, config, area)
+    
+    print("\n" + question_id + " : " + question_store[question_id]["current"])
+    print("Answers of " + ("Area " + area if area is not None else "all of the respondents"))
+    
+    if trend.empty:
+        print("\nNo generated survey has answers to this question" + (" from Area " + area if area is not None else "") + ".")
+        return
+    
+    totals = trend.sum(axis=1)
+    counts = trend.assign(Total=totals)
+    shares = (100 * trend.div(totals.where(totals > 0), axis=0)).round(1).fillna(0)
+    
+    print("\nNumber of answers:\n" + counts.to_string())
+    print("\nShare of the answers (%):\n" + shares.to_string())
+    
+    return
+
 def copy_store():
     
     """
     Takes the destination path from among the command line arguments. Makes a copy
     of the question store at the destination. The path can be either that of a directory
-    or that of a file.
+    or that of a file. If the question store was migrated to SQLite, the database is copied.
 
     Returns
     -------
@@ -516,6 +791,9 @@ def copy_store():
 
     """
     
+    from shutil import copy
+    import yaml
+    
     if len(sys.argv) != 3:
         print("\nError: Invalid arguments for making a copy of the question store.")
         print("Please run as \"question.py getcopy <path/to/destination>\" or consult the documentation.")
@@ -525,7 +803,12 @@ def copy_store():
     with open(DATA_ROOT_CONFIG_REL, "r") as fd:
         data_root = yaml.safe_load(fd)['root']
     
-    source = data_root / QS_FROM_ROOT
+    # The SQLite store is the one in use if it exists
+    source = data_root / QS_DB_FROM_ROOT
+    if not source.is_file():
+        # The changes in the journal are written into the YAML file first
+        source = data_root / QS_FROM_ROOT
+        compact_question_store(data_root, load_question_store(data_root))
     destination = Path(sys.argv[2])
         
     try:
@@ -540,6 +823,41 @@ def copy_store():
     print("Successfully created a copy of the question store")
     return
 
+def migrate_store():
+    
+    """
+    Migrates the YAML question store of the data root into an SQLite database
+    at <data_root>/AppData/question-store.sqlite3. From then on every script uses
+    the SQLite store, question-store.yml is brought up to date with its journal
+    and left as a backup.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    import yaml
+    
+    if len(sys.argv) != 2:
+        print("\nError: Too many arguments for migrating the question store.")
+        print("Please run as \"question.py migrate\" or consult the documentation.")
+        sys.exit(1)
+    
+    with open(DATA_ROOT_CONFIG_REL, "r") as fd:
+        data_root = Path(yaml.safe_load(fd)['root'])
+    
+    if (data_root / QS_DB_FROM_ROOT).is_file():
+        print("\nError: The question store has already been migrated to SQLite.")
+        sys.exit(1)
+    
+    question_store = migrate_question_store(data_root)
+    question_store.close()
+    
+    print("Successfully migrated the question store to " + str(data_root / QS_DB_FROM_ROOT))
+    print("question-store.yml is kept as a backup, it won't be updated anymore.")
+    return
+
 def fresh_question_store(target_directory):
     
     """
@@ -558,8 +876,10 @@ def fresh_question_store(target_directory):
 
     """
     
+    import yaml
+    
     question_store = {"NEXTINLINE" : "AAA", \
-                      "COUNT" : { "current" : 0, "maximum" : 17576 } }
+                      "COUNT" : { "current" : 0, "maximum" : None } }
     
     with open(target_directory / "question-store.yml", 'w') as fd:
         yaml.dump(question_store, fd)
@@ -588,8 +908,13 @@ def main():
     - question.py listfirst <N> (lists the first N key value pairs)
     - question.py listlast <N> (lists the last N key value pairs)
     - question.py listall (lists all of the key value pairs in store)
+    - question.py listrange <first_id>..<last_id> (lists the key value pairs between the two ids, both included)
+    - question.py page <P> [page_size] (lists the Pth page of key value pairs, 20 per page unless page_size is given)
+    - question.py nth <N> (prints the Nth key value pair)
     - question.py historyof <question_id> (lists all of the wordings of the question that were used in the past)
+    - question.py trend <question_id> [--area <area>] (prints how the answers to the question changed from survey to survey, overall or in the area)
     - question.py getcopy <path/to/dest> (creates copy of the store at the destination, the destination can be a file or a directory)
+    - question.py migrate (moves the store into an SQLite database, question-store.sqlite3, which is used from then on)
     - question.py help (prints the docstring)
     
     Returns
@@ -606,6 +931,8 @@ def main():
     
     if command == 'getcopy':
         copy_store()
+    elif command == 'migrate':
+        migrate_store()
     else:
         switch = { "new" : new_question,
                    "fromfile" : load_from_file,
@@ -615,22 +942,26 @@ def main():
                    "listfirst" : print_first_n,
                    "listlast" : print_last_n,
                    "listall" : print_all,
-                   "historyof" : print_history }
+                   "listrange" : print_range,
+                   "page" : print_page,
+                   "nth" : print_nth,
+                   "historyof" : print_history,
+                   "trend" : print_trend }
         
         if sys.argv[1] in switch.keys():
+            import yaml
+            
             with open(DATA_ROOT_CONFIG_REL, "r") as fd:
                 data_root = yaml.safe_load(fd)['root']
             
-            with open(data_root / QS_FROM_ROOT, "r") as fd:
-                question_store = yaml.safe_load(fd)
-                switch[command](question_store)
+            question_store = load_question_store(data_root)
+            switch[command](question_store)
             
-            if command.startswith("list") or command == "historyof" or command == "last":
+            if command.startswith("list") or command in ("historyof", "trend", "last", "page", "nth"):
                 return
             
-            with open(data_root / QS_FROM_ROOT, "w") as fd:
-                yaml.dump(question_store, fd)
-                print("\nDone.")
+            save_question_store(data_root, question_store)
+            print("\nDone.")
         else:
             print("\nError: Unrecognized option, please check the documentation.")
             sys.exit(1)
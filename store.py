@@ -0,0 +1,991 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import marshal
+import unicodedata
+from pathlib import Path
+from collections.abc import Mapping, MutableMapping
+
+# PyYAML and sqlite3 take a while to load, they are imported by the functions that
+# use them, see generate.py
+
+"""
+Takes care of reading and writing the question store.
+
+The question store can live in one of two backends inside <data_root>/AppData:
+    
+    - question-store.yml, the original YAML file, together with question-store.journal,
+    an append-only log of the changes made since the YAML file was last written.
+    The journal is replayed on top of the YAML file when the store is loaded, and
+    once it grows past JOURNAL_MAXIMUM_SIZE it is compacted into a new YAML file.
+    The loaded store is also kept in question-store.cache, a binary copy that is
+    used instead of parsing the YAML file as long as neither file changed since
+    the cache was written
+    
+    - question-store.sqlite3, an SQLite database with indexed lookups by question id
+    and by question text, where every change is written on its own
+
+The SQLite backend is used whenever the database exists, the YAML store can be
+migrated into it with "question.py migrate". Both backends look like the same
+dictionary to the rest of the program:
+    
+    { "NEXTINLINE" : "AAD",
+      "COUNT" : { "current" : 3, "maximum" : None },
+      "AAA" : { "current" : "question text", "2020-01" : "question text as it appeared in 2020-01" },
+      ... }
+
+"""
+
+# The relative path to question-store.yml from the data root
+QS_FROM_ROOT = Path('AppData/question-store.yml')
+# The relative path to the journal of the YAML question store from the data root
+QS_JOURNAL_FROM_ROOT = Path('AppData/question-store.journal')
+# The relative path to the binary cache of the YAML question store from the data root
+QS_CACHE_FROM_ROOT = Path('AppData/question-store.cache')
+# The relative path to the SQLite question store from the data root
+QS_DB_FROM_ROOT = Path('AppData/question-store.sqlite3')
+
+# The version of normalize_question_text, the normalized texts kept in question-store.cache
+# and in the SQLite store are computed again whenever it changes
+NORMALIZATION_VERSION = 4
+
+# The numbering in front of a question, i.e. "2) " or "12. "
+QUESTION_NUMBERING = re.compile(r"^(\s*\d+\s*[).])+\s*")
+# Typographic quotes and dashes are replaced by their ASCII counterparts
+PUNCTUATION_VARIANTS = str.maketrans({ "\u2018" : "'", "\u2019" : "'", "\u201c" : '"', "\u201d" : '"',
+                                       "\u2013" : "-", "\u2014" : "-" })
+# The encodings a UTF-8 text is usually mistaken for, see repair_mojibake
+MOJIBAKE_ENCODINGS = ("cp1252", "latin-1")
+# Stands for any letter outside ASCII in the lossy keys, see lossy_question_key
+LOSSY_PLACEHOLDER = "\ufffd"
+
+# The size in bytes past which the journal is compacted into question-store.yml
+JOURNAL_MAXIMUM_SIZE = 256 * 1024
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id TEXT PRIMARY KEY,
+    current TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    lossy TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS questions_normalized ON questions (normalized);
+
+CREATE TABLE IF NOT EXISTS wordings (
+    question_id TEXT NOT NULL REFERENCES questions (id) ON DELETE CASCADE,
+    survey_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    normalized TEXT NOT NULL,
+    lossy TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (question_id, survey_id)
+);
+CREATE INDEX IF NOT EXISTS wordings_normalized ON wordings (normalized);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# The lossy keys were added after the first SQLite stores were made, their column
+# is added to those stores before the indexes are created
+SQLITE_LOSSY_INDEXES = """
+CREATE INDEX IF NOT EXISTS questions_lossy ON questions (lossy);
+CREATE INDEX IF NOT EXISTS wordings_lossy ON wordings (lossy);
+"""
+
+def repair_mojibake(text):
+    
+    """
+    Undoes the damage done to a text saved as UTF-8 and read back with a Windows
+    encoding, i.e. "PiÃ¹" is turned back into "Più". Texts that aren't damaged in
+    this way, including every plain ASCII text, are returned unchanged.
+    
+    Parameters
+    ----------
+    text : String
+        The text
+    
+    Returns
+    -------
+    repaired : String
+        The text as it was written
+    
+    """
+    
+    if text.isascii():
+        return text
+    
+    for encoding in MOJIBAKE_ENCODINGS:
+        try:
+            return text.encode(encoding).decode("utf-8")
+        except UnicodeError:
+            continue
+    
+    return text
+
+def normalize_question_text(text):
+    
+    """
+    Brings a question text into the form used for looking questions up by their text,
+    so that the different spellings of a question found in the doctrees, in the survey
+    files and in the history of the question store are matched with each other:
+        
+        - the mojibake left behind when a survey was saved with the wrong encoding is
+        repaired, see repair_mojibake
+        - accents are removed, so "Più", "Piu" and "PiÃ¹" all become "piu" while
+        different accented words, like "città" and "cittè", stay different
+        - the numbering in front of the question, i.e. "2) ", is removed
+        - letters are made lowercase and runs of whitespace become a single space
+        - typographic quotes and dashes become their ASCII counterparts
+    
+    Characters that were replaced by "\ufffd" when the text was read can't be told
+    apart anymore and are kept as they are, such texts are matched through
+    lossy_question_key instead.
+    
+    Parameters
+    ----------
+    text : String
+        The question text
+    
+    Returns
+    -------
+    normalized : String
+        The normalized question text
+    
+    """
+    
+    text = unicodedata.normalize("NFKD", repair_mojibake(text))
+    text = "".join(character for character in text if not unicodedata.combining(character))
+    text = text.translate(PUNCTUATION_VARIANTS).casefold()
+    
+    return QUESTION_NUMBERING.sub("", " ".join(text.split()))
+
+def lossy_question_key(text):
+    
+    """
+    Brings a question text into a coarser form than normalize_question_text, where every
+    letter outside ASCII, as well as every "\ufffd" left by a text read with the wrong
+    encoding, becomes LOSSY_PLACEHOLDER. "Più" and "Pi\ufffd" both become "pi\ufffd",
+    so a question whose accented letters were lost is still matched with its correct
+    spelling. Different texts can have the same lossy key, so it is only looked up
+    when the normalized text isn't found.
+    
+    Parameters
+    ----------
+    text : String
+        The question text
+    
+    Returns
+    -------
+    lossy_key : String
+        The lossy key of the question text
+    
+    """
+    
+    # The compatibility composition turns ligatures and the like into ASCII letters
+    # and leaves a single character for every accented letter
+    text = unicodedata.normalize("NFKC", repair_mojibake(text)).translate(PUNCTUATION_VARIANTS).casefold()
+    text = "".join(character if character.isascii() else LOSSY_PLACEHOLDER for character in text)
+    
+    return QUESTION_NUMBERING.sub("", " ".join(text.split()))
+
+# The keys the questions are looked up by, in the order they are tried
+QUESTION_TEXT_KEYS = (normalize_question_text, lossy_question_key)
+
+class SQLiteQuestionStore(MutableMapping):
+    
+    """
+    The question store kept in an SQLite database, behaves like the dictionary
+    read from question-store.yml. The entries of the questions and "COUNT" are
+    returned as views that write through to the database.
+    
+    Every change is part of a single transaction that is committed by
+    save_question_store, if the program stops before that no change is kept.
+    """
+    
+    def __init__(self, db_path):
+        import sqlite3
+        
+        self.db_path = Path(db_path)
+        self.connection = sqlite3.connect(str(self.db_path))
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SQLITE_SCHEMA)
+        for table in ("questions", "wordings"):
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(" + table + ")")]
+            if "lossy" not in columns:
+                self.connection.execute("ALTER TABLE " + table + " ADD COLUMN lossy TEXT NOT NULL DEFAULT ''")
+        self.connection.executescript(SQLITE_LOSSY_INDEXES)
+        
+        try:
+            normalization_version = self.get_counter("NORMALIZATION")
+        except KeyError:
+            normalization_version = None
+        if normalization_version != NORMALIZATION_VERSION:
+            self.normalize_texts()
+    
+    def __getitem__(self, key):
+        if key == "NEXTINLINE":
+            return self.get_counter("NEXTINLINE")
+        if key == "COUNT":
+            return SQLiteCountEntry(self)
+        if key not in self:
+            raise KeyError(key)
+        return SQLiteQuestionEntry(self, key)
+    
+    def __setitem__(self, key, value):
+        if key == "NEXTINLINE":
+            self.set_counter("NEXTINLINE", value)
+        elif key == "COUNT":
+            for name, count in dict(value).items():
+                self.set_counter("COUNT " + name, count)
+        else:
+            entry = dict(value)
+            current = entry.pop("current")
+            self.connection.execute("INSERT OR REPLACE INTO questions (id, current, normalized, lossy) VALUES (?, ?, ?, ?)",
+                                    (key, current, normalize_question_text(current), lossy_question_key(current)))
+            self.connection.execute("DELETE FROM wordings WHERE question_id = ?", (key,))
+            for survey_id, text in entry.items():
+                self.set_wording(key, survey_id, text)
+    
+    def __delitem__(self, key):
+        if key not in self or key in ("NEXTINLINE", "COUNT"):
+            raise KeyError(key)
+        self.connection.execute("DELETE FROM wordings WHERE question_id = ?", (key,))
+        self.connection.execute("DELETE FROM questions WHERE id = ?", (key,))
+    
+    def __contains__(self, key):
+        if key in ("NEXTINLINE", "COUNT"):
+            return True
+        row = self.connection.execute("SELECT 1 FROM questions WHERE id = ?", (key,)).fetchone()
+        return row is not None
+    
+    def __iter__(self):
+        yield "NEXTINLINE"
+        yield "COUNT"
+        for (question_id,) in self.connection.execute("SELECT id FROM questions ORDER BY length(id), id").fetchall():
+            yield question_id
+    
+    def __len__(self):
+        return 2 + self.connection.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+    
+    def get_counter(self, name):
+        row = self.connection.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+    
+    def set_counter(self, name, value):
+        self.connection.execute("INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)", (name, value))
+    
+    def set_wording(self, question_id, survey_id, text):
+        self.connection.execute("INSERT OR REPLACE INTO wordings (question_id, survey_id, text, normalized, lossy) VALUES (?, ?, ?, ?, ?)",
+                                (question_id, survey_id, text, normalize_question_text(text), lossy_question_key(text)))
+    
+    def normalize_texts(self):
+        
+        """
+        Computes the normalized texts and the lossy keys of the whole store again, needed
+        when normalize_question_text or lossy_question_key have changed since they were computed.
+        """
+        
+        for table, key in (("questions", "id"), ("wordings", "rowid")):
+            column = "current" if table == "questions" else "text"
+            rows = self.connection.execute("SELECT " + key + ", " + column + " FROM " + table).fetchall()
+            self.connection.executemany("UPDATE " + table + " SET normalized = ?, lossy = ? WHERE " + key + " = ?",
+                                        [(normalize_question_text(text), lossy_question_key(text), row_key) for row_key, text in rows])
+        self.set_counter("NORMALIZATION", NORMALIZATION_VERSION)
+        self.connection.commit()
+    
+    def find_question_id(self, text):
+        
+        """
+        Looks a question up by any of its wordings through the indexes on the normalized
+        texts, then on the lossy keys. Returns None if no question has this text. The current
+        texts take precedence over the wordings of past surveys, and if more than one question
+        has the text the last registered one is returned, like the inverted question store would.
+        """
+        
+        for column, get_key in zip(("normalized", "lossy"), QUESTION_TEXT_KEYS):
+            key = get_key(text)
+            row = self.connection.execute("SELECT id FROM questions WHERE " + column + " = ? ORDER BY length(id) DESC, id DESC LIMIT 1",
+                                          (key,)).fetchone()
+            if row is None:
+                row = self.connection.execute("SELECT question_id FROM wordings WHERE " + column + " = ? "
+                                              "ORDER BY length(question_id) DESC, question_id DESC LIMIT 1",
+                                              (key,)).fetchone()
+            if row is not None:
+                return row[0]
+        return None
+    
+    def commit(self):
+        self.connection.commit()
+    
+    def close(self):
+        self.connection.close()
+
+class SQLiteQuestionEntry(MutableMapping):
+    
+    """
+    The entry of a single question in the SQLite question store,
+    { "current" : text, survey_id : text, ... }
+    """
+    
+    def __init__(self, question_store, question_id):
+        self.question_store = question_store
+        self.question_id = question_id
+    
+    def __getitem__(self, key):
+        connection = self.question_store.connection
+        if key == "current":
+            row = connection.execute("SELECT current FROM questions WHERE id = ?", (self.question_id,)).fetchone()
+        else:
+            row = connection.execute("SELECT text FROM wordings WHERE question_id = ? AND survey_id = ?",
+                                     (self.question_id, key)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+    
+    def __setitem__(self, key, value):
+        if key == "current":
+            self.question_store.connection.execute("UPDATE questions SET current = ?, normalized = ?, lossy = ? WHERE id = ?",
+                                                   (value, normalize_question_text(value), lossy_question_key(value), self.question_id))
+        else:
+            self.question_store.set_wording(self.question_id, key, value)
+    
+    def __delitem__(self, key):
+        if key == "current":
+            raise KeyError("The current text of a question can't be deleted")
+        cursor = self.question_store.connection.execute("DELETE FROM wordings WHERE question_id = ? AND survey_id = ?",
+                                                        (self.question_id, key))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+    
+    def __iter__(self):
+        yield "current"
+        rows = self.question_store.connection.execute("SELECT survey_id FROM wordings WHERE question_id = ? ORDER BY rowid",
+                                                      (self.question_id,)).fetchall()
+        for (survey_id,) in rows:
+            yield survey_id
+    
+    def __len__(self):
+        row = self.question_store.connection.execute("SELECT COUNT(*) FROM wordings WHERE question_id = ?",
+                                                     (self.question_id,)).fetchone()
+        return 1 + row[0]
+
+class SQLiteCountEntry(MutableMapping):
+    
+    """
+    The "COUNT" entry of the SQLite question store, { "current" : int, "maximum" : int }
+    """
+    
+    def __init__(self, question_store):
+        self.question_store = question_store
+    
+    def __getitem__(self, key):
+        return self.question_store.get_counter("COUNT " + key)
+    
+    def __setitem__(self, key, value):
+        self.question_store.set_counter("COUNT " + key, value)
+    
+    def __delitem__(self, key):
+        raise KeyError("The counters of the question store can't be deleted")
+    
+    def __iter__(self):
+        rows = self.question_store.connection.execute("SELECT name FROM counters WHERE name LIKE 'COUNT %' ORDER BY name").fetchall()
+        for (name,) in rows:
+            yield name[len("COUNT "):]
+    
+    def __len__(self):
+        return len(list(iter(self)))
+
+class SQLiteTextIndex(Mapping):
+    
+    """
+    The inverted question store { question_text : question_id } of the SQLite
+    question store, every lookup is a single indexed query
+    """
+    
+    def __init__(self, question_store):
+        self.question_store = question_store
+    
+    def __getitem__(self, text):
+        question_id = self.question_store.find_question_id(text)
+        if question_id is None:
+            raise KeyError(text)
+        return question_id
+    
+    def __contains__(self, text):
+        return self.question_store.find_question_id(text) is not None
+    
+    def __iter__(self):
+        rows = self.question_store.connection.execute("SELECT normalized FROM questions UNION SELECT normalized FROM wordings").fetchall()
+        for (normalized,) in rows:
+            yield normalized
+    
+    def __len__(self):
+        return len(list(iter(self)))
+
+class YAMLQuestionStore(dict):
+    
+    """
+    The question store read from question-store.yml and its journal. It is a plain
+    dictionary that also remembers the state it was loaded in, so that only the
+    changes made since then are appended to the journal when it is saved.
+    
+    text_indexes holds, for each of QUESTION_TEXT_KEYS, the inverted question store
+    { key : question_id } over every wording of every question along with the questions
+    that have each key { key : [ question_id, ... ] }. They are kept in question-store.cache
+    and brought up to date with the changes whenever the store is saved, see index_questions.
+    """
+    
+    def __init__(self, question_store, text_indexes=None):
+        super().__init__(question_store)
+        if text_indexes is None:
+            text_indexes = tuple(({}, {}) for get_key in QUESTION_TEXT_KEYS)
+            index_questions(self, text_indexes, [key for key in self if key != "NEXTINLINE" and key != "COUNT"])
+        self.text_indexes = text_indexes
+        self.mark_saved()
+    
+    def mark_saved(self):
+        self.saved_state = { key : dict(value) if isinstance(value, dict) else value for key, value in self.items() }
+
+class YAMLTextIndex(Mapping):
+    
+    """
+    The inverted question store { question_text : question_id } of the YAML question
+    store. A text is looked up by its normalized text, then by its lossy key.
+    """
+    
+    def __init__(self, question_store):
+        self.question_store = question_store
+    
+    def __getitem__(self, text):
+        for get_key, (text_index, owners) in zip(QUESTION_TEXT_KEYS, self.question_store.text_indexes):
+            key = get_key(text)
+            if key in text_index:
+                return text_index[key]
+        raise KeyError(text)
+    
+    def __iter__(self):
+        return iter(self.question_store.text_indexes[0][0])
+    
+    def __len__(self):
+        return len(self.question_store.text_indexes[0][0])
+
+class TextIndex(dict):
+    
+    """
+    A text index { key : question_id } made on the fly, over the normalized texts
+    and the lossy keys of the questions it is given, see QUESTION_TEXT_KEYS
+    """
+    
+    def add(self, text, question_id):
+        # A normalized text always wins over a lossy key that happens to be the same
+        self[normalize_question_text(text)] = question_id
+        self.setdefault(lossy_question_key(text), question_id)
+    
+    def find(self, text):
+        for get_key in QUESTION_TEXT_KEYS:
+            key = get_key(text)
+            if key in self:
+                return self[key]
+        return None
+
+def index_questions(question_store, text_indexes, question_ids, previous_entries={}):
+    
+    """
+    Brings the text indexes up to date with the wordings of the given questions. The
+    questions lose the keys of their previous entries and get those of their current
+    entries, then each of these keys goes to one of the questions that have it: the
+    current texts take precedence over the wordings of past surveys, then the last
+    registered question wins. The other keys and questions aren't looked at.
+    
+    Parameters
+    ----------
+    question_store : Dictionary
+        The question store
+    text_indexes : Tuple
+        The text indexes of the question store, see YAMLQuestionStore, updated in place
+    question_ids : Iterable
+        The questions that were added, changed or removed
+    previous_entries : Dictionary, optional
+        { question_id : entry }, the entries the questions had when they were last indexed.
+        The default is {}, for questions that weren't indexed yet.
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    changed_keys = [set() for get_key in QUESTION_TEXT_KEYS]
+    
+    for question_id in question_ids:
+        if question_id in previous_entries:
+            for get_key, (text_index, owners), keys in zip(QUESTION_TEXT_KEYS, text_indexes, changed_keys):
+                for key in { get_key(text) for text in previous_entries[question_id].values() }:
+                    if question_id in owners.get(key, ()):
+                        owners[key].remove(question_id)
+                        keys.add(key)
+    
+    for question_id in question_ids:
+        if question_id in question_store:
+            for get_key, (text_index, owners), keys in zip(QUESTION_TEXT_KEYS, text_indexes, changed_keys):
+                for key in { get_key(text) for text in question_store[question_id].values() }:
+                    owners.setdefault(key, []).append(question_id)
+                    keys.add(key)
+    
+    for get_key, (text_index, owners), keys in zip(QUESTION_TEXT_KEYS, text_indexes, changed_keys):
+        current_keys = {}
+        
+        def precedence(question_id):
+            if question_id not in current_keys:
+                current_keys[question_id] = get_key(question_store[question_id]["current"])
+            return (current_keys[question_id] == key, len(question_id), question_id)
+        
+        for key in keys:
+            if owners.get(key):
+                text_index[key] = max(owners[key], key=precedence)
+            else:
+                owners.pop(key, None)
+                text_index.pop(key, None)
+    
+    return
+
+def update_text_index(question_store, records):
+    
+    """
+    Brings the text indexes of the YAML question store up to date with the journal
+    records of the changes made since the store was loaded or last saved. Only the
+    keys of the questions that changed are looked at, see index_questions.
+    
+    Parameters
+    ----------
+    question_store : YAMLQuestionStore
+        The question store, before mark_saved is called
+    records : List
+        The records returned by diff_question_store
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    changed_ids = list(dict.fromkeys(record["id"] for record in records if "id" in record))
+    index_questions(question_store, question_store.text_indexes, changed_ids, question_store.saved_state)
+    
+    return
+
+def diff_question_store(question_store):
+    
+    """
+    Lists the changes made to the YAML question store since it was loaded or last saved
+    as journal records. Every record is a dictionary with an "op" key:
+        
+        - "add" : a new question, or one that was rewritten, "entry" holds the whole entry
+        - "edit" : the current text of a question changed, "current" holds the new text
+        - "history" : the question was used in a survey, "survey" and "text" hold the wording
+        - "delete" : the question was removed from the store
+        - "counters" : "NEXTINLINE" and "COUNT" hold the new values
+    
+    Parameters
+    ----------
+    question_store : YAMLQuestionStore
+        The question store returned by load_question_store
+    
+    Returns
+    -------
+    records : List
+        The journal records, in the order they are to be replayed
+    
+    """
+    
+    records = []
+    saved_state = question_store.saved_state
+    
+    for key, value in question_store.items():
+        if key == "NEXTINLINE" or key == "COUNT":
+            continue
+        
+        if key not in saved_state or any(survey not in value for survey in saved_state[key]):
+            records.append( { "op" : "add", "id" : key, "entry" : dict(value) } )
+            continue
+        
+        for survey, text in value.items():
+            if saved_state[key].get(survey) == text:
+                continue
+            if survey == "current":
+                records.append( { "op" : "edit", "id" : key, "current" : text } )
+            else:
+                records.append( { "op" : "history", "id" : key, "survey" : survey, "text" : text } )
+    
+    for key in saved_state:
+        if key not in question_store:
+            records.append( { "op" : "delete", "id" : key } )
+    
+    if question_store["NEXTINLINE"] != saved_state["NEXTINLINE"] or question_store["COUNT"] != saved_state["COUNT"]:
+        records.append( { "op" : "counters", "NEXTINLINE" : question_store["NEXTINLINE"], "COUNT" : dict(question_store["COUNT"]) } )
+    
+    return records
+
+def replay_journal(question_store, journal_path):
+    
+    """
+    Applies the records of the journal to the question store read from question-store.yml.
+    Replaying a record more than once gives the same result, so a journal that
+    was already compacted into the YAML file can be replayed safely. A question deleted
+    later in such a journal is no longer in the YAML file, the records that change it
+    before its deletion are skipped.
+    
+    If the program was interrupted while appending to the journal, the last
+    record is incomplete and is ignored.
+    
+    Parameters
+    ----------
+    question_store : Dictionary
+        The contents of question-store.yml
+    journal_path : pathlib.Path object
+        The path to question-store.journal
+    
+    Returns
+    -------
+    question_store : Dictionary
+        The up to date question store
+    
+    """
+    
+    if not journal_path.is_file():
+        return question_store
+    
+    with open(journal_path, "r", encoding="utf-8") as fd:
+        for line in fd:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Incomplete record at the end of the journal
+                break
+            
+            if record["op"] == "add":
+                question_store.update( { record["id"] : record["entry"] } )
+            elif record["op"] == "edit" and record["id"] in question_store:
+                question_store[record["id"]].update( { "current" : record["current"] } )
+            elif record["op"] == "history" and record["id"] in question_store:
+                question_store[record["id"]].update( { record["survey"] : record["text"] } )
+            elif record["op"] == "delete":
+                question_store.pop(record["id"], None)
+            elif record["op"] == "counters":
+                question_store.update( { "NEXTINLINE" : record["NEXTINLINE"], "COUNT" : record["COUNT"] } )
+    
+    return question_store
+
+def write_yaml_snapshot(data_root, question_store):
+    
+    """
+    Writes the whole question store into question-store.yml. The store is first written
+    into a temporary file which then replaces question-store.yml, so an interrupted write
+    never leaves a truncated question store behind.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    question_store : Dictionary
+        The question store
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    import yaml
+    
+    yaml_path = Path(data_root) / QS_FROM_ROOT
+    temporary_path = yaml_path.with_name(yaml_path.name + ".tmp")
+    
+    with open(temporary_path, "w") as fd:
+        # The libyaml bindings are much faster than the pure Python emitter and parser,
+        # but they aren't part of every PyYAML build
+        yaml.dump(dict(question_store), fd, Dumper=getattr(yaml, "CDumper", yaml.Dumper))
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.replace(temporary_path, yaml_path)
+    
+    return
+
+def compact_question_store(data_root, question_store):
+    
+    """
+    Writes the question store into question-store.yml and empties the journal.
+    If the program is interrupted in between, the journal is replayed on top of
+    the new YAML file the next time, which gives the same question store.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    question_store : Dictionary
+        The up to date question store
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    write_yaml_snapshot(data_root, question_store)
+    
+    journal_path = Path(data_root) / QS_JOURNAL_FROM_ROOT
+    if journal_path.is_file():
+        journal_path.unlink()
+    
+    return
+
+def get_store_signature(data_root):
+    
+    """
+    Describes the current state of question-store.yml and of its journal by their
+    modification times and sizes. Any write to either file changes the signature.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    
+    Returns
+    -------
+    signature : Tuple
+        The modification times in nanoseconds and the sizes of the two files,
+        None for the journal if there is none
+    
+    """
+    
+    signature = ()
+    for path in (data_root / QS_FROM_ROOT, data_root / QS_JOURNAL_FROM_ROOT):
+        try:
+            stat = path.stat()
+            signature += (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature += (None, None)
+    
+    return signature
+
+def read_store_cache(data_root):
+    
+    """
+    Reads the question store from question-store.cache, if the cache was written
+    from the current question-store.yml and journal.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    
+    Returns
+    -------
+    question_store : YAMLQuestionStore or None
+        The cached question store along with its text indexes,
+        None if there's no cache or it is out of date
+    
+    """
+    
+    try:
+        with open(data_root / QS_CACHE_FROM_ROOT, "rb") as fd:
+            normalization_version, signature, question_store, text_indexes = marshal.load(fd)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    
+    if normalization_version != NORMALIZATION_VERSION or signature != get_store_signature(data_root):
+        return None
+    
+    return YAMLQuestionStore(question_store, text_indexes)
+
+def write_store_cache(data_root, question_store):
+    
+    """
+    Writes the question store and its text indexes into question-store.cache together
+    with the signature of the files it was read from. The cache is only a shortcut, if it can't be written
+    the question store is simply parsed from the YAML file the next time.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    question_store : YAMLQuestionStore
+        The question store, as it is in question-store.yml and its journal
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    cache_path = data_root / QS_CACHE_FROM_ROOT
+    temporary_path = cache_path.with_name(cache_path.name + ".tmp")
+    
+    try:
+        with open(temporary_path, "wb") as fd:
+            marshal.dump((NORMALIZATION_VERSION, get_store_signature(data_root), dict(question_store), question_store.text_indexes), fd)
+        os.replace(temporary_path, cache_path)
+    except (OSError, ValueError):
+        # ValueError if the store holds values marshal can't write, i.e. dates
+        if temporary_path.is_file():
+            temporary_path.unlink()
+    
+    return
+
+def load_question_store(data_root):
+    
+    """
+    Opens the question store of the data root, the SQLite store if there is one,
+    otherwise the YAML store with its journal replayed on top of it. The YAML store
+    is read from question-store.cache when the cache is up to date.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    
+    Returns
+    -------
+    question_store : YAMLQuestionStore or SQLiteQuestionStore
+        The question store
+    
+    """
+    
+    import yaml
+    
+    data_root = Path(data_root)
+    
+    if (data_root / QS_DB_FROM_ROOT).is_file():
+        return SQLiteQuestionStore(data_root / QS_DB_FROM_ROOT)
+    
+    question_store = read_store_cache(data_root)
+    
+    if question_store is None:
+        with open(data_root / QS_FROM_ROOT, "r") as fd:
+            question_store = yaml.load(fd, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        
+        question_store = YAMLQuestionStore(replay_journal(question_store, data_root / QS_JOURNAL_FROM_ROOT))
+        write_store_cache(data_root, question_store)
+    
+    return question_store
+
+def save_question_store(data_root, question_store):
+    
+    """
+    Writes the changes made to the question store back into the data root.
+    For the YAML store the changes are appended to the journal, and the journal
+    is compacted once it grows past JOURNAL_MAXIMUM_SIZE. The SQLite store
+    commits its transaction.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    question_store : YAMLQuestionStore or SQLiteQuestionStore
+        The question store returned by load_question_store
+    
+    Returns
+    -------
+    None.
+    
+    """
+    
+    if isinstance(question_store, SQLiteQuestionStore):
+        question_store.commit()
+        return
+    
+    records = diff_question_store(question_store)
+    if not records:
+        return
+    
+    journal_path = Path(data_root) / QS_JOURNAL_FROM_ROOT
+    
+    # An incomplete record left by an interrupted write is cut off, otherwise
+    # the first new record would be appended to it
+    if journal_path.is_file():
+        with open(journal_path, "rb+") as fd:
+            content = fd.read()
+            if content and not content.endswith(b"\n"):
+                fd.truncate(content.rfind(b"\n") + 1)
+    
+    with open(journal_path, "a", encoding="utf-8") as fd:
+        for record in records:
+            fd.write(json.dumps(record, ensure_ascii=False) + "\n")
+        fd.flush()
+        os.fsync(fd.fileno())
+    
+    if journal_path.stat().st_size > JOURNAL_MAXIMUM_SIZE:
+        compact_question_store(data_root, question_store)
+    
+    update_text_index(question_store, records)
+    write_store_cache(Path(data_root), question_store)
+    question_store.mark_saved()
+    
+    return
+
+def build_inverted_question_store(question_store):
+    
+    """
+    Returns the inverted question store, the mapping { question_text : question_id }
+    over every wording of every question, the current ones as well as those used in
+    past surveys. The question texts are looked up as they are, they are normalized
+    by normalize_question_text and, if that isn't found, by lossy_question_key.
+    
+    Nothing is built here, the YAML store keeps its indexes up to date in
+    question-store.cache and the SQLite store looks the questions up in the
+    database one by one.
+    
+    Parameters
+    ----------
+    question_store : YAMLQuestionStore or SQLiteQuestionStore
+        The question store returned by load_question_store
+    
+    Returns
+    -------
+    inverted_question_store : YAMLTextIndex or SQLiteTextIndex
+        { question_text : question_id }
+    
+    """
+    
+    if isinstance(question_store, SQLiteQuestionStore):
+        return SQLiteTextIndex(question_store)
+    
+    return YAMLTextIndex(question_store)
+
+def migrate_question_store(data_root):
+    
+    """
+    Copies the YAML question store of the data root into a new SQLite question store.
+    The journal is compacted into the YAML file, which is kept as a backup, but from
+    now on the SQLite store is used.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The OS agnostic path to the data root
+    
+    Returns
+    -------
+    question_store : SQLiteQuestionStore
+        The new question store
+    
+    """
+    
+    data_root = Path(data_root)
+    
+    yaml_question_store = load_question_store(data_root)
+    # The YAML file is brought up to date with its journal before it becomes a backup
+    compact_question_store(data_root, yaml_question_store)
+    
+    question_store = SQLiteQuestionStore(data_root / QS_DB_FROM_ROOT)
+    for key, value in yaml_question_store.items():
+        question_store[key] = value
+    question_store.commit()
+    
+    return question_store
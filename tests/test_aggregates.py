@@ -0,0 +1,77 @@
+"""
+Tests of the aggregate store: the answer counts read back from the aggregate
+of a survey must be the ones counted from the survey itself.
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+from aggregates import build_aggregate, save_aggregate, load_aggregate, aggregate_to_answer_counts
+from generate import build_answer_counts
+
+CONFIG = { "Available Choices" : { "Molto" : {}, "Abbastanza" : {}, "Più sì che no" : {}, "Poco" : {} } }
+
+
+class TestAggregateToAnswerCounts(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_root = Path(self.directory.name)
+        (self.data_root / "Surveys").mkdir()
+        self.survey_path = self.data_root / "Surveys" / "2020-01.csv"
+        self.survey = pd.DataFrame({ "AREA" : ["IT", "HR", "IT", None, "HR", "IT"],
+                                     "AAA" : ["Molto", "Poco", "Molto", "Abbastanza", None, "Più sì che no"],
+                                     "AAB" : ["Poco", "Poco", None, "Molto", "Molto", "Molto"],
+                                     "Comments" : ["a", "b", "c", "d", "e", "f"] })
+        self.survey.to_csv(self.survey_path, index=False)
+    
+    def tearDown(self):
+        self.directory.cleanup()
+    
+    def assert_same_counts(self, answer_counts, expected):
+        self.assertEqual(answer_counts["choices"], expected["choices"])
+        self.assertEqual(answer_counts["questions"], expected["questions"])
+        self.assertEqual(answer_counts["total"], expected["total"])
+        np.testing.assert_array_equal(answer_counts["global counts"], expected["global counts"])
+        for area, i in expected["areas"].items():
+            np.testing.assert_array_equal(answer_counts["area counts"][answer_counts["areas"][area]],
+                                          expected["area counts"][i])
+            self.assertEqual(answer_counts["area totals"][area], expected["area totals"][area])
+    
+    def test_round_trip(self):
+        expected = build_answer_counts(self.survey, ["AAA", "AAB"], CONFIG)
+        save_aggregate(self.data_root, build_aggregate("2020-01", expected, self.survey_path, list(self.survey.columns)))
+        aggregate = load_aggregate(self.data_root, "2020-01")
+        
+        self.assert_same_counts(aggregate_to_answer_counts(aggregate, ["AAA", "AAB"], CONFIG), expected)
+    
+    def test_subset_of_questions(self):
+        expected = build_answer_counts(self.survey, ["AAB"], CONFIG)
+        aggregate = build_aggregate("2020-01", build_answer_counts(self.survey, ["AAA", "AAB"], CONFIG),
+                                    self.survey_path, list(self.survey.columns))
+        
+        # Questions that aren't in the survey are left out like build_answer_counts does
+        self.assert_same_counts(aggregate_to_answer_counts(aggregate, ["AAB", "ZZZ"], CONFIG), expected)
+    
+    def test_questions_not_counted_yet(self):
+        aggregate = build_aggregate("2020-01", build_answer_counts(self.survey, ["AAA"], CONFIG),
+                                    self.survey_path, list(self.survey.columns))
+        self.assertIsNone(aggregate_to_answer_counts(aggregate, ["AAA", "AAB"], CONFIG))
+    
+    def test_answers_that_are_no_longer_choices(self):
+        aggregate = build_aggregate("2020-01", build_answer_counts(self.survey, ["AAA"], CONFIG),
+                                    self.survey_path, list(self.survey.columns))
+        config = { "Available Choices" : { "Molto" : {}, "Abbastanza" : {}, "Poco" : {} } }
+        self.assertIsNone(aggregate_to_answer_counts(aggregate, ["AAA"], config))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Tests of the native Word charts written by docxcharts.py.
+"""
+
+import io
+import re
+import sys
+import unittest
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+import yaml
+from docx import Document
+from docx.shared import Cm
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+from docxcharts import add_docx_chart
+from visuals import pie_chart_data, stacked_bar_data
+
+with open(REPO / "Current Configuration" / "config.yml", "r", encoding="cp1252") as fd:
+    CONFIG = yaml.safe_load(fd)
+CHOICES = list(CONFIG["Available Choices"])
+
+
+def save_to_zip(document):
+    """
+    Saves the document in memory and opens it as the zip archive it is.
+    """
+    buffer = io.BytesIO()
+    document.save(buffer)
+    buffer.seek(0)
+    return zipfile.ZipFile(buffer)
+
+
+class TestDocxCharts(unittest.TestCase):
+    
+    def setUp(self):
+        self.values = pd.Series([7, 3, 5], index=CHOICES[:3])
+        self.pie = pie_chart_data("Question?", self.values, CONFIG, "2020-01", "IT", "percent")
+        self.bar = stacked_bar_data("Question?", [self.values, pd.Series([1, 2], index=CHOICES[1:3])],
+                                    CONFIG, ["2020-01", "2021-03"])
+    
+    def add_charts(self, document, charts):
+        for chart in charts:
+            add_docx_chart(document.add_paragraph().add_run(), chart, Cm(15.0))
+    
+    def test_charts_and_workbooks_are_written(self):
+        document = Document()
+        self.add_charts(document, [self.pie, self.bar, self.pie])
+        archive = save_to_zip(document)
+        names = archive.namelist()
+        
+        self.assertEqual(sorted(name for name in names if name.startswith("word/charts/chart")),
+                         ["word/charts/chart1.xml", "word/charts/chart2.xml", "word/charts/chart3.xml"])
+        self.assertEqual(len([name for name in names if name.startswith("word/embeddings/")]), 3)
+        
+        pie_xml = archive.read("word/charts/chart1.xml").decode("utf-8")
+        self.assertIn("<c:pieChart>", pie_xml)
+        values = re.search(r"<c:val>(.*?)</c:val>", pie_xml).group(1)
+        self.assertEqual(re.findall(r"<c:v>([^<]*)</c:v>", values), ["7", "3", "5"])
+        self.assertIn("<c:barChart>", archive.read("word/charts/chart2.xml").decode("utf-8"))
+        
+        workbook = zipfile.ZipFile(io.BytesIO(archive.read("word/embeddings/Microsoft_Excel_Sheet1.xlsx")))
+        self.assertIn("xl/worksheets/sheet1.xml", workbook.namelist())
+    
+    def test_partnames_continue_in_a_reopened_document(self):
+        document = Document()
+        self.add_charts(document, [self.pie, self.pie])
+        buffer = io.BytesIO()
+        document.save(buffer)
+        buffer.seek(0)
+        
+        document = Document(buffer)
+        self.add_charts(document, [self.bar])
+        names = save_to_zip(document).namelist()
+        self.assertIn("word/charts/chart3.xml", names)
+        self.assertEqual(len([name for name in names if name.startswith("word/charts/chart")]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
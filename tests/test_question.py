@@ -0,0 +1,43 @@
+"""
+Tests of the question identifiers of question.py.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+from question import QID_to_int, int_to_QID, increment_QID, decrement_QID, is_valid_QID, LEGACY_QID_MAXIMUM
+
+
+class TestQID(unittest.TestCase):
+    
+    def test_known_values(self):
+        self.assertEqual(QID_to_int("AAA"), 0)
+        self.assertEqual(QID_to_int("AAB"), 1)
+        self.assertEqual(QID_to_int("ABA"), 26)
+        self.assertEqual(QID_to_int("ZZZ"), LEGACY_QID_MAXIMUM - 1)
+        self.assertEqual(QID_to_int("AAAA"), LEGACY_QID_MAXIMUM)
+    
+    def test_round_trip_across_the_three_letter_limit(self):
+        for index in list(range(0, 2000)) + list(range(LEGACY_QID_MAXIMUM - 1000, LEGACY_QID_MAXIMUM + 1000)):
+            question_id = int_to_QID(index)
+            self.assertTrue(is_valid_QID(question_id))
+            self.assertEqual(QID_to_int(question_id), index)
+            self.assertEqual(int_to_QID(QID_to_int(question_id)), question_id)
+    
+    def test_round_trip_of_longer_ids(self):
+        for question_id in ("ZZZZ", "AAAAA", "ZZZZZ", "AAAAAA", "HELLOWORLD"):
+            self.assertEqual(int_to_QID(QID_to_int(question_id)), question_id)
+    
+    def test_increment_and_decrement(self):
+        self.assertEqual(increment_QID("ZZZ"), "AAAA")
+        self.assertEqual(decrement_QID("AAAA"), "ZZZ")
+        self.assertEqual(increment_QID("AAZ"), "ABA")
+        self.assertEqual(decrement_QID(increment_QID("AZZZ")), "AZZZ")
+
+
+if __name__ == "__main__":
+    unittest.main()
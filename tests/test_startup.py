@@ -0,0 +1,110 @@
+"""
+Checks that the light commands of generate.py and question.py, the help and the
+errors in the command line arguments, answer without loading PyYAML, pandas, plotly
+or python-docx, and within the startup budget of STARTUP_BUDGET seconds.
+
+The commands were measured at 60 to 100 ms, about 20 ms of which is the interpreter
+starting and about 15 ms compiling generate.py, which Python doesn't cache for the
+script being run. Each command is timed as the median of TIMED_RUNS runs after one
+run that writes the bytecode of the imported modules, and is allowed NOISE_MARGIN
+on top of the budget for the noise of shared CI machines.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import unittest
+from pathlib import Path
+
+
+REPO = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("yaml", "pandas", "numpy", "plotly", "docx")
+STARTUP_BUDGET = 0.100
+NOISE_MARGIN = 0.20
+TIMED_RUNS = 5
+LIGHT_COMMANDS = (("generate.py", "help"),
+                  ("generate.py",),
+                  ("generate.py", "one.csv", "two.csv"),
+                  ("generate.py", "batch"),
+                  ("generate.py", "batch", "--unknown-questions", "maybe", "2020-01.csv"),
+                  ("question.py", "help"),
+                  ("question.py", "unknown-command"))
+PROBE = """
+import json, runpy, sys
+sys.argv = {argv!r}
+try:
+    runpy.run_path({script!r}, run_name="__main__")
+except SystemExit:
+    pass
+print(json.dumps(sorted(name for name in sys.modules if name.split(".")[0] in {heavy!r})))
+"""
+# The bytecode of the modules is written as it would be on the machine of a user
+ENVIRONMENT = { name : value for name, value in os.environ.items() if name != "PYTHONDONTWRITEBYTECODE" }
+
+
+def get_loaded_heavy_modules(script, *arguments):
+    """
+    Runs a command of a script of the repository in a fresh interpreter.
+    
+    Parameters
+    ----------
+    script : str
+        Name of the script, e.g. "generate.py".
+    *arguments : str
+        Command line arguments given to the script.
+    
+    Returns
+    -------
+    list of str
+        The heavy modules loaded by the command.
+    """
+    code = PROBE.format(argv=[script, *arguments], script=str(REPO / script), heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO, env=ENVIRONMENT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def time_command(script, *arguments):
+    """
+    Times a command of a script of the repository the way a user runs it.
+    
+    Parameters
+    ----------
+    script : str
+        Name of the script, e.g. "generate.py".
+    *arguments : str
+        Command line arguments given to the script.
+    
+    Returns
+    -------
+    float
+        The median wall time of TIMED_RUNS runs, in seconds.
+    """
+    command = [sys.executable, str(REPO / script), *arguments]
+    subprocess.run(command, cwd=REPO, env=ENVIRONMENT, capture_output=True, stdin=subprocess.DEVNULL)
+    
+    timings = []
+    for run in range(TIMED_RUNS):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=REPO, env=ENVIRONMENT, capture_output=True, stdin=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+class TestStartup(unittest.TestCase):
+    
+    def test_no_heavy_imports(self):
+        for command in LIGHT_COMMANDS:
+            with self.subTest(command=" ".join(command)):
+                self.assertEqual(get_loaded_heavy_modules(*command), [])
+    
+    def test_startup_budget(self):
+        for command in LIGHT_COMMANDS:
+            with self.subTest(command=" ".join(command)):
+                self.assertLess(time_command(*command), STARTUP_BUDGET * (1 + NOISE_MARGIN))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,243 @@
+"""
+Tests of the question store: looking questions up by their text, keeping the text
+indexes of the YAML store up to date, the journal, its compaction and the migration
+to the SQLite store.
+"""
+
+import sys
+import tempfile
+import unittest
+from collections.abc import Mapping
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+import store
+from question import int_to_QID
+
+
+def write_yaml_store(data_root, questions):
+    """
+    Writes a YAML question store holding the given questions into the data root.
+    
+    Parameters
+    ----------
+    data_root : pathlib.Path object
+        The data root, AppData is created in it
+    questions : Dictionary
+        { question_id : entry }, the ids must follow each other from "AAA"
+    
+    Returns
+    -------
+    None.
+    """
+    (data_root / "AppData").mkdir(parents=True, exist_ok=True)
+    question_store = { "NEXTINLINE" : int_to_QID(len(questions)),
+                       "COUNT" : { "current" : len(questions), "maximum" : None } }
+    question_store.update(questions)
+    with open(data_root / store.QS_FROM_ROOT, "w") as fd:
+        yaml.dump(question_store, fd)
+
+
+def to_dict(question_store):
+    """
+    Returns a copy of a question store of either backend as plain dictionaries.
+    """
+    return { key : dict(value) if isinstance(value, Mapping) else value for key, value in question_store.items() }
+
+
+def get_indexed_ids(question_store):
+    """
+    Returns the text indexes of a YAML question store without the order of the owners.
+    """
+    return [(dict(text_index), { key : sorted(ids) for key, ids in owners.items() })
+            for text_index, owners in question_store.text_indexes]
+
+
+class StoreTestCase(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.data_root = Path(self.directory.name)
+    
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+class TestQuestionText(StoreTestCase):
+    
+    def test_lossy_key_matches_lost_accents(self):
+        self.assertEqual(store.lossy_question_key("Più"), store.lossy_question_key("Pi\ufffd"))
+        self.assertEqual(store.lossy_question_key("2) Qual è la data?"), store.lossy_question_key("Qual \ufffd la data?"))
+        self.assertNotEqual(store.normalize_question_text("Più"), store.normalize_question_text("Pi\ufffd"))
+    
+    def test_mojibake_is_repaired(self):
+        self.assertEqual(store.normalize_question_text("PiÃ¹ sÃ¬"), store.normalize_question_text("Più sì"))
+    
+    def test_yaml_store_resolves_lost_accents(self):
+        write_yaml_store(self.data_root, { "AAA" : { "current" : "Qual è la data più prossima?" },
+                                           "AAB" : { "current" : "Più o meno?" } })
+        inverted_question_store = store.build_inverted_question_store(store.load_question_store(self.data_root))
+        self.assertEqual(inverted_question_store["Qual \ufffd la data pi\ufffd prossima?"], "AAA")
+        self.assertEqual(inverted_question_store["Pi\ufffd o meno?"], inverted_question_store["Più o meno?"])
+        self.assertNotIn("Qual è la data?", inverted_question_store)
+    
+    def test_sqlite_store_resolves_lost_accents(self):
+        write_yaml_store(self.data_root, { "AAA" : { "current" : "Qual è la data più prossima?" },
+                                           "AAB" : { "current" : "Altro", "2020-01" : "Più o meno?" } })
+        question_store = store.migrate_question_store(self.data_root)
+        inverted_question_store = store.build_inverted_question_store(question_store)
+        self.assertEqual(inverted_question_store["Qual \ufffd la data pi\ufffd prossima?"], "AAA")
+        self.assertEqual(inverted_question_store["Pi\ufffd o meno?"], "AAB")
+        question_store.close()
+    
+    def test_exact_text_wins_over_lossy_key(self):
+        write_yaml_store(self.data_root, { "AAA" : { "current" : "Città" },
+                                           "AAB" : { "current" : "Citt\ufffd" } })
+        inverted_question_store = store.build_inverted_question_store(store.load_question_store(self.data_root))
+        self.assertEqual(inverted_question_store["Città"], "AAA")
+        self.assertEqual(inverted_question_store["Citt\ufffd"], "AAB")
+
+
+class TestTextIndex(StoreTestCase):
+    
+    def test_incremental_index_matches_rebuild(self):
+        write_yaml_store(self.data_root, { "AAA" : { "current" : "First?", "2020-01" : "Shared?" },
+                                           "AAB" : { "current" : "Second?", "2020-01" : "Shared?" },
+                                           "AAC" : { "current" : "Shared?" } })
+        question_store = store.load_question_store(self.data_root)
+        self.assertEqual(store.build_inverted_question_store(question_store)["Shared?"], "AAC")
+        
+        del question_store["AAC"]
+        question_store["AAA"]["current"] = "Più?"
+        question_store["AAB"]["2021-03"] = "Pi\ufffd?"
+        store.save_question_store(self.data_root, question_store)
+        
+        rebuilt = store.YAMLQuestionStore(dict(question_store))
+        self.assertEqual(get_indexed_ids(question_store), get_indexed_ids(rebuilt))
+        self.assertEqual(store.build_inverted_question_store(question_store)["Shared?"], "AAB")
+        self.assertEqual(store.build_inverted_question_store(question_store)["Più?"], "AAA")
+        self.assertEqual(store.build_inverted_question_store(question_store)["Pi\ufffd?"], "AAB")
+        
+        reloaded = store.load_question_store(self.data_root)
+        self.assertEqual(get_indexed_ids(reloaded), get_indexed_ids(rebuilt))
+
+
+class TestJournal(StoreTestCase):
+    
+    def setUp(self):
+        super().setUp()
+        write_yaml_store(self.data_root, { "AAA" : { "current" : "First?" },
+                                           "AAB" : { "current" : "Second?" } })
+    
+    def load_without_cache(self):
+        (self.data_root / store.QS_CACHE_FROM_ROOT).unlink(missing_ok=True)
+        return store.load_question_store(self.data_root)
+    
+    def make_changes(self):
+        question_store = store.load_question_store(self.data_root)
+        question_store["AAA"]["2020-01"] = "1) First?"
+        store.save_question_store(self.data_root, question_store)
+        question_store["AAC"] = { "current" : "Third?" }
+        question_store["NEXTINLINE"] = "AAD"
+        question_store["COUNT"]["current"] = 3
+        question_store["AAB"]["current"] = "Second, again?"
+        store.save_question_store(self.data_root, question_store)
+        return question_store
+    
+    def test_replay(self):
+        question_store = self.make_changes()
+        with open(self.data_root / store.QS_FROM_ROOT, "r") as fd:
+            self.assertEqual(set(yaml.safe_load(fd)), { "NEXTINLINE", "COUNT", "AAA", "AAB" })
+        
+        self.assertEqual(to_dict(self.load_without_cache()), to_dict(question_store))
+        self.assertEqual(to_dict(store.load_question_store(self.data_root)), to_dict(question_store))
+    
+    def test_replay_twice(self):
+        question_store = self.make_changes()
+        with open(self.data_root / store.QS_FROM_ROOT, "r") as fd:
+            snapshot = yaml.safe_load(fd)
+        replayed = store.replay_journal(snapshot, self.data_root / store.QS_JOURNAL_FROM_ROOT)
+        replayed = store.replay_journal(to_dict(replayed), self.data_root / store.QS_JOURNAL_FROM_ROOT)
+        self.assertEqual(to_dict(replayed), to_dict(question_store))
+    
+    def test_incomplete_record_is_ignored(self):
+        question_store = self.make_changes()
+        with open(self.data_root / store.QS_JOURNAL_FROM_ROOT, "a", encoding="utf-8") as fd:
+            fd.write('{"op": "delete", "id": "AA')
+        
+        self.assertEqual(to_dict(self.load_without_cache()), to_dict(question_store))
+        
+        # The next save cuts the incomplete record off before appending
+        question_store = self.load_without_cache()
+        question_store["AAA"]["current"] = "First, again?"
+        store.save_question_store(self.data_root, question_store)
+        self.assertEqual(to_dict(self.load_without_cache()), to_dict(question_store))
+    
+    def test_compaction(self):
+        with mock.patch.object(store, "JOURNAL_MAXIMUM_SIZE", 0):
+            question_store = self.make_changes()
+        
+        self.assertFalse((self.data_root / store.QS_JOURNAL_FROM_ROOT).is_file())
+        with open(self.data_root / store.QS_FROM_ROOT, "r") as fd:
+            self.assertEqual(yaml.safe_load(fd), to_dict(question_store))
+        self.assertEqual(to_dict(self.load_without_cache()), to_dict(question_store))
+    
+    def test_replay_after_interrupted_compaction(self):
+        question_store = store.load_question_store(self.data_root)
+        question_store["AAB"]["current"] = "Second, again?"
+        question_store["AAB"]["2020-01"] = "Second?"
+        store.save_question_store(self.data_root, question_store)
+        del question_store["AAB"]
+        store.save_question_store(self.data_root, question_store)
+        
+        # The program stops after writing the YAML file but before emptying the journal
+        store.write_yaml_snapshot(self.data_root, question_store)
+        self.assertTrue((self.data_root / store.QS_JOURNAL_FROM_ROOT).is_file())
+        
+        self.assertEqual(dict(self.load_without_cache()), dict(question_store))
+
+
+class TestMigration(StoreTestCase):
+    
+    def test_round_trip(self):
+        write_yaml_store(self.data_root, { "AAA" : { "current" : "First?", "2020-01" : "1) First?" },
+                                           "AAB" : { "current" : "Più o meno?" } })
+        question_store = store.load_question_store(self.data_root)
+        question_store["AAB"]["2020-01"] = "Pi\ufffd o meno?"
+        store.save_question_store(self.data_root, question_store)
+        expected = to_dict(question_store)
+        
+        migrated = store.migrate_question_store(self.data_root)
+        self.assertEqual(to_dict(migrated), expected)
+        migrated.close()
+        
+        # The journal was compacted into the YAML file, which is kept as a backup
+        self.assertFalse((self.data_root / store.QS_JOURNAL_FROM_ROOT).is_file())
+        with open(self.data_root / store.QS_FROM_ROOT, "r") as fd:
+            self.assertEqual(yaml.safe_load(fd), expected)
+        
+        question_store = store.load_question_store(self.data_root)
+        self.assertIsInstance(question_store, store.SQLiteQuestionStore)
+        self.assertEqual(to_dict(question_store), expected)
+        
+        question_store["AAC"] = { "current" : "Third?" }
+        question_store["AAA"]["2021-03"] = "First?"
+        question_store["NEXTINLINE"] = "AAD"
+        question_store["COUNT"]["current"] = 3
+        expected = to_dict(question_store)
+        store.save_question_store(self.data_root, question_store)
+        question_store.close()
+        
+        question_store = store.load_question_store(self.data_root)
+        self.assertEqual(to_dict(question_store), expected)
+        self.assertEqual(store.build_inverted_question_store(question_store)["3) Third?"], "AAC")
+        question_store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Tests of the images drawn by the Pillow chart renderer of visuals.py.
+"""
+
+import io
+import sys
+import unittest
+from pathlib import Path
+
+import pandas as pd
+import yaml
+from PIL import Image
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+from visuals import CHART_HEIGHT, CHART_WIDTH, CHART_RENDERERS, encode_png, pie_chart_data, stacked_bar_data
+
+with open(REPO / "Current Configuration" / "config.yml", "r", encoding="cp1252") as fd:
+    CONFIG = yaml.safe_load(fd)
+CHOICES = list(CONFIG["Available Choices"])
+
+
+def hex_to_rgb(color):
+    """
+    Turns a #RRGGBB color into the (red, green, blue) of a pixel.
+    """
+    color = color.lstrip("#")
+    return tuple(int(color[i:i+2], 16) for i in (0, 2, 4))
+
+
+class TestPillowCharts(unittest.TestCase):
+    
+    def setUp(self):
+        self.values = pd.Series([7, 3, 5], index=CHOICES[:3])
+        self.pie = pie_chart_data("Question?", self.values, CONFIG, "2020-01", "IT", "value+percent+label")
+        self.bar = stacked_bar_data("Question?", [self.values, pd.Series([1, 2], index=CHOICES[1:3])],
+                                    CONFIG, ["2020-01", "2021-03"])
+        self.render = CHART_RENDERERS["Pillow"][0]
+    
+    def test_encoded_png_has_the_same_pixels(self):
+        image = Image.new("RGB", (5, 3), "white")
+        image.putpixel((1, 2), (10, 20, 30))
+        decoded = Image.open(io.BytesIO(encode_png(image)))
+        decoded.load()
+        self.assertEqual(decoded.mode, "RGB")
+        self.assertEqual(decoded.tobytes(), image.tobytes())
+    
+    def test_images_have_the_size_and_the_colors_of_the_charts(self):
+        for scale in (1, 2):
+            images = self.render([self.pie, self.bar], [scale, scale])
+            for chart, png in zip((self.pie, self.bar), images):
+                with self.subTest(chart=chart["type"], scale=scale):
+                    image = Image.open(io.BytesIO(png)).convert("RGB")
+                    self.assertEqual(image.size, (CHART_WIDTH * scale, CHART_HEIGHT * scale))
+                    colors = { color for count, color in image.getcolors(image.width * image.height) }
+                    if chart["type"] == "pie":
+                        expected = chart["colors"]
+                    else:
+                        expected = [series["color"] for series in chart["series"]]
+                    for color in expected:
+                        self.assertIn(hex_to_rgb(color), colors)
+    
+    def test_empty_charts_are_drawn(self):
+        empty = pie_chart_data("Question?", pd.Series([0, 0], index=CHOICES[:2]), CONFIG, "2020-01", "IT", "percent")
+        image = Image.open(io.BytesIO(self.render([empty], [1])[0]))
+        self.assertEqual(image.size, (CHART_WIDTH, CHART_HEIGHT))
+
+
+if __name__ == "__main__":
+    unittest.main()
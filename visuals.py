@@ -1,12 +1,97 @@
 # -*- coding: utf-8 -*-
 
+import os
 import sys
-import plotly.graph_objects as go
+import json
+import math
+import zlib
+import struct
+import queue
+import hashlib
+import tempfile
+import textwrap
+import threading
+from pathlib import Path
+from importlib.util import find_spec
+from profiling import stage
 
-def draw_pie(question, values, config, date, area, textinfo):
+# The number of charts sent to the renderer in a single export call
+CHART_EXPORT_BATCH_SIZE = 64
+
+# The Chart Backend that puts the charts in the documents as native Word charts
+# instead of images, see docxcharts.py. The backends that render images are
+# listed in CHART_RENDERERS
+NATIVE_CHART_BACKEND = "DOCX"
+
+# The size of the images rendered by plotly, the other renderers use the same size
+CHART_WIDTH = 700
+CHART_HEIGHT = 500
+
+# The look of the default plotly template, reproduced by the Pillow renderer, the sizes in pixels
+PLOTLY_FONT_COLOR = "#2A3F5F"
+PLOTLY_PLOT_BACKGROUND = "#E5ECF6"
+PLOTLY_TITLE_FONT_SIZE = 17
+PLOTLY_FONT_SIZE = 12
+# Where the title starts and the height of each of its lines, as fractions of the height
+# of the image, where the legend starts as a fraction of its width, and the height of a
+# line of the legend in pixels
+TITLE_TOP = 0.03
+TITLE_LINE_HEIGHT = 0.05
+LEGEND_LEFT = 0.78
+LEGEND_LINE_HEIGHT = 20
+
+# The fonts the Pillow renderer looks for, the plotly ones first
+CHART_FONTS = ("OpenSans-Regular.ttf", "verdana.ttf", "Verdana.ttf", "arial.ttf", "Arial.ttf",
+               "DejaVuSans.ttf", "LiberationSans-Regular.ttf")
+
+# The fonts of the Pillow renderer by size, see get_font, and the masks of the
+# lines of text already drawn, see draw_text
+font_cache = {}
+text_mask_cache = {}
+TEXT_MASK_CACHE_SIZE = 4096
+
+# The .png images of the Pillow renderer are compressed at the fastest level,
+# they come out slightly bigger than the plotly ones
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_COMPRESS_LEVEL = 1
+
+# The lookup built by get_choice_lookup and the Available Choices it was built from
+choice_lookup_cache = { "options" : None, "lookup" : None }
+
+def get_choice_lookup(options):
+    
+    """
+    Builds the lookup { answer : (position, label, color) } from the Available Choices
+    of the config file, position being the place of the answer in the config file.
+    The lookup is built once and reused as long as the same options are passed.
+
+    Parameters
+    ----------
+    options : Dictionary
+        The Available Choices in the config file
+
+    Returns
+    -------
+    lookup : Dictionary
+        { answer : (position, label, color) }
+
+    """
+    
+    if choice_lookup_cache["options"] is not options:
+        lookup = {}
+        for position, option in enumerate(options):
+            lookup.update( { option : (position, options[option]["Label"], options[option]["Hex"]) } )
+        choice_lookup_cache.update( { "options" : options, "lookup" : lookup } )
+    
+    return choice_lookup_cache["lookup"]
+
+@stage("build chart")
+def pie_chart_data(question, values, config, date, area, textinfo):
     
     """
-    Draws a pie chart
+    Collects everything needed to draw a pie chart, independently of how the chart
+    is drawn: as a plotly figure (see plotly_figure) or as a native Word chart
+    (see docxcharts.add_docx_chart)
 
     Parameters
     ----------
@@ -30,8 +115,9 @@ def draw_pie(question, values, config, date, area, textinfo):
 
     Returns
     -------
-    fig : plotly.graph_objects.Figure
-        The corresponding pie chart
+    chart : Dictionary
+        { "type" : "pie", "title", "annotations", "labels", "values", "colors",
+          "textinfo", "font size", "line color", "line width" }
 
     """
     
@@ -42,36 +128,38 @@ def draw_pie(question, values, config, date, area, textinfo):
     answers = values.index
     
     # Creates the colors
-    options = config['Available Choices']
+    lookup = get_choice_lookup(config['Available Choices'])
     for answer in answers:
-        if answer not in options:
-            print(answer + " given to the question " + question + " is not"
+        if answer not in lookup:
+            print(str(answer) + " given to the question " + question + " is not "
                   "a valid answer, check the spelling, exiting...")
             sys.exit(1)
     
-    for option in options:
-        if option in answers:
-            labels.append(options[option]["Label"])
-            colors.append(options[option]["Hex"])
-            ordered_values.append(values[option])
+    # The slices follow the order of the Available Choices
+    for answer in sorted(answers, key=lambda answer: lookup[answer][0]):
+        labels.append(lookup[answer][1])
+        colors.append(lookup[answer][2])
+        ordered_values.append(values[answer])
         
     pie_chart_style = config["Pie Chart Style"]
-    annotation_list = [dict(text=area, x=0, y=1.07, font_size=17, showarrow=False), dict(text=date, x=0, y=1, font_size=17, showarrow=False)]
-    
-    fig = go.Figure( data=[ go.Pie( labels = labels, values = ordered_values ) ] )
-    fig.update_traces( textinfo=textinfo, textfont_size=pie_chart_style["On Each Slice"]["Font"],
-                          marker=dict( colors=colors, line=dict(color=pie_chart_style["Line Color"], width=pie_chart_style["Line Width"]) ) )
     
-    fig.update_layout(
-        title_text=question,
-        annotations=annotation_list)
-    
-    return fig
+    return { "type" : "pie",
+             "title" : question,
+             "annotations" : [area, date],
+             "labels" : labels,
+             "values" : ordered_values,
+             "colors" : colors,
+             "textinfo" : textinfo,
+             "font size" : pie_chart_style["On Each Slice"]["Font"],
+             "line color" : pie_chart_style["Line Color"],
+             "line width" : pie_chart_style["Line Width"] }
 
-def draw_stacked_bar(question, values, config, dates):
+@stage("build chart")
+def stacked_bar_data(question, values, config, dates):
     
     """
-    Draws a stacked bar graph for better comparison between different survey results.
+    Collects everything needed to draw a stacked bar graph, independently of how
+    the graph is drawn, see pie_chart_data
 
     Parameters
     ----------
@@ -87,34 +175,883 @@ def draw_stacked_bar(question, values, config, dates):
         A list of the ids of the surveys whose results are being
         compared in the bar chart
 
+    Returns
+    -------
+    chart : Dictionary
+        { "type" : "bar", "title", "categories", "series" }, each one of the series
+        being { "name", "values", "color" }
+
+    """
+    
+    lookup = get_choice_lookup(config['Available Choices'])
+    
+    present_answers = set()
+    for value_series in values:
+        present_answers.update(value_series.index)
+
+    series = []
+    # The bars follow the order of the Available Choices
+    for answer in sorted(present_answers & lookup.keys(), key=lambda answer: lookup[answer][0]):
+        counts = []
+        for value_series in values:
+            if answer in value_series.index:
+                counts.append(value_series[answer])
+            else:
+                counts.append(0)
+        
+        series.append( { "name" : lookup[answer][1], "values" : counts, "color" : lookup[answer][2] } )
+    
+    return { "type" : "bar",
+             "title" : question,
+             "categories" : dates,
+             "series" : series }
+
+def plotly_figure(chart):
+    
+    """
+    Draws a chart described by pie_chart_data or stacked_bar_data as a plotly figure
+
+    Parameters
+    ----------
+    chart : Dictionary
+        The description of the chart
+
     Returns
     -------
     fig : plotly.graph_objects.Figure
-        The corresponding bar chart
+        The corresponding chart
 
     """
     
+    import plotly.graph_objects as go
     
-    options = config['Available Choices']
+    if chart["type"] == "pie":
+        area, date = chart["annotations"]
+        annotation_list = [dict(text=area, x=0, y=1.07, font_size=17, showarrow=False), dict(text=date, x=0, y=1, font_size=17, showarrow=False)]
+        
+        fig = go.Figure( data=[ go.Pie( labels = chart["labels"], values = chart["values"] ) ] )
+        fig.update_traces( textinfo=chart["textinfo"], textfont_size=chart["font size"],
+                              marker=dict( colors=chart["colors"], line=dict(color=chart["line color"], width=chart["line width"]) ) )
+        
+        fig.update_layout(
+            title_text=chart["title"],
+            annotations=annotation_list)
+    else:
+        go_bars = []
+        for series in chart["series"]:
+            go_bars.append( go.Bar( name=series["name"], x=chart["categories"], y=series["values"], marker_color=series["color"] ) )
+        
+        fig = go.Figure(data=go_bars)
+        # Change the bar mode
+        fig.update_layout(title=chart["title"], barmode='stack')
     
-    present_answers = []
-    for value_series in values:
-        present_answers.extend(value_series.index)
-
-    go_bars = []
-    for option in options:
-        if option in present_answers:
-            counts = []
-            for value_series in values:
-                if option in value_series.index:
-                    counts.append(value_series[option])
-                else:
-                    counts.append(0)
+    return fig
+
+def format_percent(fraction):
+    
+    """
+    Formats a fraction the way plotly writes the percentages on the slices,
+    with three significant digits (50%, 33.3%, 8.33%)
+    """
+    
+    return "{:.3g}%".format(fraction * 100)
+
+def text_color(background):
+    
+    """
+    Picks a dark or a light text color, whichever reads better on the given #RRGGBB background
+    """
+    
+    background = background.lstrip("#")
+    if len(background) != 6:
+        return PLOTLY_FONT_COLOR
+    red, green, blue = (int(background[i:i+2], 16) / 255 for i in (0, 2, 4))
+    luminance = 0.299 * red + 0.587 * green + 0.114 * blue
+    
+    return PLOTLY_FONT_COLOR if luminance > 0.5 else "#FFFFFF"
+
+def get_font(size):
+    
+    """
+    Gives the font of the Pillow renderer at the given size in pixels, the first
+    one of CHART_FONTS found among the fonts of the system, each size is loaded
+    once and kept in font_cache
+    """
+    
+    from PIL import ImageFont
+    
+    if size not in font_cache:
+        for name in CHART_FONTS:
+            try:
+                font_cache[size] = ImageFont.truetype(name, size)
+                break
+            except OSError:
+                pass
+        else:
+            # The font that comes with Pillow has no accented letters
+            font_cache[size] = ImageFont.load_default(size)
+    
+    return font_cache[size]
+
+def draw_text(image, position, text, color, size, anchor="la"):
+    
+    """
+    Writes a text on an image with the font of the Pillow renderer. The lines of the
+    text are drawn once into a mask kept in text_mask_cache, and only stamped on the
+    image with its color afterwards, since the labels, the percentages and the
+    annotations come back chart after chart and FreeType takes about a millisecond
+    to draw a line.
+
+    Parameters
+    ----------
+    image : PIL.Image.Image
+        Where the text is written
+    position : Tuple
+        The (x, y) of the anchor of the text, in pixels
+    text : String
+        The text, the lines of a text anchored in the middle are centered
+    color : String
+        The color of the text
+    size : Number
+        The size of the font, in pixels
+    anchor : String
+        Which point of the text is at position, see the text anchors of Pillow
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    from PIL import Image, ImageDraw
+    
+    size = max(1, round(size))
+    lines = str(text).split("\n")
+    line_height = round(size * 1.2)
+    x, y = position
+    # The middle of the text is the middle of its lines
+    y -= (len(lines) - 1) * line_height / 2
+    
+    for line in lines:
+        key = (line, size, anchor)
+        if key not in text_mask_cache:
+            if len(text_mask_cache) >= TEXT_MASK_CACHE_SIZE:
+                text_mask_cache.clear()
+            font = get_font(size)
+            left, top, right, bottom = font.getbbox(line, anchor=anchor)
+            mask = Image.new("L", (max(1, right - left), max(1, bottom - top)))
+            ImageDraw.Draw(mask).text((-left, -top), line, fill=255, font=font, anchor=anchor)
+            text_mask_cache[key] = (mask, left, top)
+        
+        mask, left, top = text_mask_cache[key]
+        image.paste(color, (round(x + left), round(y + top)), mask)
+        y += line_height
+    
+    return
+
+def draw_legend(image, entries, x, y, scale):
+    
+    """
+    Draws a legend like the plotly one: a colored square followed by the name of each entry
+
+    Parameters
+    ----------
+    image : PIL.Image.Image
+        Where the legend is drawn
+    entries : List
+        The (name, color) of the entries, from the top one down
+    x, y : int
+        The top left corner of the legend, in pixels
+    scale : Number
+        The resolution multiplier of the image
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    from PIL import ImageDraw
+    
+    draw = ImageDraw.Draw(image)
+    line_height = round(LEGEND_LINE_HEIGHT * scale)
+    square = round(PLOTLY_FONT_SIZE * scale)
+    for name, color in entries:
+        draw.rectangle([x, y + (line_height - square) // 2, x + square, y + (line_height + square) // 2], fill=color)
+        draw_text(image, (x + 2 * square, y + line_height // 2), name, PLOTLY_FONT_COLOR, PLOTLY_FONT_SIZE * scale, "lm")
+        y += line_height
+    
+    return
+
+def tick_step(maximum):
+    
+    """
+    Picks the step between the ticks of the value axis of a stacked bar graph the way
+    plotly does, 1, 2 or 5 times a power of ten, for at most six ticks above zero
+    """
+    
+    step = 1
+    while True:
+        for factor in (1, 2, 5):
+            if maximum <= step * factor * 6:
+                return step * factor
+        step *= 10
+
+def pillow_image(chart, scale):
+    
+    """
+    Draws a chart described by pie_chart_data or stacked_bar_data as an image
+    that looks like the one drawn by plotly_figure: same size, colors, slice text,
+    legend, title and annotations. The shapes and the text are drawn straight
+    onto the pixels with Pillow, there is no figure to lay out.
+
+    Parameters
+    ----------
+    chart : Dictionary
+        The description of the chart
+    scale : Number
+        The resolution multiplier of the image
+
+    Returns
+    -------
+    image : PIL.Image.Image
+        The corresponding chart
+
+    """
+    
+    from PIL import Image, ImageDraw
+    
+    width, height = round(CHART_WIDTH * scale), round(CHART_HEIGHT * scale)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    
+    # The title sits at the top left like in the plotly template, wrapped instead of cut off
+    title_line_height = round(TITLE_LINE_HEIGHT * height)
+    top = round(TITLE_TOP * height)
+    for line in textwrap.wrap(str(chart["title"]), 70) or [""]:
+        draw_text(image, (round(0.05 * width), top), line, PLOTLY_FONT_COLOR, PLOTLY_TITLE_FONT_SIZE * scale)
+        top += title_line_height
+    
+    if chart["type"] == "pie":
+        # The area and the date go below the title like the plotly annotations
+        for annotation in chart["annotations"]:
+            draw_text(image, (round(0.1 * width), top), annotation, PLOTLY_FONT_COLOR, PLOTLY_TITLE_FONT_SIZE * scale)
+            top += title_line_height
+        
+        # The pie fills the space left under the annotations, on the left of the legend
+        top += round(0.03 * height)
+        bottom = round(0.95 * height)
+        radius = min(round(0.3 * width), (bottom - top) // 2)
+        center_x, center_y = round(0.4 * width), (top + bottom) // 2
+        box = [center_x - radius, center_y - radius, center_x + radius, center_y + radius]
+        
+        # plotly orders the slices from the largest one, clockwise from the top
+        slices = sorted(zip(chart["values"], chart["labels"], chart["colors"]), key=lambda slice: -slice[0])
+        total = sum(int(value) for value, label, color in slices)
+        textinfo = chart["textinfo"].split("+")
+        line_width = max(0, round(chart["line width"] * scale))
+        
+        # Pillow counts the angles clockwise from three o'clock
+        angle = -90
+        starting_angles = []
+        slice_texts = []
+        for value, label, color in slices:
+            value = int(value)
+            if not value:
+                continue
+            sweep = 360 * value / total
+            draw.pieslice(box, angle, angle + sweep, fill=color)
+            starting_angles.append(angle)
             
-            go_bars.append( go.Bar( name=options[option]["Label"], x=dates, y=counts, marker_color=options[option]["Hex"] ) )
+            lines = []
+            if "label" in textinfo:
+                lines.append(str(label))
+            if "value" in textinfo:
+                lines.append(str(value))
+            if "percent" in textinfo:
+                lines.append(format_percent(value / total))
+            middle = math.radians(angle + sweep / 2)
+            slice_texts.append(((center_x + 0.65 * radius * math.cos(middle), center_y + 0.65 * radius * math.sin(middle)),
+                                "\n".join(lines), text_color(color)))
+            angle += sweep
+        
+        # The lines between the slices and around the pie, drawn after the slices since
+        # Pillow takes several times longer to draw a slice along with its outline
+        if line_width:
+            if len(slice_texts) > 1:
+                for angle in starting_angles:
+                    draw.line([center_x, center_y, center_x + radius * math.cos(math.radians(angle)),
+                               center_y + radius * math.sin(math.radians(angle))], fill=chart["line color"], width=line_width)
+            draw.ellipse(box, outline=chart["line color"], width=line_width)
+        
+        # The text goes on top of all the slices, so that no slice covers the text of the one before
+        for position, text, color in slice_texts:
+            draw_text(image, position, text, color, chart["font size"] * scale, "mm")
+        
+        draw_legend(image, [(label, color) for value, label, color in slices],
+                    round(LEGEND_LEFT * width), round(0.2 * height), scale)
+    else:
+        left, right = round(0.1 * width), round(0.75 * width)
+        top += round(0.05 * height)
+        bottom = round(0.9 * height)
+        draw.rectangle([left, top, right, bottom], fill=PLOTLY_PLOT_BACKGROUND)
+        
+        # Like on the plotly category axis, the bars of repeated surveys end up in the same place
+        categories = list(dict.fromkeys(str(category) for category in chart["categories"]))
+        stacks = []
+        for series in chart["series"]:
+            heights = [0] * len(categories)
+            for category, value in zip(chart["categories"], series["values"]):
+                heights[categories.index(str(category))] += int(value)
+            stacks.append(heights)
+        maximum = max([sum(column) for column in zip(*stacks)] + [1])
+        
+        # The grid lines and their values, the axis reaches the first tick above the tallest bar
+        step = tick_step(maximum)
+        pixels_per_value = (bottom - top) / (step * math.ceil(maximum / step))
+        for tick in range(0, step * math.ceil(maximum / step) + 1, step):
+            y = round(bottom - tick * pixels_per_value)
+            draw.line([left, y, right, y], fill="white", width=max(1, round(scale)))
+            draw_text(image, (left - round(5 * scale), y), tick, PLOTLY_FONT_COLOR, PLOTLY_FONT_SIZE * scale, "rm")
+        
+        slot = (right - left) / max(len(categories), 1)
+        for position, category in enumerate(categories):
+            middle = left + slot * (position + 0.5)
+            draw_text(image, (middle, bottom + round(5 * scale)), category, PLOTLY_FONT_COLOR, PLOTLY_FONT_SIZE * scale, "mt")
+            base = 0
+            for series, heights in zip(chart["series"], stacks):
+                if heights[position]:
+                    draw.rectangle([round(middle - 0.4 * slot), round(bottom - (base + heights[position]) * pixels_per_value),
+                                    round(middle + 0.4 * slot), round(bottom - base * pixels_per_value)], fill=series["color"])
+                base += heights[position]
+        
+        # The legend of plotly lists the stacked bars from the top one down
+        draw_legend(image, [(series["name"], series["color"]) for series in chart["series"]][::-1],
+                    round(LEGEND_LEFT * width), round(0.18 * height), scale)
+    
+    return image
+
+def png_chunk(kind, data):
+    
+    """
+    Wraps data into a chunk of a .png file: length, kind, data and checksum
+    """
+    
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def encode_png(image):
+    
+    """
+    Encodes an RGB image as a .png file. Pillow tries several filters on every row
+    of the image before compressing it, which takes longer than drawing the chart,
+    while the flat colors of a chart compress as well without any filter
+
+    Parameters
+    ----------
+    image : PIL.Image.Image
+        The image, in RGB mode
+
+    Returns
+    -------
+    png : bytes
+        The contents of the .png file
+
+    """
+    
+    width, height = image.size
+    pixels = memoryview(image.tobytes())
+    row_size = 3 * width
+    # Each row starts with the number of its filter, 0 being no filter
+    rows = bytearray(len(pixels) + height)
+    for row in range(height):
+        rows[row * (row_size + 1) + 1:(row + 1) * (row_size + 1)] = pixels[row * row_size:(row + 1) * row_size]
+    
+    return (PNG_SIGNATURE
+            + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + png_chunk(b"IDAT", zlib.compress(rows, PNG_COMPRESS_LEVEL))
+            + png_chunk(b"IEND", b""))
+
+def draw_pie(question, values, config, date, area, textinfo):
+    
+    """
+    Draws a pie chart, see pie_chart_data for the parameters
+
+    Returns
+    -------
+    fig : plotly.graph_objects.Figure
+        The corresponding pie chart
+
+    """
+    
+    return plotly_figure(pie_chart_data(question, values, config, date, area, textinfo))
+
+def draw_stacked_bar(question, values, config, dates):
+    
+    """
+    Draws a stacked bar graph for better comparison between different survey results,
+    see stacked_bar_data for the parameters
+
+    Returns
+    -------
+    fig : plotly.graph_objects.Figure
+        The corresponding bar chart
+
+    """
+    
+    return plotly_figure(stacked_bar_data(question, values, config, dates))
+
+def render_cache_key(chart, scale, chart_backend):
+    
+    """
+    Computes the content address of a rendered chart. The key is the hash of the
+    complete chart description (values, labels, colors, styles, textinfo, titles
+    and annotations) together with the resolution multiplier and the renderer,
+    so two charts share a key only if their images are identical.
+
+    Parameters
+    ----------
+    chart : Dictionary
+        The chart that is to be rendered, see pie_chart_data and stacked_bar_data
+    scale : int
+        The resolution multiplier of the image
+    chart_backend : String
+        The renderer of the image, one of CHART_RENDERERS
+
+    Returns
+    -------
+    key : String
+        Hexadecimal SHA-256 digest identifying the rendered image
+
+    """
+    
+    # default=str covers the numpy integers of the answer counts
+    payload = (json.dumps(chart, sort_keys=True, default=str)
+               + "|scale=" + str(scale) + "|backend=" + chart_backend)
+    
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def evict_render_cache(cache_dir, maximum_size):
+    
+    """
+    Removes the least recently used images from the render cache until the
+    total size of the cache is below maximum_size. The modification time of
+    each image is used as its last access time, see export_charts.
+
+    Parameters
+    ----------
+    cache_dir : pathlib.Path object
+        The directory that holds the cached images
+    maximum_size : int
+        The size cap of the cache in bytes
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    entries = []
+    total_size = 0
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".png"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+    
+    if total_size <= maximum_size:
+        return
+    
+    # Oldest access first
+    entries.sort()
+    for mtime, size, path in entries:
+        if total_size <= maximum_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Another process got to it first
+            pass
+        total_size -= size
+    
+    return
+
+def start_chart_renderer(chart_backend="Plotly"):
+    
+    """
+    Starts the long-lived headless renderer used for the static image export,
+    so that the browser process is launched once and shared by every batch
+    instead of once per export call.
+    
+    Only Kaleido v1 and later can keep a renderer running between calls, with
+    older versions the renderer is started lazily by plotly on the first export.
+
+    Parameters
+    ----------
+    chart_backend : String, optional
+        The Chart Backend in the config file, the headless renderer is only
+        needed by Plotly. The default is "Plotly".
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    if chart_backend != "Plotly":
+        return
+    
+    try:
+        import kaleido
+        kaleido.start_sync_server(silence_warnings=True)
+    except (ImportError, AttributeError):
+        pass
+    except RuntimeError:
+        # The renderer is already running
+        pass
+    
+    return
+
+def queue_chart(export_queue, chart, path, scale, target=None):
+    
+    """
+    Puts a chart into the export queue, the chart is only drawn and rendered
+    when export_charts is called on the queue.
+
+    Parameters
+    ----------
+    export_queue : List
+        The list of charts waiting to be exported
+    chart : Dictionary
+        The chart that is to be exported, see pie_chart_data and stacked_bar_data
+    path : pathlib.Path object
+        Where the .png image is saved when the images are saved, see export_charts
+    scale : int
+        The resolution multiplier of the image
+    target : Object, optional
+        Anything the caller needs to place the image once it is exported,
+        i.e. the docx run the picture goes into. The default is None.
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    export_queue.append({ "chart" : chart,
+                          "path" : path,
+                          "scale" : scale,
+                          "target" : target })
+    
+    return
+
+def render_figures(figures, scales):
+    
+    """
+    Renders the figures as .png images. plotly can only export a whole batch in a
+    single call to the renderer through plotly.io.write_images, which writes files,
+    so the batch is written into a temporary directory and read back from there.
+    Falls back to one to_image call per figure for the engines that can't export
+    in batches (orca, Kaleido before v1).
+
+    Parameters
+    ----------
+    figures : List
+        The plotly.graph_objects.Figure objects to be rendered
+    scales : List
+        The resolution multipliers of the images, in the same order as figures
+
+    Returns
+    -------
+    images : List
+        The contents of the .png images, in the same order as figures
+
+    """
+    
+    import plotly.io as pio
+    
+    if hasattr(pio, "write_images"):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [Path(directory) / (str(i) + ".png") for i in range(len(figures))]
+            pio.write_images(figures, [str(path) for path in paths], format="png", scale=scales)
+            return [path.read_bytes() for path in paths]
+    
+    images = []
+    for figure, scale in zip(figures, scales):
+        images.append(figure.to_image(format="png", scale=scale))
+    
+    return images
+
+def render_plotly_charts(charts, scales):
+    
+    """
+    Renders the charts with plotly, see render_figures
+
+    Parameters
+    ----------
+    charts : List
+        The charts to be rendered, see pie_chart_data and stacked_bar_data
+    scales : List
+        The resolution multipliers of the images, in the same order as charts
+
+    Returns
+    -------
+    images : List
+        The contents of the .png images, in the same order as charts
+
+    """
+    
+    return render_figures([plotly_figure(chart) for chart in charts], scales)
+
+def render_pillow_charts(charts, scales):
+    
+    """
+    Renders the charts in process with Pillow, which needs no external renderer,
+    see pillow_image and render_plotly_charts
+
+    """
+    
+    images = []
+    for chart, scale in zip(charts, scales):
+        images.append(encode_png(pillow_image(chart, scale)))
+    
+    return images
+
+# The backends that render the charts as .png images, each one being a function
+# (charts, scales) that returns the contents of the images. The key is the
+# Chart Backend in the config file, and the package the backend needs
+CHART_RENDERERS = { "Plotly" : (render_plotly_charts, "plotly"),
+                    "Pillow" : (render_pillow_charts, "PIL") }
+
+def check_chart_backend(chart_backend):
+    
+    """
+    Makes sure that the Chart Backend in the config file exists and that the
+    package it needs is installed, exits otherwise.
+
+    Parameters
+    ----------
+    chart_backend : String
+        The Chart Backend in the config file
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    if chart_backend == NATIVE_CHART_BACKEND:
+        return
+    
+    if chart_backend not in CHART_RENDERERS:
+        print("\nError: The Chart Backend " + str(chart_backend) + " in the config file is not one of "
+              + ", ".join(list(CHART_RENDERERS) + [NATIVE_CHART_BACKEND]) + ", exiting...")
+        sys.exit(1)
+    
+    package = CHART_RENDERERS[chart_backend][1]
+    if find_spec(package) is None:
+        print("\nError: The Chart Backend " + chart_backend + " needs the " + package + " package, exiting...")
+        sys.exit(1)
+    
+    return
+
+def write_image(path, image):
+    
+    """
+    Writes an image to disk under a temporary name and renames it,
+    this way a half written image never shows up under its name
+
+    Parameters
+    ----------
+    path : pathlib.Path object
+        Where the image goes
+    image : bytes
+        The contents of the image
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    temporary_path = path.with_name(path.name + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp")
+    temporary_path.write_bytes(image)
+    os.replace(temporary_path, path)
+    
+    return
+
+def start_image_writer():
+    
+    """
+    Starts the background thread that writes the rendered images to disk, so that
+    saving the images to <data root>/Visuals never holds up the documents.
+    Images are handed to the writer with write_image_later.
+
+    Returns
+    -------
+    image_writer : Dictionary
+        { "queue" : the images waiting to be written, "thread" : the writer thread }
+
+    """
+    
+    write_queue = queue.Queue()
+    
+    def write():
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            path, image = item
+            try:
+                write_image(path, image)
+            except OSError as e:
+                # The images are only a side output, the documents don't depend on them
+                print("\nWarning: Couldn't save the chart " + str(path) + ": " + str(e))
+    
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    
+    return { "queue" : write_queue, "thread" : thread }
+
+def write_image_later(image_writer, path, image):
+    
+    """
+    Hands an image to the writer started by start_image_writer
+
+    Parameters
+    ----------
+    image_writer : Dictionary
+        The writer
+    path : pathlib.Path object
+        Where the image goes
+    image : bytes
+        The contents of the image
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    image_writer["queue"].put((path, image))
+    
+    return
+
+def stop_image_writer(image_writer):
+    
+    """
+    Waits until the writer started by start_image_writer has written
+    every image it was given, then stops it
+
+    Parameters
+    ----------
+    image_writer : Dictionary
+        The writer
+
+    Returns
+    -------
+    None.
+
+    """
+    
+    image_writer["queue"].put(None)
+    image_writer["thread"].join()
+    
+    return
+
+def export_charts(export_queue, cache_dir=None, maximum_size=None, batch_size=CHART_EXPORT_BATCH_SIZE, chart_backend="Plotly",
+                  image_writer=None):
+    
+    """
+    Renders every chart in the queue as a .png image in memory, in batches of
+    batch_size charts per call to the renderer, and empties the queue.
+    
+    If cache_dir is given the charts go through the content addressed render cache:
+    a chart that was rendered before, in this run or in a previous one, is read
+    from the cache instead of being rendered, identical charts within the queue
+    are rendered only once, and the least recently used images are evicted
+    once the cache grows past maximum_size.
+    
+    If image_writer is given, every image is also saved to the path of its entry
+    in the background, see start_image_writer.
+
+    Parameters
+    ----------
+    export_queue : List
+        The list of charts filled by queue_chart
+    cache_dir : pathlib.Path object, optional
+        The directory that holds the cached images. The default is None,
+        in which case the cache isn't used.
+    maximum_size : int, optional
+        The size cap of the cache in bytes. The default is None.
+    batch_size : int, optional
+        The number of charts rendered per call to the renderer.
+    chart_backend : String, optional
+        The renderer, one of CHART_RENDERERS. The default is "Plotly".
+    image_writer : Dictionary, optional
+        The writer that saves the images to their paths. The default is None,
+        in which case the images are only kept in memory.
+
+    Returns
+    -------
+    exported : List
+        The entries of the queue in their original order, each entry is a dictionary
+        with the keys "chart", "path", "scale", "target" and "image", the contents
+        of the rendered image
+
+    """
+    
+    render_charts = CHART_RENDERERS[chart_backend][0]
+    
+    exported = list(export_queue)
+    export_queue.clear()
+    
+    # Entries that need to be rendered, and their keys
+    to_render = []
+    render_keys = []
+    # The keys of all of the entries, identical charts share their image
+    keys = []
+    images = {}
+    
+    if cache_dir is None:
+        to_render = exported
+        keys = render_keys = list(range(len(exported)))
+    else:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        for entry in exported:
+            key = render_cache_key(entry["chart"], entry["scale"], chart_backend)
+            keys.append(key)
             
-    fig = go.Figure(data=go_bars)
-    # Change the bar mode
-    fig.update_layout(title=question, barmode='stack')
+            if key in images:
+                continue
+            cached_image = cache_dir / (key + ".png")
+            try:
+                images[key] = cached_image.read_bytes()
+                # Touch the image to mark it as recently used
+                os.utime(cached_image)
+            except FileNotFoundError:
+                images[key] = None
+                to_render.append(entry)
+                render_keys.append(key)
     
-    return fig
+    rendered = []
+    for i in range(0, len(to_render), batch_size):
+        with stage("render charts"):
+            rendered.extend(render_charts([entry["chart"] for entry in to_render[i:i+batch_size]],
+                                          [entry["scale"] for entry in to_render[i:i+batch_size]]))
+    
+    for key, image in zip(render_keys, rendered):
+        images[key] = image
+        if cache_dir is not None:
+            write_image(cache_dir / (key + ".png"), image)
+    
+    # The images that were just added are the most recently used ones, so they
+    # are only evicted if they alone exceed the cap
+    if cache_dir is not None and to_render:
+        evict_render_cache(cache_dir, maximum_size)
+    
+    for entry, key in zip(exported, keys):
+        entry["image"] = images[key]
+        if image_writer is not None:
+            write_image_later(image_writer, entry["path"], entry["image"])
+    
+    return exported